@@ -1,52 +1,154 @@
 import requests
 import json
+import os
+import threading
+import time
 from typing import List, Dict
+from .tracing import tracer
+from .usage import usage_from_response
+from . import deadline
+
+# Connect timeout, and the longest wait for a response or the next streamed chunk
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300
+STREAM_READ_BYTES = 64
+
+class RequestCancelled(Exception):
+    pass
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session shared by every agent"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
 
 class BaseAgent:
-    def __init__(self, api_key: str, model: str):
+    role = 'report'
+
+    def __init__(self, api_key: str, model: str, router=None):
         self.api_key = api_key
         self.model = model
-        self.url = "https://openrouter.ai/api/v1/chat/completions"
+        self.router = router
+        # Streamed answers are printed as they arrive unless a caller running several queries turns it off
+        self.echo = True
+        self.url = os.environ.get('OPENROUTER_API_URL', "https://openrouter.ai/api/v1/chat/completions")
+
+    def _request(self, messages: list, stream: bool, model: str, max_tokens: int = None,
+                 cancel_event: threading.Event = None, echo: bool = False) -> str:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": stream,
+            # Ask OpenRouter for token counts and cost (sent in the last chunk when streaming)
+            "usage": {"include": True}
+        }
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+
+        with tracer.span('llm', model=model, role=self.role, stream=stream) as span:
+            return self._traced_request(payload, stream, model, cancel_event, echo, span)
+
+    def _traced_request(self, payload: Dict, stream: bool, model: str, cancel_event: threading.Event,
+                        echo: bool, span) -> str:
+        start = time.time()
+        deadline.check('LLM call')
+        response = get_session().post(
+            url=self.url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            json=payload,
+            stream=stream,
+            timeout=(deadline.timeout(CONNECT_TIMEOUT), deadline.timeout(READ_TIMEOUT))
+        )
 
-    def _call_api(self, messages: list, stream: bool = True, max_tokens: int = 4000) -> str:
         try:
-            response = requests.post(
-                url="https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "max_tokens": max_tokens,
-                    "stream": stream
-                },
-                stream=stream
-            )
-            
-            if stream:
-                full_response = ""
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            json_response = json.loads(line.decode('utf-8').split('data: ')[1])
-                            if 'choices' in json_response:
-                                content = json_response['choices'][0].get('delta', {}).get('content', '')
-                                if content:
-                                    print(content, end='', flush=True)
-                                    full_response += content
-                        except:
-                            continue
-                print()  # Add newline after streaming
-                return full_response
-            else:
+            span.set(status=response.status_code)
+            if response.status_code >= 400:
+                tracer.metrics.inc('llm_http_errors_total', model=model, status=response.status_code)
+                raise RuntimeError(f"API Error: HTTP {response.status_code} {response.text[:200]}")
+
+            if not stream:
                 data = response.json()
+                self._record_usage(data, model, span)
                 if 'choices' in data and len(data['choices']) > 0:
                     return data['choices'][0]['message']['content']
-                else:
-                    print("\nError: Invalid API response format")
-                    return "Error: Invalid API response"
+                if 'error' in data:
+                    raise RuntimeError(f"API Error: {data['error']['message']}")
+                raise RuntimeError("Invalid API response format")
+
+            full_response = ""
+            first_token = None
+            # Small reads hand over each event as it arrives instead of after a 512-byte buffer fills,
+            # so cancellation and deadlines act promptly
+            for line in response.iter_lines(chunk_size=STREAM_READ_BYTES):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled(model)
+                # The read timeout bounds each chunk, a slow trickle is only stopped here
+                if deadline.expired():
+                    raise deadline.DeadlineExceeded(f"Deadline passed while streaming from {model}")
+                if not line:
+                    continue
+                line = line.decode('utf-8')
+                if not line.startswith('data: ') or line == 'data: [DONE]':
+                    continue
+                try:
+                    data = json.loads(line[6:])
+                except json.JSONDecodeError:
+                    continue
+                if 'error' in data:
+                    raise RuntimeError(f"API Error: {data['error'].get('message', data['error'])}")
+                self._record_usage(data, model, span)
+                if 'choices' in data:
+                    content = data['choices'][0].get('delta', {}).get('content', '')
+                    if content:
+                        if first_token is None:
+                            first_token = time.time()
+                            tracer.metrics.observe('llm_ttft_seconds', first_token - start, model=model)
+                        if echo:
+                            print(content, end='', flush=True)
+                        full_response += content
+            if echo:
+                print()  # Add newline after streaming
+            if first_token is not None:
+                tracer.metrics.observe('llm_generation_seconds', time.time() - first_token, model=model)
+            tracer.metrics.inc('llm_response_chars_total', len(full_response), model=model)
+            return full_response
+        finally:
+            response.close()
+
+    def _record_usage(self, data: Dict, model: str, span):
+        usage = data.get('usage') if isinstance(data, dict) else None
+        if not usage:
+            return
+        record = usage_from_response(usage, model, self.router.pricing if self.router else None)
+        span.set(**record)
+        for kind in ('prompt', 'completion', 'cached'):
+            tracer.metrics.inc('llm_tokens_total', record[f'{kind}_tokens'], model=model, type=kind)
+        tracer.metrics.inc('llm_cost_dollars_total', record['cost'], model=model)
+        # Run, stage and URL come from the span this call was made under
+        tracer.emit('usage', run_id=span.attributes.get('run_id'), stage=span.parent_name or self.role,
+                    url=span.attributes.get('url'), urls=span.attributes.get('urls'), **record)
+
+    def _dispatch(self, messages: list, stream: bool, max_tokens: int = None, echo: bool = False) -> str:
+        if self.router is None:
+            return self._request(messages, stream, self.model, max_tokens, echo=echo)
+        # Hedged calls get a cancel event and must not interleave their output
+        return self.router.call(self.role, lambda model, cancel_event: self._request(
+            messages, stream, model, max_tokens, cancel_event, echo=echo and cancel_event is None))
+
+    def _call_api(self, messages: list, stream: bool = True, max_tokens: int = 4000) -> str:
+        try:
+            return self._dispatch(messages, stream, max_tokens, echo=self.echo)
         except Exception as e:
             print(f"\nAPI call error: {str(e)}")
             return f"Error in API call: {str(e)}"
@@ -0,0 +1,126 @@
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional, falls back to sparse dot products in pure Python
+    np = None
+
+# Lines that carry no claim of their own
+NON_CLAIMS = re.compile(r'^(no relevant information|no content available|no information available|error)', re.IGNORECASE)
+
+# Words that flip or shift what a claim says however similar the rest of it reads; two claims only
+# merge when they agree on these, on negation and on every number and month they mention
+NEGATIONS = {'not', 'no', 'never', 'none', 'nor', 'neither', 'without', 'cannot', 'denied', 'denies', 'failed'}
+MONTHS = {'january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+          'november', 'december', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'}
+POLAR_TERMS = {
+    'won': 'win', 'win': 'win', 'wins': 'win', 'winning': 'win', 'winner': 'win', 'victory': 'win',
+    'lost': 'lose', 'lose': 'lose', 'loses': 'lose', 'losing': 'lose', 'loser': 'lose', 'loss': 'lose',
+    'draw': 'draw', 'drew': 'draw', 'tie': 'draw', 'tied': 'draw',
+    'rose': 'up', 'risen': 'up', 'rise': 'up', 'rises': 'up', 'increase': 'up', 'increased': 'up',
+    'increases': 'up', 'gain': 'up', 'gained': 'up', 'grew': 'up', 'growth': 'up', 'up': 'up', 'higher': 'up',
+    'fell': 'down', 'fall': 'down', 'falls': 'down', 'fallen': 'down', 'decrease': 'down', 'decreased': 'down',
+    'decreases': 'down', 'declined': 'down', 'decline': 'down', 'dropped': 'down', 'down': 'down', 'lower': 'down',
+    'before': 'before', 'after': 'after', 'first': 'first', 'last': 'last', 'latest': 'last', 'next': 'next'
+}
+
+def normalize_claim(text: str) -> str:
+    text = re.sub(r'^[\s\-*•\d.)#]+', '', text)
+    text = re.sub(r'\*\*|__|`', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def split_claims(summary: str, min_chars: int = 15) -> List[str]:
+    """Break a bullet-point summary into individual claim sentences"""
+    claims = []
+    for line in summary.splitlines():
+        if line.strip().startswith('###'):
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+(?=[A-Z0-9"])', line):
+            claim = normalize_claim(sentence)
+            if len(claim) >= min_chars and not NON_CLAIMS.match(claim):
+                claims.append(claim)
+    return claims
+
+def claim_signature(claim: str) -> Tuple:
+    """What two claims must agree on to merge: negation, numbers (dates, scores, amounts), months and polar terms"""
+    text = claim.lower()
+    negated = bool(re.search(r"n't\b", text))
+    words = re.findall(r'[a-z]+', text)
+    numbers = frozenset(number.replace(',', '') for number in re.findall(r'\d[\d,]*(?:\.\d+)?', text))
+    negated = negated or any(word in NEGATIONS for word in words)
+    return (negated, numbers, frozenset(word for word in words if word in MONTHS),
+            frozenset(POLAR_TERMS[word] for word in words if word in POLAR_TERMS))
+
+class ClaimClusterer:
+    """Groups near-identical claims from many sources by character n-gram cosine similarity.
+
+    Each claim is a hashed vector of character n-grams; the pairwise similarity
+    matrix is one matrix product (numpy when installed). Clusters are grown
+    greedily from the earliest unassigned claim, so better-ranked sources lead.
+    Similar wording alone never merges claims that disagree (see claim_signature)."""
+
+    def __init__(self, threshold: float = 0.75, ngram: int = 3, dimensions: int = 1 << 12):
+        self.threshold = threshold
+        self.ngram = ngram
+        self.dimensions = dimensions
+
+    def vector(self, claim: str) -> Dict[int, float]:
+        text = f" {re.sub(r'[^a-z0-9 ]', '', claim.lower())} "
+        counts = {}
+        for i in range(max(1, len(text) - self.ngram + 1)):
+            bucket = zlib.crc32(text[i:i + self.ngram].encode()) % self.dimensions
+            counts[bucket] = counts.get(bucket, 0) + 1
+        norm = sum(value * value for value in counts.values()) ** 0.5 or 1.0
+        return {bucket: value / norm for bucket, value in counts.items()}
+
+    def similarities(self, vectors: List[Dict[int, float]]):
+        if np is not None:
+            matrix = np.zeros((len(vectors), self.dimensions), dtype=np.float32)
+            for row, vector in enumerate(vectors):
+                matrix[row, list(vector)] = list(vector.values())
+            return matrix @ matrix.T
+        similarities = [[0.0] * len(vectors) for _ in vectors]
+        for i, first in enumerate(vectors):
+            for j in range(i, len(vectors)):
+                second = vectors[j]
+                small, large = (first, second) if len(first) <= len(second) else (second, first)
+                similarities[i][j] = similarities[j][i] = sum(
+                    value * large.get(bucket, 0.0) for bucket, value in small.items())
+        return similarities
+
+    def cluster(self, sources: List[Tuple[int, str]]) -> List[Dict]:
+        """Turn [(source_id, summary), ...] into canonical claims with support counts and source ids"""
+        claims = []
+        seen = set()
+        for source_id, summary in sources:
+            for claim in split_claims(summary or ''):
+                key = (source_id, claim.lower())
+                if key not in seen:
+                    seen.add(key)
+                    claims.append((source_id, claim))
+        if not claims:
+            return []
+
+        similarities = self.similarities([self.vector(claim) for _, claim in claims])
+        signatures = [claim_signature(claim) for _, claim in claims]
+        assigned = [False] * len(claims)
+        clusters = []
+        for i in range(len(claims)):
+            if assigned[i]:
+                continue
+            members = [j for j in range(i, len(claims)) if not assigned[j] and similarities[i][j] >= self.threshold
+                       and signatures[j] == signatures[i]]
+            for j in members:
+                assigned[j] = True
+            # The member closest to all the others reads as the canonical wording
+            canonical = max(members, key=lambda j: (sum(float(similarities[j][k]) for k in members), -j))
+            source_ids = sorted({claims[j][0] for j in members})
+            clusters.append({
+                'claim': claims[canonical][1],
+                'support': len(source_ids),
+                'source_ids': source_ids
+            })
+        # Corroborated claims first, ties keep source order
+        return sorted(clusters, key=lambda cluster: -cluster['support'])
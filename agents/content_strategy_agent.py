@@ -2,8 +2,10 @@ from datetime import datetime
 from .base_agent import BaseAgent
 
 class ContentStrategyAgent(BaseAgent):
-    def __init__(self, api_key: str, model: str):
-        super().__init__(api_key, model)
+    role = 'strategy'
+
+    def __init__(self, api_key: str, model: str, router=None):
+        super().__init__(api_key, model, router)
 
     def create_content_strategy(self, query: str) -> str:
         messages = [{
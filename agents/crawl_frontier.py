@@ -0,0 +1,132 @@
+import hashlib
+import heapq
+import itertools
+import math
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+from urllib.parse import urlparse
+from .url_canonical import canonical_key
+
+SKIP_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.zip', '.mp3', '.mp4', '.css', '.js',
+                   '.xml', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx')
+
+class BloomFilter:
+    """Fixed-size set membership with no false negatives, so memory stays constant however much is seen"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> bool:
+        """Add item; False if it was (probably) already present"""
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(item))
+
+class CrawlFrontier:
+    """Best-first queue of outbound links for expanding a thin SERP.
+
+    Links are scored by how many question terms their anchor text shares,
+    weighted by domain policy (denied domains and file links are dropped,
+    boosted domains score higher, each domain is capped). Depth, page and
+    time budgets decide when expansion stops."""
+
+    def __init__(self, question_terms: Set[str], max_depth: int = 1, max_pages: int = 10, time_budget: float = 60.0,
+                 per_domain: int = 3, deny: Iterable[str] = (), boost: Dict[str, float] = None,
+                 max_queued: int = 1000, min_score: float = 0.1):
+        self.question_terms = set(question_terms)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.deadline = time.time() + time_budget
+        self.per_domain = per_domain
+        self.deny = tuple(domain.lower() for domain in deny)
+        self.boost = {domain.lower(): weight for domain, weight in (boost or {}).items()}
+        self.max_queued = max_queued
+        self.min_score = min_score
+        self.seen = BloomFilter()
+        self.heap = []
+        self.order = itertools.count()
+        self.domain_counts = {}
+        self.taken = 0
+        self.lock = threading.Lock()
+
+    def _domain(self, url: str) -> str:
+        # Mobile and www hosts count against the same domain as the site itself
+        return canonical_key(url).split('/', 1)[0]
+
+    def _matches(self, domain: str, patterns) -> bool:
+        return any(domain == pattern or domain.endswith('.' + pattern) for pattern in patterns)
+
+    def score(self, url: str, anchor: str) -> float:
+        parsed = urlparse(url)
+        domain = self._domain(url)
+        if parsed.scheme not in ('http', 'https') or parsed.path.lower().endswith(SKIP_EXTENSIONS):
+            return 0.0
+        if self._matches(domain, self.deny):
+            return 0.0
+        # Anchor words count fully, words in the URL path count half
+        anchor_terms = {term for term in re.findall(r'[a-z0-9]+', anchor.lower()) if len(term) > 2}
+        path_terms = {term for term in re.findall(r'[a-z0-9]+', parsed.path.lower()) if len(term) > 2}
+        if not self.question_terms:
+            return 0.0
+        overlap = len(anchor_terms & self.question_terms) + 0.5 * len((path_terms - anchor_terms) & self.question_terms)
+        relevance = overlap / math.sqrt(len(self.question_terms))
+        weight = next((weight for pattern, weight in self.boost.items() if self._matches(domain, (pattern,))), 1.0)
+        return relevance * weight
+
+    def add_seen(self, urls: Iterable[str]):
+        """Mark URLs (e.g. the SERP results) as already handled"""
+        with self.lock:
+            for url in urls:
+                self.seen.add(canonical_key(url))
+                domain = self._domain(url)
+                self.domain_counts[domain] = self.domain_counts.get(domain, 0) + 1
+
+    def offer(self, links: List[Tuple[str, str]], depth: int) -> int:
+        """Queue (url, anchor_text) links found on a page at the given depth; returns how many were queued"""
+        if depth + 1 > self.max_depth:
+            return 0
+        queued = 0
+        with self.lock:
+            # Links are fetched as found, the canonical key only spots variants of a page already seen
+            for url, anchor in links or []:
+                score = self.score(url, anchor or '')
+                if score < self.min_score or not self.seen.add(canonical_key(url)):
+                    continue
+                heapq.heappush(self.heap, (-score, next(self.order), url, depth + 1))
+                queued += 1
+            if len(self.heap) > 2 * self.max_queued:
+                # Keep only the best candidates so the queue stays bounded
+                self.heap = heapq.nsmallest(self.max_queued, self.heap)
+        return queued
+
+    def exhausted(self) -> bool:
+        return self.taken >= self.max_pages or time.time() >= self.deadline
+
+    def next(self):
+        """Pop the best link as (url, depth, score), or None when out of links or budget"""
+        with self.lock:
+            while self.heap and not self.exhausted():
+                negative_score, _, url, depth = heapq.heappop(self.heap)
+                domain = self._domain(url)
+                if self.domain_counts.get(domain, 0) >= self.per_domain:
+                    continue
+                self.domain_counts[domain] = self.domain_counts.get(domain, 0) + 1
+                self.taken += 1
+                return url, depth, -negative_score
+            return None
@@ -0,0 +1,92 @@
+import queue
+import sqlite3
+import threading
+from .tracing import tracer
+
+class DBWriter:
+    """Single background thread that owns every SQLite write connection.
+
+    Writes from many threads (and many run databases) are queued, applied in
+    order and committed in groups, so no caller ever blocks on a commit."""
+
+    def __init__(self, max_batch: int = 200):
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.connections = {}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def execute(self, db_path: str, sql: str, params: tuple = ()):
+        self.queue.put(('execute', db_path, sql, params))
+
+    def execute_all(self, db_path: str, statements: list):
+        """Queue several (sql, params) statements that always land in the same commit"""
+        self.queue.put(('execute_all', db_path, None, statements))
+
+    def flush(self, db_path: str = None):
+        """Block until every write queued so far is committed"""
+        done = threading.Event()
+        self.queue.put(('flush', db_path, None, done))
+        done.wait()
+
+    def close_db(self, db_path: str):
+        done = threading.Event()
+        self.queue.put(('close', db_path, None, done))
+        done.wait()
+
+    def close(self):
+        done = threading.Event()
+        self.queue.put(('stop', None, None, done))
+        done.wait()
+        self.thread.join()
+
+    def _connection(self, db_path: str) -> sqlite3.Connection:
+        if db_path not in self.connections:
+            self.connections[db_path] = sqlite3.connect(db_path)
+        return self.connections[db_path]
+
+    def _commit(self, dirty: set):
+        for db_path in dirty:
+            try:
+                with tracer.span('db_commit', db=db_path):
+                    self.connections[db_path].commit()
+            except Exception as e:
+                print(f"\nDatabase commit error ({db_path}): {str(e)}")
+        dirty.clear()
+
+    def _run(self):
+        dirty = set()
+        while True:
+            items = [self.queue.get()]
+            # Group whatever else is already waiting into the same commit
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for action, db_path, sql, arg in items:
+                if action in ('execute', 'execute_all'):
+                    statements = [(sql, arg)] if action == 'execute' else arg
+                    try:
+                        conn = self._connection(db_path)
+                        for statement, params in statements:
+                            conn.execute(statement, params)
+                        tracer.metrics.inc('db_statements_total', len(statements))
+                        dirty.add(db_path)
+                    except Exception as e:
+                        print(f"\nDatabase write error ({db_path}): {str(e)}")
+                    continue
+
+                self._commit(dirty)
+                if action == 'close' and db_path in self.connections:
+                    self.connections.pop(db_path).close()
+                elif action == 'stop':
+                    for conn in self.connections.values():
+                        conn.close()
+                    self.connections.clear()
+                    arg.set()
+                    return
+                arg.set()
+
+            self._commit(dirty)
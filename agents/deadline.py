@@ -0,0 +1,73 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Deadline of the run being worked on; tracing.submit() carries it into executor threads
+_current_deadline = contextvars.ContextVar('deadline', default=None)
+
+class DeadlineExceeded(Exception):
+    pass
+
+class Deadline:
+    def __init__(self, end: float):
+        self.end = end
+
+    def remaining(self) -> float:
+        return max(0.0, self.end - time.time())
+
+    def expired(self) -> bool:
+        return time.time() >= self.end
+
+def current() -> Deadline:
+    return _current_deadline.get()
+
+def remaining() -> float:
+    """Seconds left before the current deadline, or None when there is none"""
+    deadline = current()
+    return deadline.remaining() if deadline else None
+
+def expired() -> bool:
+    deadline = current()
+    return bool(deadline and deadline.expired())
+
+def check(stage: str = None):
+    if expired():
+        raise DeadlineExceeded(f"Deadline passed before {stage}" if stage else "Deadline passed")
+
+def timeout(cap: float = None) -> float:
+    """Timeout for one blocking call: cap, shortened to whatever is left of the deadline"""
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded("Deadline passed")
+    return left if cap is None else min(cap, left)
+
+@contextmanager
+def run_deadline(seconds: float = None):
+    """Give everything inside (and every task it submits) seconds to finish; None leaves the deadline as it is"""
+    if seconds is None:
+        yield current()
+        return
+    end = time.time() + seconds
+    outer = current()
+    deadline = Deadline(min(end, outer.end) if outer else end)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+@contextmanager
+def reserve(share: float):
+    """End the current deadline early, keeping share of the remaining time for what runs afterwards"""
+    outer = current()
+    if outer is None or not share:
+        yield outer
+        return
+    deadline = Deadline(outer.end - outer.remaining() * share)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List
+from .tracing import tracer, submit
+from .deadline import DeadlineExceeded
+
+ROLES = ('intent', 'strategy', 'extract', 'report')
+
+class ModelStats:
+    """Rolling latency and error window for a single model."""
+
+    def __init__(self, window: int = 50):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+
+    def record_censored(self, elapsed: float):
+        """A call abandoned after elapsed seconds: a lower bound on its latency, but no health outcome"""
+        with self.lock:
+            self.latencies.append(elapsed)
+
+    def percentile(self, pct: float) -> float:
+        with self.lock:
+            values = sorted(self.latencies)
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return values[index]
+
+    def error_rate(self) -> float:
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def samples(self) -> int:
+        with self.lock:
+            return len(self.latencies)
+
+class ModelRouter:
+    """Routes agent calls to models per call role and hedges slow calls onto a backup model."""
+
+    def __init__(self, default_model: str, roles: Dict = None, window: int = 50, min_samples: int = 5,
+                 hedge_factor: float = 1.0, hedge_min_delay: float = 0.5, hedge_default_delay: float = 3.0,
+                 max_error_rate: float = 0.5, max_workers: int = 16, pricing: Dict = None):
+        self.default_model = default_model
+        # Fallback USD per million tokens by model, for responses without a cost
+        self.pricing = pricing or {}
+        self.roles = roles or {}
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge_factor = hedge_factor
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.max_error_rate = max_error_rate
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'ModelRouter':
+        routing = config.get('routing', {})
+        return cls(
+            config['openrouter']['model'],
+            roles=routing.get('roles', {}),
+            window=routing.get('window', 50),
+            min_samples=routing.get('min_samples', 5),
+            hedge_factor=routing.get('hedge_factor', 1.0),
+            hedge_min_delay=routing.get('hedge_min_delay', 0.5),
+            hedge_default_delay=routing.get('hedge_default_delay', 3.0),
+            max_error_rate=routing.get('max_error_rate', 0.5),
+            pricing=config.get('pricing', {})
+        )
+
+    def stats_for(self, model: str) -> ModelStats:
+        with self._stats_lock:
+            if model not in self._stats:
+                self._stats[model] = ModelStats(self.window)
+            return self._stats[model]
+
+    def models_for(self, role: str) -> List[str]:
+        """Configured models for a role, healthiest and fastest first."""
+        models = self.roles.get(role, {}).get('models') or [self.default_model]
+        stats = {model: self.stats_for(model) for model in models}
+        measured = {model for model in models if stats[model].samples() >= self.min_samples}
+        # Measured models trade places by p95; models without enough samples keep their configured slot
+        fastest = iter(sorted((model for model in models if model in measured),
+                              key=lambda model: stats[model].percentile(95)))
+        ordered = [next(fastest) if model in measured else model for model in models]
+        unhealthy = {model for model in models if stats[model].error_rate() >= self.max_error_rate}
+        return sorted(ordered, key=lambda model: model in unhealthy)
+
+    def hedge_delay(self, model: str) -> float:
+        stats = self.stats_for(model)
+        if stats.samples() < self.min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, stats.percentile(95) * self.hedge_factor)
+
+    def call(self, role: str, fn: Callable) -> str:
+        """Run fn(model, cancel_event) on the best model for role.
+
+        cancel_event is None for plain calls; for hedged calls it is set once the
+        other request has won and fn should abandon its response."""
+        models = self.models_for(role)
+        if self.roles.get(role, {}).get('hedge') and len(models) > 1:
+            return self._call_hedged(models[0], models[1], fn)
+
+        last_error = None
+        for attempt, model in enumerate(models):
+            if attempt:
+                tracer.metrics.inc('llm_retries_total', model=model)
+            try:
+                return self._timed(model, fn, None)
+            except DeadlineExceeded:
+                # Out of time for every model, not just this one
+                raise
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    def _timed(self, model: str, fn: Callable, cancel_event: threading.Event) -> str:
+        start = time.monotonic()
+        try:
+            result = fn(model, cancel_event)
+            if not result or not result.strip():
+                raise ValueError(f"Empty response from {model}")
+        except Exception as e:
+            # A cancelled loser (or a call cut short by the run's deadline) says nothing about the model's health
+            if not (cancel_event and cancel_event.is_set()) and not isinstance(e, DeadlineExceeded):
+                self.stats_for(model).record(time.monotonic() - start, False)
+            raise
+        self.stats_for(model).record(time.monotonic() - start, True)
+        return result
+
+    def _call_hedged(self, primary: str, backup: str, fn: Callable) -> str:
+        events = {primary: threading.Event(), backup: threading.Event()}
+        started = {primary: time.monotonic()}
+        futures = {submit(self._executor, self._timed, primary, fn, events[primary]): primary}
+        pending = set(futures)
+        backup_started = False
+        last_error = None
+
+        done, _ = wait(pending, timeout=self.hedge_delay(primary))
+        if not done:
+            # Primary is slower than its p95, race it against the backup
+            tracer.metrics.inc('llm_hedges_total', model=backup)
+            started[backup] = time.monotonic()
+            future = submit(self._executor, self._timed, backup, fn, events[backup])
+            futures[future] = backup
+            pending.add(future)
+            backup_started = True
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                winner = futures[future]
+                for other, model in futures.items():
+                    if model != winner and not other.done():
+                        events[model].set()
+                        other.cancel()
+                        # The loser took at least this long; without a sample an always-slow
+                        # primary would keep its rank and be hedged on every call
+                        self.stats_for(model).record_censored(time.monotonic() - started[model])
+                return result
+
+            if not pending and not backup_started:
+                # Primary failed before the hedge delay, fail over straight away
+                tracer.metrics.inc('llm_retries_total', model=backup)
+                started[backup] = time.monotonic()
+                future = submit(self._executor, self._timed, backup, fn, events[backup])
+                futures[future] = backup
+                pending.add(future)
+                backup_started = True
+
+        raise last_error
+
+    def summary(self) -> Dict:
+        with self._stats_lock:
+            models = list(self._stats.items())
+        return {
+            model: {
+                'calls': len(stats.outcomes),
+                'error_rate': round(stats.error_rate(), 3),
+                'p50': round(stats.percentile(50), 3),
+                'p95': round(stats.percentile(95), 3)
+            }
+            for model, stats in models
+        }
@@ -1,55 +1,12 @@
-import requests
 import json
 import datetime
+from .base_agent import BaseAgent
 
-class OpenRouterAgent:
-    def __init__(self, api_key: str, model: str):
-        self.api_key = api_key
-        self.model = model
-        self.url = "https://openrouter.ai/api/v1/chat/completions"
+class OpenRouterAgent(BaseAgent):
+    role = 'extract'
 
     def _call_api(self, messages: list, stream: bool = False) -> str:
-        response = requests.post(
-            url=self.url,
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": self.model,
-                "messages": messages,
-                "stream": stream
-            },
-            stream=stream
-        )
-        
-        if stream:
-            full_response = ""
-            for chunk in response.iter_lines():
-                if chunk:
-                    try:
-                        chunk_str = chunk.decode('utf-8')
-                        if chunk_str.startswith("data: "):
-                            if chunk_str == "data: [DONE]":
-                                continue
-                            try:
-                                data = json.loads(chunk_str[6:])
-                                if 'choices' in data:
-                                    delta = data['choices'][0]['delta']
-                                    if 'content' in delta:
-                                        full_response += delta['content']
-                            except json.JSONDecodeError:
-                                continue
-                    except Exception as e:
-                        print(f"\nError processing stream: {str(e)}")
-            return full_response
-        else:
-            data = response.json()
-            if 'choices' in data:
-                return data['choices'][0]['message']['content']
-            elif 'error' in data:
-                return f"API Error: {data['error']['message']}"
-            return "No valid response from API"
+        return self._dispatch(messages, stream)
 
     def summarize(self, content: str) -> str:
         return self._call_api([{
@@ -57,6 +14,12 @@ class OpenRouterAgent:
             "content": f"Summarize this content in 3-5 bullet points:\n\n{content[:5000]}"
         }], stream=True)
 
+    def extract(self, prompt: str) -> str:
+        return self._call_api([{
+            "role": "user",
+            "content": prompt
+        }], stream=True)
+
     def generate_report(self, structured_data: list, query: str) -> str:
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do', 'does', 'for',
+    'from', 'how', 'in', 'is', 'it', 'of', 'on', 'or', 's', 'the', 'to', 'was',
+    'what', 'when', 'where', 'which', 'who', 'whom', 'why', 'with'
+}
+
+# Lowest similarity that reuses a stored strategy; paraphrases land around 0.6
+DEFAULT_THRESHOLD = 0.55
+
+# Words that change what a query asks for, grouped with their synonyms. Two queries only match when
+# these (and every number or year) agree, however similar the rest of the wording is.
+KEY_TOKENS = {
+    'last': 'last', 'latest': 'last', 'recent': 'last', 'newest': 'last',
+    'next': 'next', 'upcoming': 'next', 'future': 'next',
+    'previous': 'previous', 'prior': 'previous',
+    'first': 'first', 'earliest': 'first',
+    'not': 'not', 'no': 'not', 'without': 'not', 'never': 'not',
+    'best': 'best', 'top': 'best', 'worst': 'worst',
+    'before': 'before', 'after': 'after'
+}
+
+class QuerySimilarityIndex:
+    """MinHash/LSH index over past queries, used to reuse content strategies and domains."""
+
+    def __init__(self, db_path: str = 'cache/query_index.db', num_perm: int = 64, bands: int = 32,
+                 threshold: float = DEFAULT_THRESHOLD, ttl_seconds: int = 24 * 3600, ngram: int = 3):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.db_path = db_path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.ngram = ngram
+
+        # Fixed seed so signatures stay comparable across processes and runs
+        rng = random.Random(1337)
+        self._prime = (1 << 61) - 1
+        self._perms = [(rng.randrange(1, self._prime), rng.randrange(0, self._prime))
+                       for _ in range(num_perm)]
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._create_db()
+
+    def _create_db(self):
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS indexed_queries
+                     (id INTEGER PRIMARY KEY,
+                      query TEXT,
+                      signature TEXT,
+                      content_strategy TEXT,
+                      domain TEXT,
+                      created_at REAL)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS lsh_buckets
+                     (band INTEGER,
+                      bucket TEXT,
+                      query_id INTEGER)''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_lsh_buckets ON lsh_buckets (band, bucket)")
+        conn.commit()
+        conn.close()
+
+    def normalize(self, query: str) -> List[str]:
+        text = query.lower().replace("'s", " ").replace("’s", " ")
+        tokens = re.findall(r'[a-z0-9]+', text)
+        return [t for t in tokens if t not in STOPWORDS]
+
+    def key_tokens(self, query: str) -> set:
+        """Numbers and meaning-changing words, which must agree for two queries to share a strategy"""
+        return {KEY_TOKENS.get(t, t) for t in self.normalize(query) if t in KEY_TOKENS or any(ch.isdigit() for ch in t)}
+
+    def shingles(self, query: str) -> set:
+        tokens = self.normalize(query)
+        features = {f"w:{t}" for t in tokens}
+        for token in tokens:
+            padded = f" {token} "
+            for i in range(max(1, len(padded) - self.ngram + 1)):
+                features.add(f"c:{padded[i:i + self.ngram]}")
+        return features
+
+    def signature(self, query: str) -> List[int]:
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+                  for s in self.shingles(query)]
+        if not hashes:
+            return [self._prime] * self.num_perm
+        return [min((a * h + b) % self._prime for h in hashes) for a, b in self._perms]
+
+    def _band_keys(self, signature: List[int]) -> List[str]:
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            keys.append(hashlib.blake2b(json.dumps(chunk).encode('utf-8'), digest_size=8).hexdigest())
+        return keys
+
+    def similarity(self, sig_a: List[int], sig_b: List[int]) -> float:
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / self.num_perm
+
+    def lookup(self, query: str) -> Optional[Dict]:
+        """Return the most similar unexpired entry above the threshold, or None."""
+        signature = self.signature(query)
+        key_tokens = self.key_tokens(query)
+        cutoff = time.time() - self.ttl_seconds
+
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        candidate_ids = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            c.execute("SELECT query_id FROM lsh_buckets WHERE band = ? AND bucket = ?", (band, key))
+            candidate_ids.update(row[0] for row in c.fetchall())
+
+        best = None
+        for query_id in candidate_ids:
+            c.execute('''SELECT query, signature, content_strategy, domain, created_at
+                         FROM indexed_queries WHERE id = ? AND created_at >= ?''', (query_id, cutoff))
+            row = c.fetchone()
+            # "last fight" vs "next fight", or 2024 vs 2025, ask for something else however close the wording
+            if not row or self.key_tokens(row[0]) != key_tokens:
+                continue
+            score = self.similarity(signature, json.loads(row[1]))
+            if score >= self.threshold and (best is None or score > best['similarity']):
+                best = {
+                    'query': row[0],
+                    'content_strategy': row[2],
+                    'domain': row[3],
+                    'created_at': row[4],
+                    'similarity': score
+                }
+        conn.close()
+        return best
+
+    def add(self, query: str, content_strategy: str = None, domain: str = None):
+        signature = self.signature(query)
+        # Expired entries are never reused, drop them as new ones come in so the index stays bounded
+        self.purge_expired()
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute('''INSERT INTO indexed_queries (query, signature, content_strategy, domain, created_at)
+                     VALUES (?, ?, ?, ?, ?)''',
+                  (query, json.dumps(signature), content_strategy, domain, time.time()))
+        query_id = c.lastrowid
+        c.executemany("INSERT INTO lsh_buckets (band, bucket, query_id) VALUES (?, ?, ?)",
+                      [(band, key, query_id) for band, key in enumerate(self._band_keys(signature))])
+        conn.commit()
+        conn.close()
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute('''DELETE FROM lsh_buckets WHERE query_id IN
+                     (SELECT id FROM indexed_queries WHERE created_at < ?)''', (cutoff,))
+        c.execute("DELETE FROM indexed_queries WHERE created_at < ?", (cutoff,))
+        conn.commit()
+        conn.close()
@@ -6,19 +6,38 @@ from .content_strategy_agent import ContentStrategyAgent
 from .base_agent import BaseAgent
 from datetime import datetime
 
+def report_database(structured_data: List[Dict], claims: List[Dict] = None) -> str:
+    """The evidence block of the report prompt; with claims, structured_data only lists the sources"""
+    if not claims:
+        return json.dumps(structured_data, indent=2)
+    # Compact JSON with claims as [claim, source_ids] pairs; indentation and repeated keys would cost
+    # more tokens than clustering saves
+    pairs = [[claim['claim'], claim['source_ids']] for claim in claims]
+    return f"""Sources:
+{json.dumps(structured_data, separators=(',', ':'))}
+
+Claims merged across sources, each as [claim, source_ids]; the more source_ids, the better corroborated:
+{json.dumps(pairs, separators=(',', ':'))}"""
+
 class ReportGeneratorAgent(BaseAgent):
-    def __init__(self, api_key: str, model: str):
-        super().__init__(api_key, model)
-        self.planner = ReportPlannerAgent(api_key, model)
-        self.content_strategy_agent = ContentStrategyAgent(api_key, model)
+    role = 'report'
+
+    def __init__(self, api_key: str, model: str, router=None):
+        super().__init__(api_key, model, router)
+        self.planner = ReportPlannerAgent(api_key, model, router)
+        self.content_strategy_agent = ContentStrategyAgent(api_key, model, router)
 
     def _call_api(self, messages: list, stream: bool = True, max_tokens: int = 4000) -> str:
         return super()._call_api(messages, stream=True, max_tokens=max_tokens)
 
-    def generate_report(self, structured_data: List[Dict], query: str, strategy: str, current_time: datetime) -> str:
+    def generate_report(self, structured_data: List[Dict], query: str, strategy: str, current_time: datetime,
+                        claims: List[Dict] = None) -> str:
+        """With claims, structured_data only lists the sources and the facts come from the clustered claims."""
         if not structured_data:
             return "Error: No data available to generate report"
         
+        database = report_database(structured_data, claims)
+        
         try:
             messages = [{
                 "role": "system", 
@@ -41,7 +60,7 @@ CRITICAL RULES:
                 "role": "user",
                 "content": f"""Using ONLY this database content:
 
-{json.dumps(structured_data, indent=2)}
+{database}
 
 Answer ALL of these verification questions:
 
@@ -68,4 +87,35 @@ Sources:
 
         except Exception as e:
             print(f"\nError in report generation: {str(e)}")
-            return f"Error generating report: {str(e)}"
\ No newline at end of file
+            return f"Error generating report: {str(e)}"
+
+    def answer_questions(self, structured_data: List[Dict], questions: Dict[int, str], current_time: datetime) -> str:
+        """Answer a subset of verification questions, one '### Q<n>' section per question."""
+        question_list = "\n".join(f"{number}. {text}" for number, text in sorted(questions.items()))
+        messages = [{
+            "role": "system",
+            "content": f"""You are a database query tool speaking from {current_time.strftime('%Y-%m-%d %H:%M:%S')}.
+CRITICAL RULES:
+- Answer EACH verification question with EXACT facts from database
+- Keep answers concise and eliminate redundancy
+- NO creativity or narrative
+- NO interpretation
+- If no answer found, state 'No information available'
+- Use PAST TENSE for events before {current_time.strftime('%Y-%m-%d')}
+- Cite source IDs in brackets like [2], NOT URLs"""
+        }, {
+            "role": "user",
+            "content": f"""Using ONLY this database content:
+
+{json.dumps(structured_data, indent=2)}
+
+Answer ONLY these verification questions:
+
+{question_list}
+
+Start each answer with its own header line "### Q<number>" using the question's number above.
+Do not add any other sections."""
+        }]
+
+        # Sections are assembled by the caller, so do not echo the stream
+        return self._dispatch(messages, True, 4000)
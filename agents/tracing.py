@@ -0,0 +1,309 @@
+import bisect
+import contextvars
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+# Span open in the current thread/task; executors need submit() below to carry it over
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# Upper bounds for duration histograms (seconds) and size histograms (bytes)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class Span:
+    def __init__(self, name: str, span_id: int, parent, attributes: Dict):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent.span_id if parent else None
+        self.parent_name = parent.name if parent else None
+        # run and URL ids are inherited so every child span can be grouped by them
+        inherited = {key: parent.attributes[key] for key in ('run_id', 'url', 'urls')
+                     if parent and key in parent.attributes}
+        self.attributes = {**inherited, **attributes}
+        self.thread_id = threading.get_ident()
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'duration': self.duration,
+            'error': self.error,
+            **self.attributes
+        }
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _key(name: str, labels: Dict):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+class Metrics:
+    """Counters and histograms keyed by name and label set"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=SECONDS_BUCKETS, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def counter(self, name: str, **labels) -> float:
+        with self.lock:
+            return self.counters.get(_key(name, labels), 0)
+
+    def prometheus_text(self) -> str:
+        def escape(value) -> str:
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        def label_text(labels, extra=()):
+            pairs = [f'{key}="{escape(value)}"' for key, value in (*labels, *extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE overwatch_{name} counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"overwatch_{name}{label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE overwatch_{name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if histogram_name != name:
+                        continue
+                    for bound, cumulative in zip((*histogram.buckets, '+Inf'),
+                                                 itertools.accumulate(histogram.counts)):
+                        lines.append(f"overwatch_{name}_bucket{label_text(labels, (('le', bound),))} {cumulative}")
+                    lines.append(f"overwatch_{name}_sum{label_text(labels)} {histogram.sum}")
+                    lines.append(f"overwatch_{name}_count{label_text(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+class Tracer:
+    """Collects timing spans and metrics and fans out events to subscribers (e.g. progress display)."""
+
+    def __init__(self, max_spans: int = 100000):
+        self.metrics = Metrics()
+        self.spans = []
+        self.max_spans = max_spans
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.subscribers = []
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, next(self.ids), _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.time()
+            _current_span.reset(token)
+            self.metrics.observe('stage_seconds', span.duration, stage=name)
+            if span.error:
+                self.metrics.inc('stage_errors_total', stage=name)
+            with self.lock:
+                if len(self.spans) < self.max_spans:
+                    self.spans.append(span)
+            self.emit('span', span=span)
+
+    def current(self) -> Span:
+        return _current_span.get()
+
+    def subscribe(self, callback: Callable) -> Callable:
+        """Register callback(event, data) and return a function that unregisters it"""
+        with self.lock:
+            self.subscribers.append(callback)
+
+        def unsubscribe():
+            with self.lock:
+                if callback in self.subscribers:
+                    self.subscribers.remove(callback)
+        return unsubscribe
+
+    def emit(self, event: str, **data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"\nTrace subscriber error: {str(e)}")
+
+    def export_json(self, path: str):
+        """Write spans in Chrome trace event format (chrome://tracing, Perfetto)"""
+        with self.lock:
+            spans = list(self.spans)
+        events = [{
+            'name': span.name,
+            'cat': 'stage',
+            'ph': 'X',
+            'ts': int(span.start * 1e6),
+            'dur': int(span.duration * 1e6),
+            'pid': os.getpid(),
+            'tid': span.thread_id,
+            'args': span.to_dict()
+        } for span in spans]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def export_prometheus(self, path: str):
+        with open(path, 'w') as f:
+            f.write(self.metrics.prometheus_text())
+
+    def stage_summary(self) -> List[Dict]:
+        with self.lock:
+            spans = list(self.spans)
+        stages = {}
+        for span in spans:
+            stages.setdefault(span.name, []).append(span.duration)
+        summary = []
+        for name, durations in sorted(stages.items(), key=lambda item: -sum(item[1])):
+            durations.sort()
+            summary.append({
+                'stage': name,
+                'count': len(durations),
+                'total': sum(durations),
+                'p50': durations[len(durations) // 2],
+                'p99': durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+            })
+        return summary
+
+# Process-wide tracer used by every stage
+tracer = Tracer()
+
+def submit(executor, fn: Callable, *args, **kwargs):
+    """executor.submit that keeps the caller's current span as the parent inside the worker"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+# Finished spans kept with the run they belong to, so timings outlive the process's trace
+TIMINGS_TABLE = '''CREATE TABLE IF NOT EXISTS timings
+                   (id INTEGER PRIMARY KEY,
+                    stage TEXT,
+                    parent TEXT,
+                    url TEXT,
+                    docs INTEGER,
+                    started_at REAL,
+                    duration REAL,
+                    error TEXT)'''
+
+def timing_statement(span: Span):
+    """INSERT statement for one finished span; packed batches keep their first URL and document count"""
+    urls = span.attributes.get('urls') or []
+    url = span.attributes.get('url') or (urls[0] if urls else None)
+    return ('''INSERT INTO timings (stage, parent, url, docs, started_at, duration, error)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            (span.name, span.parent_name, url, span.attributes.get('docs'), span.start, span.duration, span.error))
+
+def write_trace(directory: str, prefix: str = 'trace'):
+    os.makedirs(directory, exist_ok=True)
+    tracer.export_json(os.path.join(directory, f'{prefix}.json'))
+    tracer.export_prometheus(os.path.join(directory, f'{prefix}.prom'))
+
+# From 3.12 cProfile runs on sys.monitoring, which is process-wide: one profiler already sees every
+# thread, and enabling a second one raises
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+class Profiler:
+    """cProfile for every thread started while active, plus tracemalloc allocation tracking"""
+
+    def __init__(self, output_dir: str = 'data'):
+        self.output_dir = output_dir
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def _start_thread_profile(self, *args):
+        # Runs inside the new thread's bootstrap, where an exception would kill the thread
+        try:
+            profile = cProfile.Profile()
+            # Enabling replaces this hook with the profiler for the new thread
+            profile.enable()
+        except Exception:
+            # Leave the thread unprofiled rather than retrying on every call it makes
+            sys.setprofile(None)
+            return
+        with self.lock:
+            self.profiles.append(profile)
+
+    def __enter__(self):
+        tracemalloc.start()
+        if PER_THREAD_PROFILES:
+            threading.setprofile(self._start_thread_profile)
+        main_profile = cProfile.Profile()
+        self.profiles.append(main_profile)
+        main_profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self.lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            try:
+                stats.add(profile)
+            except (TypeError, ValueError):
+                # Threads that never ran any Python code have nothing to add
+                continue
+        stats_path = os.path.join(self.output_dir, 'profile.prof')
+        stats.dump_stats(stats_path)
+
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats('cumulative').print_stats(20)
+        with open(os.path.join(self.output_dir, 'profile.txt'), 'w') as f:
+            f.write(text.getvalue())
+            f.write(f"\nPeak traced memory: {peak / 1024 / 1024:.1f} MiB\n\nTop allocations:\n")
+            for stat in snapshot.statistics('lineno')[:20]:
+                f.write(f"{stat}\n")
+        print(f"\nProfile saved to {stats_path} (peak traced memory {peak / 1024 / 1024:.1f} MiB)")
+        return False
@@ -0,0 +1,44 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# Query parameters that only track the visit and never change the page
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', 'ocid', 'cmpid',
+                   'ref', 'ref_src', 'ref_url', 'smid', 'sr_share', '_ga', '_gl', 'amp', 'outputtype'}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'mtm_', 'hsa_', 'at_')
+
+MOBILE_SUBDOMAINS = ('m.', 'mobile.', 'amp.', 'mobi.')
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+def _is_tracking(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def canonical_url(url: str) -> str:
+    """Fetchable canonical form: same page whatever tracking, AMP, mobile or trailing-slash variant was linked"""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = parsed.netloc.lower()
+    if host.endswith(DEFAULT_PORTS.get(scheme, '\0')):
+        host = host[:-len(DEFAULT_PORTS[scheme])]
+    for prefix in MOBILE_SUBDOMAINS:
+        # m.example.com -> example.com, but never strip a host down to its bare suffix
+        if host.startswith(prefix) and host.count('.') >= 2:
+            host = host[len(prefix):]
+            break
+
+    path = parsed.path or '/'
+    path = re.sub(r'^/amp(?=/)', '', path)
+    path = re.sub(r'/amp/?$', '/', path)
+    path = re.sub(r'\.amp(\.html?)?$', r'\1', path)
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+                             if not _is_tracking(name)))
+    return urlunparse((scheme, host, path, parsed.params, query, ''))
+
+def canonical_key(url: str) -> str:
+    """Dedup key: the canonical URL without scheme or www, so http/https and www variants collapse too"""
+    parsed = urlparse(canonical_url(url))
+    host = parsed.netloc[4:] if parsed.netloc.startswith('www.') else parsed.netloc
+    return urlunparse(('', host, parsed.path, parsed.params, parsed.query, ''))[2:]
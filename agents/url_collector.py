@@ -2,11 +2,23 @@ import requests
 import base64
 import json
 import datetime
+import os
 from urllib.parse import urlparse
+from .url_canonical import canonical_key
+from . import deadline
+
+# Live SERP calls usually answer in a few seconds; cap them so a stalled request cannot hold up the run
+SERP_TIMEOUT = 60
+
+# Reciprocal rank fusion constant; larger values flatten the advantage of top ranks
+RRF_K = 60
 
 class URLCollector:
     def __init__(self):
         self.cred = self._get_credentials()
+        self.locales = self._get_locales()
+        # Overridable so benchmarks can point at a local stand-in
+        self.api_url = os.environ.get('DATAFORSEO_API_URL', 'https://api.dataforseo.com').rstrip('/')
         self.social_media_domains = [
             'twitter.com', 'x.com',
             'facebook.com', 'instagram.com',
@@ -22,42 +34,86 @@ class URLCollector:
         api_password = config['dataforseo']['api_password']
         return base64.b64encode(f"{api_login}:{api_password}".encode()).decode()
 
+    def _get_locales(self) -> list:
+        # Optional fan-out, e.g. [{"location_code": 2840, "language_code": "en"}, {"location_code": 2826, ...}]
+        with open('config.json') as config_file:
+            config = json.load(config_file)
+        return config['dataforseo'].get('locales') or [{'location_code': 2840, 'language_code': 'en'}]
+
     def is_social_media(self, url: str) -> bool:
         domain = urlparse(url).netloc.lower()
         return any(sm_domain in domain for sm_domain in self.social_media_domains)
 
-    def get_serp_results(self, keyword: str, max_urls: int = 10) -> list:
-        url = "https://api.dataforseo.com/v3/serp/google/organic/live/advanced"
+    def get_serp_results(self, keyword: str, max_urls: int = None, locales: list = None) -> list:
+        """Organic results for every locale in one batched request, merged by canonical URL with rank fusion.
+
+        The whole ranked list is returned (best first) so callers can backfill failed pages from it. Each
+        entry keeps the first URL the SERP listed, the canonical form is only used to spot duplicates."""
+        url = f"{self.api_url}/v3/serp/google/organic/live/advanced"
         payload = json.dumps([{
             "keyword": keyword,
-            "location_code": 2840,
-            "language_code": "en"
-        }])
+            "location_code": locale['location_code'],
+            "language_code": locale['language_code']
+        } for locale in locales or self.locales])
         
         headers = {
             'Authorization': f'Basic {self.cred}',
             'Content-Type': 'application/json'
         }
         
-        response = requests.post(url, headers=headers, data=payload)
-        raw_results = response.json()['tasks'][0]['result'][0]['items']
+        response = requests.post(url, headers=headers, data=payload, timeout=deadline.timeout(SERP_TIMEOUT))
+        if response.status_code >= 400:
+            print(f"SERP request failed: HTTP {response.status_code} {response.text[:200]}")
+            return []
+        try:
+            data = response.json()
+        except ValueError:
+            print(f"SERP request returned invalid JSON: {response.text[:200]}")
+            return []
+        tasks = data.get('tasks') if isinstance(data, dict) else None
+        if not isinstance(tasks, list):
+            message = data.get('status_message') if isinstance(data, dict) else None
+            print(f"SERP request returned no tasks: {message or response.text[:200]}")
+            return []
+
+        merged = {}
+        for task in tasks:
+            task = task if isinstance(task, dict) else {}
+            if not task.get('result'):
+                print(f"SERP task failed for {(task.get('data') or {}).get('location_code')}: {task.get('status_message')}")
+                continue
+            locale = f"{task['data']['location_code']}:{task['data']['language_code']}"
+            rank = 0
+            ranked = set()
+            for item in task['result'][0]['items'] or []:
+                if 'url' in item and item['url']:
+                    url_lower = item['url'].lower()
+                    if 'google.com/search' in url_lower or self.is_social_media(item['url']):
+                        continue
+                    # The same article from several locales (or as an AMP/tracking variant) is fetched once,
+                    # from the URL the SERP gave; the rewritten canonical form may not exist on the site
+                    key = canonical_key(item['url'])
+                    if key in ranked:
+                        continue
+                    ranked.add(key)
+                    rank += 1
+                    entry = merged.setdefault(key, {'url': item['url'], 'score': 0.0, 'locales': []})
+                    entry['score'] += 1 / (RRF_K + rank)
+                    if locale not in entry['locales']:
+                        entry['locales'].append(locale)
         
         filtered_urls = []
-        for item in raw_results:
-            if 'url' in item and item['url']:
-                url_lower = item['url'].lower()
-                if 'google.com/search' in url_lower:
-                    continue
-                if not self.is_social_media(item['url']):
-                    filtered_urls.append({
-                        'url': item['url'],
-                        'collected_at': datetime.datetime.now().isoformat(),
-                        'source': urlparse(url_lower).netloc
-                    })
+        collected_at = datetime.datetime.now().isoformat()
+        for rank, entry in enumerate(sorted(merged.values(), key=lambda entry: -entry['score'])[:max_urls]):
+            filtered_urls.append({
+                'url': entry['url'],
+                'rank': rank,
+                'collected_at': collected_at,
+                'source': urlparse(entry['url']).netloc,
+                'locales': entry['locales']
+            })
         
-        return sorted(filtered_urls[:max_urls], 
-                     key=lambda x: x['collected_at'],
-                     reverse=True)
+        return filtered_urls
 
 if __name__ == "__main__":
     collector = URLCollector()
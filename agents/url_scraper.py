@@ -1,11 +1,21 @@
 import requests
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from .tracing import tracer, BYTES_BUCKETS
+from . import deadline
 
 class URLScraper:
-    def __init__(self):
+    def __init__(self, parse_executor=None):
+        self.parse_executor = parse_executor
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        # Keep-alive connections are reused across URLs and queries
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
     def clean_text(self, text):
         return ' '.join(text.split())
@@ -20,42 +30,79 @@ class URLScraper:
             
         return main_content
 
-    def scrape_url_content(self, url: str) -> dict:
-        try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+    def fetch(self, url: str):
+        """Download a page and return its raw bytes with the declared encoding (None if undeclared)"""
+        with tracer.span('fetch', url=url) as span:
+            response = self.session.get(url, headers=self.headers, timeout=deadline.timeout(10))
+            span.set(status=response.status_code)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            main_content = self.extract_main_content(soup)
-            
-            if not main_content:
-                return {
-                    'title': soup.title.string if soup.title else 'No Title',
-                    'content': 'No main content found'
-                }
-            
-            content = []
-            title = soup.find('title')
-            
-            for element in main_content.find_all(['h1', 'h2', 'h3', 'p', 'ul', 'ol', 'blockquote']):
-                if element.name in ['h1', 'h2', 'h3']:
-                    content.append(self.clean_text(element.get_text()))
-                elif element.name == 'p':
-                    text = self.clean_text(element.get_text())
-                    if len(text) > 50:
-                        content.append(text)
-                elif element.name in ['ul', 'ol']:
-                    for li in element.find_all('li'):
-                        content.append(self.clean_text(li.get_text()))
-                elif element.name == 'blockquote':
-                    content.append(self.clean_text(element.get_text()))
-            
+            tracer.metrics.inc('fetch_bytes_total', len(response.content))
+            tracer.metrics.observe('page_bytes', len(response.content), BYTES_BUCKETS)
+            return response.content, response.encoding
+
+    def extract_links(self, main_content, base_url: str, max_links: int = 50) -> list:
+        """Outbound (url, anchor text) pairs from the main content, for crawl expansion"""
+        links = []
+        for anchor in main_content.find_all('a', href=True):
+            href = anchor['href'].strip()
+            if not href or href.startswith(('#', 'mailto:', 'javascript:', 'tel:')):
+                continue
+            links.append((urljoin(base_url, href) if base_url else href, self.clean_text(anchor.get_text())))
+            if len(links) >= max_links:
+                break
+        return links
+
+    def parse(self, raw: bytes, encoding: str = None, base_url: str = None) -> dict:
+        soup = BeautifulSoup(raw, 'html.parser', from_encoding=encoding)
+        main_content = self.extract_main_content(soup)
+        
+        if not main_content:
+            # Plain str, a NavigableString would drag the whole tree along when pickled back from the pool
             return {
-                'title': self.clean_text(title.get_text()) if title else 'No Title',
-                'content': '\n'.join(content)
+                'title': str(soup.title.string) if soup.title and soup.title.string else 'No Title',
+                'content': 'No main content found'
             }
+        
+        content = []
+        title = soup.find('title')
+        
+        for element in main_content.find_all(['h1', 'h2', 'h3', 'p', 'ul', 'ol', 'blockquote']):
+            if element.name in ['h1', 'h2', 'h3']:
+                content.append(self.clean_text(element.get_text()))
+            elif element.name == 'p':
+                text = self.clean_text(element.get_text())
+                if len(text) > 50:
+                    content.append(text)
+            elif element.name in ['ul', 'ol']:
+                for li in element.find_all('li'):
+                    content.append(self.clean_text(li.get_text()))
+            elif element.name == 'blockquote':
+                content.append(self.clean_text(element.get_text()))
+        
+        return {
+            'title': self.clean_text(title.get_text()) if title else 'No Title',
+            'content': '\n'.join(content),
+            'links': self.extract_links(main_content, base_url)
+        }
+
+    def scrape_url_content(self, url: str) -> dict:
+        try:
+            raw, encoding = self.fetch(url)
+            
+            # CPU-bound parsing runs in the process pool so it never holds this process's GIL
+            with tracer.span('parse', url=url, pooled=bool(self.parse_executor)):
+                if self.parse_executor:
+                    future = self.parse_executor.submit(parse_html, raw, encoding, url)
+                    try:
+                        return future.result(timeout=deadline.timeout())
+                    except FutureTimeoutError:
+                        future.cancel()
+                        raise deadline.DeadlineExceeded(f"Deadline passed while parsing {url}")
+                deadline.check('parsing')
+                return self.parse(raw, encoding, url)
             
         except Exception as e:
+            tracer.metrics.inc('fetch_errors_total')
             return {
                 'title': 'Error',
                 'content': f"Error scraping {url}: {str(e)}"
@@ -67,6 +114,15 @@ class URLScraper:
             results[url] = self.scrape_url_content(url)
         return results
 
+_parser = None
+
+def parse_html(raw: bytes, encoding: str = None, base_url: str = None) -> dict:
+    """Parse entry point for process pool workers, which only send back the small title/content/links dict"""
+    global _parser
+    if _parser is None:
+        _parser = URLScraper()
+    return _parser.parse(raw, encoding, base_url)
+
 if __name__ == "__main__":
     scraper = URLScraper()
     test_urls = [
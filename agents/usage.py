@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+from typing import Dict, List
+
+# Per-run token and cost ledger, one row per LLM call (or per URL share of a packed call)
+USAGE_TABLE = '''CREATE TABLE IF NOT EXISTS usage
+                 (id INTEGER PRIMARY KEY,
+                  run_id TEXT,
+                  stage TEXT,
+                  url TEXT,
+                  model TEXT,
+                  prompt_tokens INTEGER,
+                  completion_tokens INTEGER,
+                  cached_tokens INTEGER,
+                  cost REAL,
+                  recorded_at DATETIME)'''
+
+def usage_from_response(usage: Dict, model: str, pricing: Dict = None) -> Dict:
+    """Normalize an OpenRouter usage block, pricing it from config when the API reports no cost"""
+    prompt_tokens = usage.get('prompt_tokens') or 0
+    completion_tokens = usage.get('completion_tokens') or 0
+    cost = usage.get('cost')
+    if cost is None and pricing and model in pricing:
+        # Config prices are USD per million tokens
+        cost = (prompt_tokens * pricing[model].get('prompt', 0) +
+                completion_tokens * pricing[model].get('completion', 0)) / 1e6
+    return {
+        'model': model,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cached_tokens': (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0,
+        'cost': cost or 0.0
+    }
+
+def usage_statements(record: Dict, recorded_at: str) -> List:
+    """INSERT statements for one usage event; a packed call is split evenly across its URLs"""
+    urls = record.get('urls') or [record.get('url')]
+    share = 1 / len(urls)
+    return [('''INSERT INTO usage (run_id, stage, url, model, prompt_tokens, completion_tokens, cached_tokens, cost,
+                recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+             (record['run_id'], record['stage'], url, record['model'],
+              round(record['prompt_tokens'] * share), round(record['completion_tokens'] * share),
+              round(record['cached_tokens'] * share), record['cost'] * share, recorded_at))
+            for url in urls]
+
+def ledger_totals(db_path: str) -> Dict:
+    """Token and cost totals of a run database's ledger: preparation, extraction and report calls together"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(USAGE_TABLE)
+    row = conn.execute('''SELECT COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0),
+                                 COALESCE(SUM(cached_tokens), 0), COALESCE(SUM(cost), 0.0) FROM usage''').fetchone()
+    conn.close()
+    return dict(zip(('prompt_tokens', 'completion_tokens', 'cached_tokens', 'cost'), row))
+
+def throughput(pages: int, tokens: int, cost: float) -> Dict:
+    return {
+        'pages_per_1k_tokens': pages / tokens * 1000 if tokens else None,
+        'pages_per_dollar': pages / cost if cost else None
+    }
+
+class TokenBudget:
+    """Token allowance shared by everything drawing on it (one run, or every run of a batch).
+
+    Work in flight holds a reservation for its estimated tokens until the
+    actual usage is known, so concurrent calls cannot overshoot together."""
+
+    def __init__(self, limit: int, used: int = 0):
+        self.limit = limit
+        self.used = used
+        self.reserved = 0
+        self.lock = threading.Lock()
+
+    def available(self) -> int:
+        with self.lock:
+            return self.limit - self.used - self.reserved
+
+    def reserve(self, tokens: int):
+        with self.lock:
+            self.reserved += tokens
+
+    def settle(self, reserved: int, actual: int):
+        with self.lock:
+            self.reserved -= reserved
+            self.used += actual
+
+class BudgetScheduler:
+    """Chooses how each page is extracted so a run stays inside its token budgets.
+
+    Every known URL holds a claim on the budget for a full extraction. A page
+    only gets the full treatment if the budget still covers it after the
+    claims of all better-ranked URLs; otherwise it degrades to a truncated
+    ('lite') LLM extraction, and finally to a local extractive summary that
+    costs no tokens at all."""
+
+    MODES = ('full', 'lite', 'local')
+
+    def __init__(self, budgets: List[TokenBudget], strategy_chars: int = 0, max_chars: int = 5000,
+                 lite_chars: int = 1500, completion_tokens: int = 400):
+        self.budgets = [budget for budget in budgets if budget]
+        self.strategy_chars = strategy_chars
+        self.max_chars = max_chars
+        self.lite_chars = lite_chars
+        self.completion_tokens = completion_tokens
+        self.claims = {}
+        self.lock = threading.Lock()
+
+    def estimate(self, chars: int, mode: str = 'full') -> int:
+        if mode == 'local':
+            return 0
+        limit = self.lite_chars if mode == 'lite' else self.max_chars
+        # ~4 characters per token, plus prompt overhead and the answer
+        return (min(chars, limit) + self.strategy_chars + 600) // 4 + self.completion_tokens
+
+    def expect(self, rank: int, chars: int = None):
+        """Hold a claim for a URL that has not been extracted yet"""
+        with self.lock:
+            self.claims[rank] = self.estimate(self.max_chars if chars is None else chars)
+
+    def drop(self, rank: int):
+        with self.lock:
+            self.claims.pop(rank, None)
+
+    def plan(self, rank: int, chars: int):
+        """Return (mode, reserved_tokens) for a page and reserve its tokens"""
+        with self.lock:
+            self.claims.pop(rank, None)
+            if not self.budgets:
+                return 'full', 0
+            ahead = sum(tokens for claim_rank, tokens in self.claims.items() if claim_rank < rank)
+            available = min(budget.available() for budget in self.budgets) - ahead
+            for mode in self.MODES:
+                tokens = self.estimate(chars, mode)
+                if tokens <= available:
+                    break
+            for budget in self.budgets:
+                budget.reserve(tokens)
+        return mode, tokens
+
+    def settle(self, reserved: int, actual: int):
+        for budget in self.budgets:
+            budget.settle(reserved, actual)
@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+class WorkQueue:
+    """Durable task table shared by worker processes through one SQLite file.
+
+    A task is claimed by taking a time-limited lease inside an IMMEDIATE
+    transaction, so two workers can never hold the same task. Workers extend
+    the lease with heartbeats; a lease that expires (crashed or stuck worker)
+    makes the task claimable again."""
+
+    def __init__(self, db_path: str = 'cache/work_queue.db', lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._create_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, transactions are opened explicitly
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _create_db(self):
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS tasks
+                        (id INTEGER PRIMARY KEY,
+                         run_db TEXT,
+                         kind TEXT,
+                         url TEXT,
+                         priority INTEGER DEFAULT 0,
+                         payload TEXT,
+                         state TEXT DEFAULT 'pending',
+                         attempts INTEGER DEFAULT 0,
+                         lease_owner TEXT,
+                         lease_expires REAL,
+                         error TEXT,
+                         updated_at REAL,
+                         UNIQUE (run_db, kind, url))''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks (state, priority, id)")
+        conn.close()
+
+    def _insert(self, conn: sqlite3.Connection, run_db: str, kind: str, url: str, priority: int, payload: Dict):
+        conn.execute('''INSERT OR IGNORE INTO tasks (run_db, kind, url, priority, payload, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                     (run_db, kind, url, priority, json.dumps(payload or {}), time.time()))
+
+    def enqueue(self, run_db: str, kind: str, url: str, priority: int = 0, payload: Dict = None):
+        conn = self._connect()
+        self._insert(conn, run_db, kind, url, priority, payload)
+        conn.close()
+
+    def enqueue_many(self, tasks: List[Dict]):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        for task in tasks:
+            self._insert(conn, task['run_db'], task['kind'], task['url'], task.get('priority', 0), task.get('payload'))
+        conn.execute("COMMIT")
+        conn.close()
+
+    def claim(self, owner: str) -> Optional[Dict]:
+        """Atomically lease the next runnable task, re-queueing expired leases on the way"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Expired leases that used up their attempts are given up on
+            conn.execute('''UPDATE tasks SET state = 'failed', error = 'lease expired too many times', updated_at = ?
+                            WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?''',
+                         (now, now, self.max_attempts))
+            conn.execute('''UPDATE tasks SET state = 'pending', lease_owner = NULL, updated_at = ?
+                            WHERE state = 'leased' AND lease_expires < ?''', (now, now))
+            row = conn.execute('''SELECT id, run_db, kind, url, payload, attempts FROM tasks
+                                  WHERE state = 'pending' ORDER BY priority, id LIMIT 1''').fetchone()
+            if not row:
+                conn.execute("COMMIT")
+                return None
+            conn.execute('''UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?,
+                            attempts = attempts + 1, updated_at = ? WHERE id = ?''',
+                         (owner, now + self.lease_seconds, now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return {'id': row[0], 'run_db': row[1], 'kind': row[2], 'url': row[3],
+                'payload': json.loads(row[4] or '{}'), 'attempts': row[5] + 1}
+
+    def heartbeat(self, task_id: int, owner: str) -> bool:
+        """Extend a lease; False means the lease was lost to another worker"""
+        conn = self._connect()
+        cursor = conn.execute('''UPDATE tasks SET lease_expires = ?, updated_at = ?
+                                 WHERE id = ? AND lease_owner = ? AND state = 'leased' ''',
+                              (time.time() + self.lease_seconds, time.time(), task_id, owner))
+        conn.close()
+        return cursor.rowcount == 1
+
+    def complete(self, task_id: int, owner: str, next_tasks: List[Dict] = None) -> bool:
+        """Mark a task done and enqueue its follow-up tasks in the same transaction"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute('''UPDATE tasks SET state = 'done', lease_owner = NULL, updated_at = ?
+                                     WHERE id = ? AND lease_owner = ? AND state = 'leased' ''',
+                                  (time.time(), task_id, owner))
+            if cursor.rowcount != 1:
+                conn.execute("ROLLBACK")
+                return False
+            for task in next_tasks or []:
+                self._insert(conn, task['run_db'], task['kind'], task['url'], task.get('priority', 0), task.get('payload'))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def fail(self, task_id: int, owner: str, error: str, attempts: int):
+        state = 'failed' if attempts >= self.max_attempts else 'pending'
+        conn = self._connect()
+        conn.execute('''UPDATE tasks SET state = ?, lease_owner = NULL, error = ?, updated_at = ?
+                        WHERE id = ? AND lease_owner = ?''', (state, error[:500], time.time(), task_id, owner))
+        conn.close()
+
+    def cancel_pending(self, run_db: str, kind: str) -> int:
+        """Drop a run's not yet claimed tasks of one kind; leased ones finish normally"""
+        conn = self._connect()
+        cursor = conn.execute("DELETE FROM tasks WHERE run_db = ? AND kind = ? AND state = 'pending'", (run_db, kind))
+        conn.close()
+        return cursor.rowcount
+
+    def finished_urls(self, run_db: str, kind: str) -> List[str]:
+        """URLs whose task of this kind is done or ran out of attempts"""
+        conn = self._connect()
+        rows = conn.execute("SELECT url FROM tasks WHERE run_db = ? AND kind = ? AND state IN ('done', 'failed')",
+                            (run_db, kind))
+        urls = [url for (url,) in rows.fetchall()]
+        conn.close()
+        return urls
+
+    def clear_run(self, run_db: str):
+        """Drop a run's tasks, except those a live worker (possibly on another machine) still holds a lease on"""
+        conn = self._connect()
+        conn.execute('''DELETE FROM tasks WHERE run_db = ? AND NOT (state = 'leased' AND lease_expires >= ?)''',
+                     (run_db, time.time()))
+        conn.close()
+
+    def counts(self, run_db: str = None) -> Dict[str, int]:
+        conn = self._connect()
+        if run_db:
+            rows = conn.execute("SELECT state, COUNT(*) FROM tasks WHERE run_db = ? GROUP BY state", (run_db,))
+        else:
+            rows = conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state")
+        counts = dict(rows.fetchall())
+        conn.close()
+        return counts
+
+class LeaseHeartbeat:
+    """Keeps a task's lease alive from a background thread while the task runs"""
+
+    def __init__(self, queue: WorkQueue, task_id: int, owner: str):
+        self.queue = queue
+        self.task_id = task_id
+        self.owner = owner
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            if not self.queue.heartbeat(self.task_id, self.owner):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from stand_ins import StandIns, WORDS
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process, or None where the platform cannot tell"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run_benchmark(args) -> dict:
+    stand_ins = StandIns(serp_results=args.serp_results, page_words=args.page_words, page_latency=args.page_latency,
+                         page_error_rate=args.page_error_rate, llm_latency=args.llm_latency,
+                         tokens_per_sec=args.tokens_per_sec, rate_429=args.rate_429,
+                         llm_error_rate=args.llm_error_rate, seed=args.seed)
+    os.environ.update(stand_ins.api_env())
+
+    # Agents read config.json and write data/ relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='overwatch-bench-')
+    os.chdir(workdir)
+    config = {
+        'openrouter': {'api_key': 'bench', 'model': 'stand-in/model'},
+        'dataforseo': {'api_login': 'bench', 'api_password': 'bench',
+                       'locales': [{'location_code': 2840 + number, 'language_code': 'en'} for number in range(args.locales)]},
+        'query_index': {'db_path': os.path.join(workdir, 'query_index.db')}
+    }
+    with open('config.json', 'w') as f:
+        json.dump(config, f)
+    os.makedirs('data', exist_ok=True)
+
+    # Imported late so every agent picks up the stand-in endpoints
+    from agents.model_router import ModelRouter
+    from agents.openrouter_agent import OpenRouterAgent
+    from agents.deadline import run_deadline
+    from agents.tracing import tracer
+    from report_generator import generate_final_report
+    from url_middle_out import (SharedResources, build_query_index, prepare_query, process_query, sanitize_filename,
+                                count_report_usage)
+
+    agent = OpenRouterAgent('bench', 'stand-in/model', ModelRouter.from_config(config))
+    query_index = build_query_index(config)
+    resources = SharedResources(args.fetch_workers, args.llm_workers, parse_workers=args.parse_workers)
+    # Distinct queries, so the similar-query index does not turn the run into cache hits
+    rng = random.Random(args.seed)
+    queries = [f"{args.topic} {' '.join(rng.sample(WORDS, 4))} {number}" for number in range(args.queries)]
+    # Every stand-in site shares one host, so the per-domain cap would stop expansion at once
+    crawl = ({'max_depth': args.crawl_depth, 'max_pages': args.crawl_pages, 'per_domain': args.crawl_pages + args.serp_results}
+             if args.expand else None)
+    query_latencies = []
+    latency_lock = threading.Lock()
+
+    def run_one(user_query: str) -> dict:
+        start = time.time()
+        with run_deadline(args.deadline):
+            usage = []
+            strategy, _ = prepare_query(user_query, agent, query_index, echo=False, usage=usage)
+            db_path = os.path.join('data', f'{sanitize_filename(user_query)}_data.db')
+            stats = process_query(user_query, agent, db_path, strategy, resources=resources, show_progress=False,
+                                  crawl=crawl, target=args.pages, prepare_usage=usage)
+            report = generate_final_report(stats['db_path'], agent, echo=False)
+            count_report_usage(stats)
+        stats['report_ok'] = not report.startswith('Error')
+        with latency_lock:
+            query_latencies.append(time.time() - start)
+        return stats
+
+    if args.trace_memory:
+        tracemalloc.start()
+    start_time = time.time()
+    results = []
+    failures = 0
+    # Agents stream their answers to stdout, which would drown the results
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    try:
+        with quiet, ThreadPoolExecutor(max_workers=args.parallel_queries) as executor:
+            for future in as_completed([executor.submit(run_one, query) for query in queries]):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    failures += 1
+                    print(f"[FAILED] {str(e)}", file=sys.stderr)
+    finally:
+        resources.close()
+        stand_ins.close()
+    elapsed = max(time.time() - start_time, 1e-9)
+    traced_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    urls = sum(stats['urls'] for stats in results)
+    tokens = sum(stats['tokens'] for stats in results)
+    return {
+        'queries': len(queries),
+        'failed': failures,
+        'reports_ok': sum(1 for stats in results if stats['report_ok']),
+        'elapsed': elapsed,
+        'queries_per_min': len(results) / elapsed * 60,
+        'urls_per_sec': urls / elapsed,
+        'urls': urls,
+        'summarized': sum(stats['summarized'] for stats in results),
+        'fetch_failures': sum(stats['fetch_failures'] for stats in results),
+        'cut_short': sum(stats['cut_short'] for stats in results),
+        'expanded': sum(stats['expanded'] for stats in results),
+        'tokens': tokens,
+        'query_p50': percentile(query_latencies, 50),
+        'query_p99': percentile(query_latencies, 99),
+        'stages': tracer.stage_summary(),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_traced_mb': traced_peak,
+        'workdir': workdir,
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'}
+    }
+
+def print_results(results: dict):
+    print(f"\n=== BENCHMARK ({results['queries']} queries, {results['failed']} failed, "
+          f"{results['reports_ok']} reports) ===")
+    print(f"Elapsed: {results['elapsed']:.1f}s")
+    print(f"Throughput: {results['queries_per_min']:.1f} queries/min, {results['urls_per_sec']:.2f} URLs/sec "
+          f"({results['summarized']}/{results['urls']} URLs summarized, {results['fetch_failures']} failed fetches, "
+          f"{results['expanded']} from links, "
+          f"{results['tokens']} tokens)")
+    print(f"Query latency: p50 {results['query_p50']:.2f}s, p99 {results['query_p99']:.2f}s")
+    if results['cut_short']:
+        print(f"Deadline: {results['cut_short']} tasks cancelled")
+    print("Stage latency:")
+    for stage in results['stages']:
+        print(f"  {stage['stage']:<10} {stage['count']:>6} spans | p50 {stage['p50'] * 1000:8.1f}ms | "
+              f"p99 {stage['p99'] * 1000:8.1f}ms | total {stage['total']:8.2f}s")
+    if results['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {results['peak_rss_mb']:.1f} MiB")
+    if results['peak_traced_mb'] is not None:
+        print(f"Peak traced Python memory: {results['peak_traced_mb']:.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark against local stand-in services")
+    parser.add_argument('--queries', type=int, default=8)
+    parser.add_argument('--parallel-queries', type=int, default=4)
+    parser.add_argument('--topic', default="market growth", help="words every benchmark query starts with")
+    parser.add_argument('--fetch-workers', type=int, default=16)
+    parser.add_argument('--llm-workers', type=int, default=8)
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--serp-results', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=10, help="usable pages wanted per query, as url_middle_out.py --pages")
+    parser.add_argument('--locales', type=int, default=1, help="SERP locations fanned out per query")
+    parser.add_argument('--page-words', type=int, default=600)
+    parser.add_argument('--page-latency', type=float, default=0.05)
+    parser.add_argument('--page-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument('--tokens-per-sec', type=float, default=200.0)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--deadline', type=float, help="end-to-end seconds per query, as url_middle_out.py --deadline")
+    parser.add_argument('--expand', action='store_true', help="follow related links like url_middle_out.py --expand")
+    parser.add_argument('--crawl-depth', type=int, default=1)
+    parser.add_argument('--crawl-pages', type=int, default=10)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="also report tracemalloc's peak (slows the run down)")
+    parser.add_argument('--verbose', action='store_true', help="show the pipeline's own output")
+    parser.add_argument('--output', metavar='FILE', help="write the results as JSON for comparing runs")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    results = run_benchmark(args)
+    print_results(results)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {output}")
+
+if __name__ == "__main__":
+    main()
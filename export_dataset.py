@@ -0,0 +1,289 @@
+"""Export run databases into partitioned Parquet datasets for analysis across many runs.
+
+Each table becomes <output>/<table>/run_date=YYYY-MM-DD/part-*.parquet, readable with e.g.
+pyarrow.dataset.dataset('<output>/summaries', partitioning='hive'). Runs already exported
+are listed in <output>/_manifest.json, so repeated exports only append new runs."""
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for exporting
+    pa = pq = None
+
+from agents.claim_clusters import split_claims
+
+# Rows pulled from SQLite at a time, independent of how many are buffered for Parquet
+FETCH_SIZE = 1000
+TABLES = ('runs', 'serp_items', 'pages', 'summaries', 'evidence', 'timings', 'usage')
+
+def dataset_schemas(include_content: bool = False) -> Dict:
+    string, integer, real, timestamp = pa.string(), pa.int64(), pa.float64(), pa.timestamp('us')
+    pages = [('run_id', string), ('url', string), ('rank', integer), ('state', string), ('title', string),
+             ('content_chars', integer), ('updated_at', timestamp)]
+    if include_content:
+        pages.append(('content', string))
+    return {name: pa.schema(fields) for name, fields in {
+        'runs': [('run_id', string), ('db_file', string), ('query', string), ('strategy', string), ('stage', string),
+                 ('run_at', timestamp), ('urls', integer), ('stored', integer), ('summaries', integer),
+                 ('prompt_tokens', integer), ('completion_tokens', integer), ('cost', real)],
+        'serp_items': [('run_id', string), ('rank', integer), ('url', string), ('domain', string)],
+        'pages': pages,
+        'summaries': [('run_id', string), ('summary_id', integer), ('url', string), ('summary', string),
+                      ('collected_at', timestamp), ('source', string)],
+        'evidence': [('run_id', string), ('summary_id', integer), ('url', string), ('claim_index', integer),
+                     ('claim', string)],
+        'timings': [('run_id', string), ('stage', string), ('parent', string), ('url', string), ('docs', integer),
+                    ('started_at', timestamp), ('duration', real), ('error', string)],
+        'usage': [('run_id', string), ('stage', string), ('url', string), ('model', string),
+                  ('prompt_tokens', integer), ('completion_tokens', integer), ('cached_tokens', integer),
+                  ('cost', real), ('recorded_at', timestamp)]
+    }.items()}
+
+def parse_time(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def fetch_rows(conn: sqlite3.Connection, sql: str) -> Iterator[Tuple]:
+    """Stream a query's rows; tables older runs never had simply yield nothing"""
+    c = conn.cursor()
+    try:
+        c.execute(sql)
+    except sqlite3.OperationalError:
+        return
+    while True:
+        rows = c.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+def scalar(conn: sqlite3.Connection, sql: str, default=0):
+    try:
+        value = conn.execute(sql).fetchone()[0]
+    except sqlite3.OperationalError:
+        return default
+    return default if value is None else value
+
+def read_run(conn: sqlite3.Connection, db_path: str) -> Dict:
+    try:
+        row = conn.execute("SELECT query, content_strategy, stage, run_at FROM queries ORDER BY run_at DESC LIMIT 1").fetchone()
+    except sqlite3.OperationalError:
+        # Databases from before checkpointing have no stage and were only written once finished
+        row = conn.execute("SELECT query, content_strategy, 'complete', run_at FROM queries ORDER BY run_at DESC LIMIT 1").fetchone()
+    if not row:
+        return None
+    query, strategy, stage, run_at = row
+    db_file = os.path.basename(db_path)
+    run_time = parse_time(run_at) or datetime.datetime.fromtimestamp(os.path.getmtime(db_path))
+    return {
+        'run_id': hashlib.sha1(f"{db_file}|{run_at}".encode('utf-8')).hexdigest()[:16],
+        'db_file': db_file,
+        'query': query,
+        'strategy': strategy,
+        'stage': stage,
+        'run_at': run_time,
+        'urls': scalar(conn, "SELECT COUNT(*) FROM url_state"),
+        'stored': scalar(conn, "SELECT COUNT(*) FROM url_state WHERE state = 'stored'"),
+        'summaries': scalar(conn, "SELECT COUNT(*) FROM summaries"),
+        'prompt_tokens': scalar(conn, "SELECT SUM(prompt_tokens) FROM usage"),
+        'completion_tokens': scalar(conn, "SELECT SUM(completion_tokens) FROM usage"),
+        'cost': float(scalar(conn, "SELECT SUM(cost) FROM usage"))
+    }
+
+def run_rows(conn: sqlite3.Connection, run: Dict, include_content: bool = False) -> Iterator[Tuple[str, Dict]]:
+    """Yield (table, row) for everything one run database holds"""
+    run_id = run['run_id']
+    yield 'runs', run
+    for rank, url in fetch_rows(conn, "SELECT rank, url FROM url_state ORDER BY rank"):
+        yield 'serp_items', {'run_id': run_id, 'rank': rank, 'url': url, 'domain': urlparse(url).netloc}
+    content_column = 'content' if include_content else 'NULL'
+    for url, rank, state, title, chars, updated_at, content in fetch_rows(
+            conn, f"SELECT url, rank, state, title, LENGTH(content), updated_at, {content_column} FROM url_state"):
+        row = {'run_id': run_id, 'url': url, 'rank': rank, 'state': state, 'title': title,
+               'content_chars': chars, 'updated_at': parse_time(updated_at)}
+        if include_content:
+            row['content'] = content
+        yield 'pages', row
+    for summary_id, url, summary, collected_at, source in fetch_rows(
+            conn, "SELECT id, url, summary, collected_at, source FROM summaries"):
+        yield 'summaries', {'run_id': run_id, 'summary_id': summary_id, 'url': url, 'summary': summary,
+                            'collected_at': parse_time(collected_at), 'source': source}
+        # Evidence is the summary broken into the individual claims the report draws on
+        for index, claim in enumerate(split_claims(summary or '')):
+            yield 'evidence', {'run_id': run_id, 'summary_id': summary_id, 'url': url, 'claim_index': index,
+                               'claim': claim}
+    for stage, parent, url, docs, started_at, duration, error in fetch_rows(
+            conn, "SELECT stage, parent, url, docs, started_at, duration, error FROM timings"):
+        yield 'timings', {'run_id': run_id, 'stage': stage, 'parent': parent, 'url': url, 'docs': docs,
+                          'started_at': parse_time(started_at), 'duration': duration, 'error': error}
+    for row in fetch_rows(conn, '''SELECT stage, url, model, prompt_tokens, completion_tokens, cached_tokens, cost,
+                                          recorded_at FROM usage'''):
+        stage, url, model, prompt_tokens, completion_tokens, cached_tokens, cost, recorded_at = row
+        yield 'usage', {'run_id': run_id, 'stage': stage, 'url': url, 'model': model, 'prompt_tokens': prompt_tokens,
+                        'completion_tokens': completion_tokens, 'cached_tokens': cached_tokens, 'cost': cost,
+                        'recorded_at': parse_time(recorded_at)}
+
+class DatasetWriter:
+    """Appends rows to one new part file per table and day, holding at most batch_size rows in memory in total.
+
+    Part files are written under a hidden name; close() finishes them and
+    returns their (hidden, final) paths for publish_parts to rename into
+    place, so readers never see a half-written export."""
+
+    def __init__(self, output_dir: str, schemas: Dict, batch_size: int = 5000):
+        self.output_dir = output_dir
+        self.schemas = schemas
+        self.batch_size = batch_size
+        self.stamp = f"{datetime.datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self.buffers = {}
+        self.buffered = 0
+        self.writers = {}
+        self.rows = dict.fromkeys(schemas, 0)
+
+    def add(self, table: str, day: str, row: Dict):
+        self.buffers.setdefault((table, day), []).append(row)
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            # Many runs spread over many days would otherwise each hold a partly filled buffer;
+            # the largest one goes out, so row groups stay as big as the budget allows
+            self._flush(*max(self.buffers, key=lambda key: len(self.buffers[key])))
+
+    def _flush(self, table: str, day: str):
+        rows = self.buffers.get((table, day))
+        if not rows:
+            return
+        if (table, day) not in self.writers:
+            directory = os.path.join(self.output_dir, table, f'run_date={day}')
+            os.makedirs(directory, exist_ok=True)
+            final_path = os.path.join(directory, f'part-{self.stamp}.parquet')
+            temp_path = os.path.join(directory, f'.part-{self.stamp}.parquet.tmp')
+            writer = pq.ParquetWriter(temp_path, self.schemas[table], compression='zstd')
+            self.writers[(table, day)] = (writer, temp_path, final_path)
+        self.writers[(table, day)][0].write_table(pa.Table.from_pylist(rows, schema=self.schemas[table]))
+        self.rows[table] += len(rows)
+        self.buffered -= len(rows)
+        rows.clear()
+
+    def close(self) -> List[Tuple[str, str]]:
+        for table, day in list(self.buffers):
+            self._flush(table, day)
+        parts = []
+        for writer, temp_path, final_path in self.writers.values():
+            writer.close()
+            parts.append((os.path.relpath(temp_path, self.output_dir), os.path.relpath(final_path, self.output_dir)))
+        return parts
+
+    def abort(self):
+        for writer, temp_path, _ in self.writers.values():
+            writer.close()
+            os.remove(temp_path)
+
+def load_manifest(output_dir: str) -> Dict:
+    path = os.path.join(output_dir, '_manifest.json')
+    if not os.path.exists(path):
+        return {'runs': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(output_dir: str, manifest: Dict):
+    path = os.path.join(output_dir, '_manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def publish_parts(output_dir: str, manifest: Dict):
+    """Rename the pending export's finished parts into place, then record its runs as exported.
+
+    The pending export is saved in the manifest before any rename, so an
+    export interrupted part way is completed by the next one instead of
+    being exported (and duplicated) again."""
+    pending = manifest.pop('pending', None)
+    if not pending:
+        return
+    for temp_path, final_path in pending['parts']:
+        temp_path = os.path.join(output_dir, temp_path)
+        if os.path.exists(temp_path):
+            os.replace(temp_path, os.path.join(output_dir, final_path))
+    manifest['runs'].update(pending['runs'])
+    save_manifest(output_dir, manifest)
+
+def export_runs(db_paths: List[str], output_dir: str, batch_size: int = 5000, include_content: bool = False) -> Dict:
+    """Append every finished, not yet exported run to the dataset; returns counts of runs and rows"""
+    if pa is None:
+        print("Error: Parquet export needs pyarrow (pip install pyarrow)")
+        return {'exported': 0, 'skipped': len(db_paths), 'rows': {}}
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    if manifest.get('pending'):
+        print("Completing an interrupted export")
+        publish_parts(output_dir, manifest)
+    writer = DatasetWriter(output_dir, dataset_schemas(include_content), batch_size)
+    exported, skipped = [], 0
+    try:
+        for db_path in db_paths:
+            conn = sqlite3.connect(f'file:{os.path.abspath(db_path)}?mode=ro', uri=True)
+            try:
+                run = read_run(conn, db_path)
+                # Unfinished runs wait for a later export, so no run is ever written twice
+                if not run or run['run_id'] in manifest['runs'] or run['stage'] != 'complete':
+                    skipped += 1
+                    continue
+                day = run['run_at'].date().isoformat()
+                for table, row in run_rows(conn, run, include_content):
+                    writer.add(table, day, row)
+                exported.append(run)
+            except sqlite3.DatabaseError as e:
+                print(f"Error reading {db_path}: {str(e)}")
+                skipped += 1
+            finally:
+                conn.close()
+    except BaseException:
+        writer.abort()
+        raise
+    parts = writer.close()
+
+    exported_at = datetime.datetime.now().isoformat()
+    manifest['pending'] = {
+        'parts': parts,
+        'runs': {run['run_id']: {'db_file': run['db_file'], 'query': run['query'], 'exported_at': exported_at}
+                 for run in exported}
+    }
+    save_manifest(output_dir, manifest)
+    publish_parts(output_dir, manifest)
+    return {'exported': len(exported), 'skipped': skipped, 'rows': writer.rows}
+
+def main():
+    parser = argparse.ArgumentParser(description="Export run databases to partitioned Parquet datasets")
+    parser.add_argument('databases', nargs='*',
+                        help="run databases to export (default: every *_data.db in --data-dir)")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--output', default='exports/dataset', help="dataset root directory")
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help="rows buffered across all tables before the largest buffer is written out")
+    parser.add_argument('--include-content', action='store_true', help="also export the full page text")
+    args = parser.parse_args()
+
+    db_paths = args.databases or sorted(glob.glob(os.path.join(args.data_dir, '*_data.db')))
+    result = export_runs(db_paths, args.output, args.batch_size, args.include_content)
+    print(f"Exported {result['exported']} runs ({result['skipped']} skipped) to {args.output}")
+    for table, count in result['rows'].items():
+        if count:
+            print(f"  {table:<11} {count:>8} rows")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
 import sqlite3
 
 from agents.openrouter_agent import OpenRouterAgent
-from agents.report_generator_agent import ReportGeneratorAgent
+from agents.report_generator_agent import ReportGeneratorAgent, report_database
+from agents.model_router import ModelRouter
+from agents.tracing import tracer, TIMINGS_TABLE, timing_statement
+from agents.usage import USAGE_TABLE, usage_statements
+from agents.claim_clusters import ClaimClusterer, split_claims
+from agents import deadline
+import contextvars
 import json
 import os
 import time
+import threading
+import uuid
 from datetime import datetime
 import re
+from typing import Dict, List
 
-def generate_final_report(db_path: str, agent: OpenRouterAgent) -> str:
+def generate_final_report(db_path: str, agent: OpenRouterAgent, cluster_claims: bool = True, echo: bool = True) -> str:
     print("\n=== REPORT GENERATOR READING DATABASE ===")
     
     current_time = datetime.now()  # Get current time when report is generated
@@ -42,14 +51,194 @@ def generate_final_report(db_path: str, agent: OpenRouterAgent) -> str:
         'source': row[3]
     } for idx, row in enumerate(summaries)]
     
-    report_agent = ReportGeneratorAgent(agent.api_key, agent.model)
-    report = report_agent.generate_report(structured_data, query, strategy, current_time)
+    run_id = uuid.uuid4().hex[:12]
+    usage, spans = [], []
     
+    def on_event(event: str, data: Dict):
+        if event == 'usage' and data['run_id'] == run_id:
+            usage.append(data)
+        elif event == 'span' and data['span'].attributes.get('run_id') == run_id:
+            spans.append(data['span'])
+    
+    unsubscribe = tracer.subscribe(on_event)
+    try:
+        claims = None
+        if cluster_claims:
+            # Repeated facts are sent once, with how many sources back them
+            with tracer.span('cluster', run_id=run_id, sources=len(structured_data)) as span:
+                claims = ClaimClusterer().cluster([(item['source_id'], item['content']) for item in structured_data])
+                span.set(claims=len(claims))
+            sources = [{key: item[key] for key in ('source_id', 'url', 'collected_at', 'source')}
+                       for item in structured_data]
+            if claims and len(report_database(sources, claims)) < len(report_database(structured_data)):
+                print(f"Clustered {len(structured_data)} summaries into {len(claims)} claims")
+                structured_data = sources
+            elif claims:
+                # Little overlap between sources: the claim list would be the bigger prompt
+                print("Clustering did not shrink the report prompt, sending the summaries")
+                claims = None
+        
+        report_agent = ReportGeneratorAgent(agent.api_key, agent.model, agent.router)
+        # Callers running several reports at once turn the streamed text off
+        report_agent.echo = echo
+        with tracer.span('report', run_id=run_id, sources=len(structured_data)):
+            report = report_agent.generate_report(structured_data, query, strategy, current_time, claims)
+    finally:
+        unsubscribe()
+    
+    # The report's tokens and timings go in the run's database next to the extraction's
+    c.execute(USAGE_TABLE)
+    for record in usage:
+        for statement, params in usage_statements(record, current_time.isoformat()):
+            c.execute(statement, params)
+    c.execute(TIMINGS_TABLE)
+    for span in spans:
+        c.execute(*timing_statement(span))
+    conn.commit()
     conn.close()
     print("=== DATABASE READ COMPLETE ===")
     
+    if deadline.expired() and (not report or report.startswith('Error')):
+        # Out of time for the LLM, hand back the evidence itself rather than nothing
+        print("Deadline reached before the report was written, returning the collected evidence")
+        return evidence_report(query, structured_data, claims)
     return report if report else "Error: Failed to generate report"
 
+def evidence_report(query: str, structured_data: List[Dict], claims: List[Dict] = None, max_claims: int = 30) -> str:
+    """Plain listing of the gathered claims with their sources, for when no report could be generated"""
+    if not claims:
+        claims = [{'claim': claim, 'support': 1, 'source_ids': [item['source_id']]}
+                  for item in structured_data for claim in split_claims(item.get('content') or '')]
+    lines = [f"# {query}", "", "Report not generated in time. Findings collected so far, most corroborated first:", ""]
+    for claim in claims[:max_claims]:
+        lines.append(f"- {claim['claim']} " + "".join(f"[{source_id}]" for source_id in claim['source_ids']))
+    lines += ["", "Sources:"]
+    lines += [f"[{item['source_id']}] {item['url']}" for item in structured_data]
+    return "\n".join(lines)
+
+STOPWORDS = {
+    'the', 'and', 'was', 'were', 'what', 'when', 'where', 'who', 'which', 'how', 'did', 'does',
+    'this', 'that', 'with', 'for', 'from', 'his', 'her', 'their', 'its', 'are', 'has', 'have'
+}
+
+def parse_questions(strategy: str) -> Dict[int, str]:
+    """Pull the numbered verification questions out of a content strategy"""
+    questions = {}
+    for line in strategy.splitlines():
+        match = re.match(r'^\W*(\d+)[.)]\s*(.+)$', line.strip())
+        if match and int(match.group(1)) not in questions:
+            questions[int(match.group(1))] = match.group(2).strip(' *')
+    return questions or {1: strategy.strip()}
+
+def split_answers(response: str, numbers: List[int]) -> Dict[int, str]:
+    parts = re.split(r'^\s*#{1,6}\s*Q(\d+)\b.*$', response, flags=re.MULTILINE | re.IGNORECASE)
+    answers = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        if int(number) in numbers and body.strip():
+            answers[int(number)] = body.strip()
+    return answers
+
+def content_terms(text: str) -> set:
+    return {t for t in re.findall(r'[a-z0-9]+', text.lower()) if len(t) > 2 and t not in STOPWORDS}
+
+class ProgressiveReport:
+    """Drafts the report from the first summaries and re-answers only affected questions as evidence arrives."""
+
+    def __init__(self, query: str, strategy: str, agent: OpenRouterAgent, report_path: str, draft_after: int = 3):
+        self.query = query
+        self.questions = parse_questions(strategy)
+        self.report_path = report_path
+        self.draft_after = draft_after
+        self.report_agent = ReportGeneratorAgent(agent.api_key, agent.model, agent.router)
+
+        # Terms shared by most questions (usually the query subject) say nothing about relevance
+        counts = {}
+        for text in self.questions.values():
+            for term in content_terms(text):
+                counts[term] = counts.get(term, 0) + 1
+        common = {term for term, count in counts.items() if count > max(1, len(self.questions) // 2)}
+        self.question_terms = {number: content_terms(text) - common for number, text in self.questions.items()}
+
+        self.sources = []
+        self.pending = []
+        self.answers = {}
+        self.drafted = False
+        self.finished = False
+        self.condition = threading.Condition()
+        # A plain thread starts with an empty context; the copy carries the run's deadline and trace into report calls
+        self.worker = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), daemon=True)
+        self.worker.start()
+
+    def add_summary(self, url: str, summary: str, collected_at: str, source: str):
+        with self.condition:
+            self.pending.append({
+                'url': url,
+                'content': summary,
+                'collected_at': collected_at,
+                'source': source
+            })
+            self.condition.notify()
+
+    def finish(self) -> str:
+        """Fold in the remaining evidence, write the final report and return its text"""
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+        self.worker.join()
+        return self._write(final=True)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.finished and (not self.pending or
+                        (not self.drafted and len(self.sources) + len(self.pending) < self.draft_after)):
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                # Coalesce everything that arrived while the previous update was running
+                new_sources = self.pending
+                self.pending = []
+            try:
+                self._update(new_sources)
+            except Exception as e:
+                print(f"\nError updating progressive report: {str(e)}")
+
+    def _update(self, new_sources: List[Dict]):
+        for item in new_sources:
+            item['source_id'] = len(self.sources) + 1
+            self.sources.append(item)
+
+        if not self.drafted:
+            affected = set(self.questions)
+            self.drafted = True
+        else:
+            affected = set()
+            for item in new_sources:
+                terms = content_terms(item['content'])
+                affected.update(number for number, q_terms in self.question_terms.items() if q_terms & terms)
+        if affected:
+            response = self.report_agent.answer_questions(
+                self.sources, {number: self.questions[number] for number in affected}, datetime.now())
+            self.answers.update(split_answers(response, affected))
+        self._write(final=False)
+
+    def _write(self, final: bool) -> str:
+        lines = [f"# Report: {self.query}", ""]
+        if not final:
+            lines += [f"_Draft: {len(self.sources)} sources processed so far_", ""]
+        for number, text in sorted(self.questions.items()):
+            lines += [f"## {number}. {text}", self.answers.get(number, "No information available"), ""]
+        lines.append("Sources:")
+        lines += [f"- [{item['source_id']}] {item['url']}" for item in self.sources]
+        report = "\n".join(lines) + "\n"
+
+        # Replace atomically so readers never see a half-written report
+        tmp_path = self.report_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(report)
+        os.replace(tmp_path, self.report_path)
+        return report
+
 def sanitize_filename(name: str) -> str:
     """Convert query to safe filename"""
     return re.sub(r'[^a-zA-Z0-9_]', '_', name).strip('_')[:50]
@@ -127,7 +316,8 @@ def main():
         
         agent = OpenRouterAgent(
             config['openrouter']['api_key'],
-            config['openrouter']['model']
+            config['openrouter']['model'],
+            ModelRouter.from_config(config)
         )
         
         # Generate and save report
@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from agents.openrouter_agent import OpenRouterAgent
+from agents.model_router import ModelRouter
+from agents.tracing import tracer
+from agents import deadline
+from report_generator import generate_final_report
+from url_middle_out import (SharedResources, build_query_index, prepare_query, process_query, sanitize_filename,
+                            query_key, count_report_usage)
+
+# Finished jobs (and their reports) kept in memory for polling
+KEEP_JOBS = 500
+
+class Job:
+    def __init__(self, query: str, deadline: float = None, file_tag: str = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.deadline = deadline
+        # Run database and report are named after this, so no two active jobs share it
+        self.file_tag = file_tag or sanitize_filename(query)
+        self.status = 'queued'
+        self.progress = {}
+        self.stats = None
+        self.report = None
+        self.report_path = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self.condition = threading.Condition()
+        self.emit('queued')
+
+    def emit(self, event: str, **data):
+        with self.condition:
+            self.events.append({'event': event, 'time': time.time(), **data})
+            self.condition.notify_all()
+
+    def set_status(self, status: str, **data):
+        self.status = status
+        if status in ('done', 'failed'):
+            self.finished_at = time.time()
+        self.emit(status, **data)
+
+    def update_progress(self, progress: Dict):
+        self.progress = progress
+        self.emit('progress', **progress)
+
+    def wait_events(self, start: int, timeout: float = 15.0):
+        """Return events after index start, blocking until there is at least one or timeout"""
+        with self.condition:
+            if len(self.events) <= start and self.status not in ('done', 'failed'):
+                self.condition.wait(timeout)
+            return self.events[start:]
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'query': self.query,
+            'file_tag': self.file_tag,
+            'deadline': self.deadline,
+            'status': self.status,
+            'progress': self.progress,
+            'stats': self.stats,
+            'report_path': self.report_path,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+class JobService:
+    """Keeps config, agents, pools, caches and the DB writer warm between jobs"""
+
+    def __init__(self, config: Dict, workers: int = 2, fetch_workers: int = 16, llm_workers: int = 8,
+                 data_dir: str = 'data', parse_workers: int = None, deadline: float = None,
+                 keep_jobs: int = KEEP_JOBS):
+        self.router = ModelRouter.from_config(config)
+        self.agent = OpenRouterAgent(config['openrouter']['api_key'], config['openrouter']['model'], self.router)
+        self.query_index = build_query_index(config)
+        self.resources = SharedResources(fetch_workers, llm_workers, parse_workers=parse_workers)
+        self.data_dir = data_dir
+        self.deadline = deadline
+        self.keep_jobs = keep_jobs
+        os.makedirs(data_dir, exist_ok=True)
+
+        self.jobs = {}
+        # Unfinished jobs by lowercased file tag (the data directory may be case-insensitive)
+        self.active = {}
+        self.jobs_lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, query: str, deadline: float = None) -> Job:
+        with self.jobs_lock:
+            # Runs write to files named after the query's tag: the same search shares the active job,
+            # a different query whose tag collides gets a suffixed one instead of racing it
+            base = file_tag = sanitize_filename(query)
+            suffix = 2
+            while file_tag.lower() in self.active:
+                job = self.active[file_tag.lower()]
+                if query_key(job.query) == query_key(query):
+                    return job
+                file_tag = f'{base}_{suffix}'
+                suffix += 1
+            job = Job(query, deadline or self.deadline, file_tag)
+            self.jobs[job.id] = job
+            self.active[file_tag.lower()] = job
+            self._prune()
+        self.queue.put(job)
+        return job
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond keep_jobs, so a long-running service stays bounded"""
+        finished = [job for job in self.jobs.values() if job.status in ('done', 'failed')]
+        for job in sorted(finished, key=lambda job: job.finished_at)[:max(0, len(finished) - self.keep_jobs)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id: str) -> Job:
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.jobs_lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            except Exception as e:
+                job.error = str(e)
+                job.set_status('failed', error=str(e))
+            finally:
+                with self.jobs_lock:
+                    self.active.pop(job.file_tag.lower(), None)
+                    self._prune()
+
+    def _run(self, job: Job):
+        # The deadline is counted from submission, time spent queued included
+        seconds = job.deadline - (time.time() - job.created_at) if job.deadline else None
+        with deadline.run_deadline(seconds):
+            self._run_stages(job)
+
+    def _run_stages(self, job: Job):
+        file_tag = job.file_tag
+        job.set_status('preparing')
+        # Several jobs run at once, progress goes to the event stream instead of stdout
+        usage = []
+        strategy, domain_expert = prepare_query(job.query, self.agent, self.query_index, echo=False, usage=usage)
+
+        job.set_status('processing', domain=domain_expert.strip())
+        db_path = os.path.join(self.data_dir, f'{file_tag}_data.db')
+        job.stats = process_query(job.query, self.agent, db_path, strategy, resources=self.resources,
+                                  show_progress=False, on_progress=job.update_progress, prepare_usage=usage)
+
+        job.set_status('reporting')
+        report = generate_final_report(job.stats['db_path'], self.agent, echo=False)
+        count_report_usage(job.stats)
+        job.report_path = os.path.join(self.data_dir, f'{file_tag}_final_summary.txt')
+        with open(job.report_path, 'w') as f:
+            f.write(report)
+        job.report = report
+        job.set_status('done', stats=job.stats)
+
+    def close(self):
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.resources.close()
+
+def make_handler(service: JobService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload):
+            body = json.dumps(payload, indent=2).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job(self, job_id: str):
+            job = service.get(job_id)
+            if not job:
+                self._send_json(404, {'error': f'Unknown job {job_id}'})
+            return job
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self._send_json(404, {'error': 'Not found'})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except (ValueError, json.JSONDecodeError):
+                return self._send_json(400, {'error': 'Body must be JSON'})
+            if not isinstance(payload, dict):
+                return self._send_json(400, {'error': 'Body must be a JSON object'})
+            query = str(payload.get('query', '')).strip()
+            if not query:
+                return self._send_json(400, {'error': 'Missing "query"'})
+            try:
+                job_deadline = float(payload['deadline']) if payload.get('deadline') is not None else None
+            except (TypeError, ValueError):
+                return self._send_json(400, {'error': '"deadline" must be a number of seconds'})
+            job = service.submit(query, job_deadline)
+            self._send_json(202, job.to_dict())
+
+        def do_GET(self):
+            parts = [part for part in self.path.split('?')[0].split('/') if part]
+            if parts == ['health']:
+                return self._send_json(200, {'status': 'ok', 'queued': service.queue.qsize(),
+                                             'models': service.router.summary()})
+            if parts == ['jobs']:
+                return self._send_json(200, service.list_jobs())
+            if parts == ['metrics']:
+                body = tracer.metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if len(parts) < 2 or parts[0] != 'jobs':
+                return self._send_json(404, {'error': 'Not found'})
+
+            job = self._job(parts[1])
+            if not job:
+                return
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if parts[2] == 'report':
+                if job.status != 'done':
+                    return self._send_json(409, {'error': f'Job is {job.status}', 'status': job.status})
+                body = job.report.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if parts[2] == 'events':
+                return self._stream_events(job)
+            self._send_json(404, {'error': 'Not found'})
+
+        def _stream_events(self, job: Job):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            sent = 0
+            try:
+                while True:
+                    events = job.wait_events(sent)
+                    for event in events:
+                        self.wfile.write(f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode('utf-8'))
+                    sent += len(events)
+                    if not events:
+                        # Keep idle connections from being dropped by proxies
+                        self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    if job.status in ('done', 'failed') and sent >= len(job.events):
+                        return
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Project OverWatch service mode")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help="jobs processed at once")
+    parser.add_argument('--fetch-workers', type=int, default=16)
+    parser.add_argument('--llm-workers', type=int, default=8)
+    parser.add_argument('--parse-workers', type=int, default=None, help="HTML parser processes (default: one per core)")
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help="default end-to-end limit per job, from submission to report (jobs may set their own)")
+    parser.add_argument('--keep-jobs', type=int, default=KEEP_JOBS,
+                        help="finished jobs kept for polling before the oldest are forgotten")
+    args = parser.parse_args()
+
+    with open('config.json') as config_file:
+        config = json.load(config_file)
+
+    service = JobService(config, args.workers, args.fetch_workers, args.llm_workers,
+                         parse_workers=args.parse_workers, deadline=args.deadline, keep_jobs=args.keep_jobs)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Project OverWatch service listening on http://{args.host}:{args.port}")
+    print("  POST /jobs {\"query\": ..., \"deadline\": seconds} | GET /jobs/<id> | GET /jobs/<id>/events | GET /jobs/<id>/report | GET /metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Local stand-ins for DataForSEO, OpenRouter and the web, so the pipeline can be
+load tested without API credits or network access."""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import quote, unquote
+
+WORDS = (
+    "market report analysis company revenue growth quarter annual percent million billion government "
+    "policy announced official statement data study research results team season match final record "
+    "price rate increase decline launch product release update version investors funding round share "
+    "election vote court ruling agreement deal network users platform service customers industry"
+).split()
+
+def start_server(handler_class, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Serve handler_class from a daemon thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def log_message(self, format, *args):
+        pass
+
+def make_corpus_handler(page_words: int = 600, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+                        related: int = 3):
+    """Static site serving a deterministic synthetic page for any /<site>/<slug>.html path"""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class CorpusHandler(QuietHandler):
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            with rng_lock:
+                failed = rng.random() < error_rate
+            if failed:
+                return self._send(503, b'Service Unavailable', 'text/plain')
+
+            path = unquote(self.path.split('?')[0])
+            page_rng = random.Random(hashlib.blake2b(path.encode(), digest_size=8).digest())
+            topic = re.sub(r'[-_/]+', ' ', path.rsplit('/', 1)[-1].replace('.html', ''))
+            paragraphs = []
+            remaining = page_words
+            while remaining > 0:
+                length = min(remaining, page_rng.randint(40, 120))
+                paragraphs.append(f"{topic.capitalize()} " + " ".join(page_rng.choice(WORDS) for _ in range(length)) + ".")
+                remaining -= length
+            body = "".join(f"<p>{paragraph}</p>\n" for paragraph in paragraphs)
+            # Related articles give link expansion something to follow
+            stem = path.rsplit('.', 1)[0]
+            body += "".join(f"<p><a href='{stem}-{number}.html'>{topic} {' '.join(page_rng.sample(WORDS, 3))}</a></p>\n"
+                            for number in range(related))
+            html = (f"<html><head><title>{topic.title()}</title></head><body>"
+                    f"<nav><a href='/'>Home</a></nav><article><h1>{topic.title()}</h1>\n{body}</article>"
+                    f"<footer>Synthetic corpus</footer></body></html>")
+            self._send(200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    return CorpusHandler
+
+def make_serp_handler(corpus_url: str, results: int = 10, latency: float = 0.0, sites: int = 25):
+    """DataForSEO /v3/serp/google/organic/live/advanced with organic items pointing at the corpus"""
+
+    class SerpHandler(QuietHandler):
+        def do_POST(self):
+            if not self.path.startswith('/v3/serp/google/organic/live/advanced'):
+                return self._send(404, json.dumps({'status_code': 40400, 'status_message': 'Not Found.'}).encode())
+            if latency:
+                time.sleep(latency)
+            tasks = self._read_json() or []
+            response_tasks = []
+            for task in tasks:
+                keyword = task.get('keyword', '')
+                slug = quote(re.sub(r'\W+', '-', keyword.lower()).strip('-'))
+                # Top results are shared by every locale, the rest differ per location
+                location = task.get('location_code')
+                items = []
+                for rank in range(1, results + 1):
+                    # A couple of results the collector is expected to filter out
+                    if rank == 3:
+                        url = f"https://twitter.com/search?q={slug}"
+                    elif rank == 7:
+                        url = f"https://www.google.com/search?q={slug}"
+                    # ... and variants of earlier results it is expected to merge
+                    elif rank == 5:
+                        url = f"{items[0]['url']}?utm_source=serp&utm_medium=organic"
+                    elif rank == 9:
+                        url = items[1]['url'].replace(corpus_url, f"{corpus_url}/amp")
+                    else:
+                        seed_text = f"{keyword}{rank}" if rank < 6 else f"{keyword}{rank}{location}"
+                        site = int.from_bytes(hashlib.blake2b(seed_text.encode(), digest_size=4).digest(), 'big')
+                        page = f"{rank}" if rank < 6 else f"{rank}-{location}"
+                        url = f"{corpus_url}/site{site % sites}/{slug}-{page}.html"
+                    items.append({
+                        'type': 'organic',
+                        'rank_group': rank,
+                        'rank_absolute': rank,
+                        'domain': url.split('/')[2],
+                        'title': f"{keyword} result {rank}",
+                        'url': url,
+                        'description': f"Result {rank} for {keyword}"
+                    })
+                response_tasks.append({
+                    'status_code': 20000,
+                    'status_message': 'Ok.',
+                    'data': task,
+                    'result': [{
+                        'keyword': keyword,
+                        'location_code': task.get('location_code'),
+                        'language_code': task.get('language_code'),
+                        'items_count': len(items),
+                        'items': items
+                    }]
+                })
+            payload = {'status_code': 20000, 'status_message': 'Ok.', 'tasks_count': len(response_tasks),
+                       'tasks': response_tasks}
+            self._send(200, json.dumps(payload).encode('utf-8'))
+
+    return SerpHandler
+
+def fake_completion(prompt: str, rng: random.Random) -> str:
+    """Answer in whatever shape the pipeline's prompt asks for"""
+    def bullets(count: int) -> str:
+        return "\n".join(f"- The {' '.join(rng.choice(WORDS) for _ in range(6))} was reported." for _ in range(count))
+
+    doc_ids = re.findall(r'<<<DOC (\d+)>>>', prompt)
+    if doc_ids:
+        return "\n\n".join(f"### DOC {doc_id}\n{bullets(3)}" for doc_id in doc_ids)
+    question_ids = re.findall(r'^(\d+)\. ', prompt.split('Answer ONLY these verification questions:')[-1], re.MULTILINE)
+    if '### Q<number>' in prompt and question_ids:
+        return "\n\n".join(f"### Q{number}\n{bullets(1)} [1]" for number in question_ids)
+    if 'Generate atleast 10 questions' in prompt:
+        return "\n".join(f"{number}. What {' '.join(rng.choice(WORDS) for _ in range(5))}?" for number in range(1, 11))
+    if 'domain expertise' in prompt:
+        return "Research: Industry Analyst"
+    return bullets(5)
+
+def make_openrouter_handler(latency: float = 0.2, tokens_per_sec: float = 200.0, rate_429: float = 0.0,
+                            error_rate: float = 0.0, price_per_million: float = 1.0, seed: int = 0):
+    """OpenRouter chat completions, streaming (SSE) and not, with latency, speed and failure knobs"""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class OpenRouterHandler(QuietHandler):
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                return self._send(404, json.dumps({'error': {'message': 'Not found', 'code': 404}}).encode())
+            payload = self._read_json() or {}
+            with rng_lock:
+                roll = rng.random()
+                local_rng = random.Random(rng.random())
+            if roll < rate_429:
+                return self._send(429, json.dumps({'error': {'message': 'Rate limit exceeded', 'code': 429}}).encode())
+            if roll < rate_429 + error_rate:
+                return self._send(500, json.dumps({'error': {'message': 'Upstream error', 'code': 500}}).encode())
+
+            prompt = "\n".join(str(message.get('content', '')) for message in payload.get('messages', []))
+            text = fake_completion(prompt, local_rng)
+            tokens = re.findall(r'\S+\s*', text)
+            usage = {
+                'prompt_tokens': len(prompt) // 4,
+                'completion_tokens': len(tokens),
+                'total_tokens': len(prompt) // 4 + len(tokens),
+                'cost': (len(prompt) // 4 + len(tokens)) * price_per_million / 1e6
+            }
+            model = payload.get('model', 'stand-in/model')
+            time.sleep(latency)
+
+            if not payload.get('stream'):
+                time.sleep(len(tokens) / tokens_per_sec)
+                return self._send(200, json.dumps({
+                    'id': 'gen-local', 'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                    'usage': usage
+                }).encode('utf-8'))
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            try:
+                # Send a handful of tokens per chunk to keep the stand-in cheap at high token rates
+                chunk_size = 8
+                for start in range(0, len(tokens), chunk_size):
+                    chunk = "".join(tokens[start:start + chunk_size])
+                    data = {'id': 'gen-local', 'model': model, 'choices': [{'index': 0, 'delta': {'content': chunk}}]}
+                    self.wfile.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    time.sleep(len(tokens[start:start + chunk_size]) / tokens_per_sec)
+                final = {'id': 'gen-local', 'model': model,
+                         'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client abandoned the stream (e.g. lost a hedged race)
+                return
+
+    return OpenRouterHandler
+
+class StandIns:
+    """Starts all three stand-ins; api_env() gives the endpoint overrides for the pipeline"""
+
+    def __init__(self, serp_results: int = 10, serp_latency: float = 0.0, page_words: int = 600,
+                 page_latency: float = 0.0, page_error_rate: float = 0.0, llm_latency: float = 0.2,
+                 tokens_per_sec: float = 200.0, rate_429: float = 0.0, llm_error_rate: float = 0.0, seed: int = 0,
+                 related_links: int = 3):
+        self.corpus = start_server(make_corpus_handler(page_words, page_latency, page_error_rate, seed, related_links))
+        self.serp = start_server(make_serp_handler(server_url(self.corpus), serp_results, serp_latency))
+        self.openrouter = start_server(make_openrouter_handler(llm_latency, tokens_per_sec, rate_429,
+                                                               llm_error_rate, seed=seed))
+
+    def api_env(self) -> Dict[str, str]:
+        return {
+            'DATAFORSEO_API_URL': server_url(self.serp),
+            'OPENROUTER_API_URL': f"{server_url(self.openrouter)}/api/v1/chat/completions"
+        }
+
+    def close(self):
+        for server in (self.corpus, self.serp, self.openrouter):
+            server.shutdown()
+            server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local DataForSEO/OpenRouter/web stand-ins")
+    parser.add_argument('--serp-results', type=int, default=10)
+    parser.add_argument('--page-words', type=int, default=600)
+    parser.add_argument('--page-latency', type=float, default=0.05)
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument('--tokens-per-sec', type=float, default=200.0)
+    parser.add_argument('--rate-429', type=float, default=0.0, help="fraction of LLM calls answered with 429")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help="fraction of LLM calls answered with 500")
+    args = parser.parse_args()
+
+    stand_ins = StandIns(serp_results=args.serp_results, page_words=args.page_words, page_latency=args.page_latency,
+                         llm_latency=args.llm_latency, tokens_per_sec=args.tokens_per_sec, rate_429=args.rate_429,
+                         llm_error_rate=args.llm_error_rate)
+    print("Stand-ins running. Point the pipeline at them with:")
+    for name, value in stand_ins.api_env().items():
+        print(f"  {name}={value}")
+    print(f"Page corpus: {server_url(stand_ins.corpus)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stand_ins.close()
+
+if __name__ == "__main__":
+    main()
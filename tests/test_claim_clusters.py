@@ -0,0 +1,52 @@
+import pytest
+
+from agents import claim_clusters
+from agents.claim_clusters import ClaimClusterer, split_claims
+
+@pytest.fixture(params=['numpy', 'python'])
+def clusterer(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(claim_clusters, 'np', None)
+    elif claim_clusters.np is None:
+        pytest.skip('numpy not installed')
+    return ClaimClusterer()
+
+def test_split_claims_drops_headers_and_non_claims():
+    summary = "### DOC 1\n- **Strickland** lost by split decision. He fought in Toronto.\n- No relevant information found"
+    assert split_claims(summary) == ['Strickland lost by split decision.', 'He fought in Toronto.']
+
+def test_repeated_claims_merge_with_their_sources(clusterer):
+    clusters = clusterer.cluster([
+        (1, '- Dricus Du Plessis beat Sean Strickland by split decision at UFC 297.'),
+        (2, '- Dricus du Plessis beat Sean Strickland by split decision at UFC 297'),
+        (3, '- The event was held in Toronto, Canada.')
+    ])
+    assert clusters[0]['support'] == 2
+    assert clusters[0]['source_ids'] == [1, 2]
+    assert len(clusters) == 2
+
+def test_contradicting_outcomes_stay_apart(clusterer):
+    clusters = clusterer.cluster([
+        (1, '- Sean Strickland lost to Dricus Du Plessis by split decision at UFC 297.'),
+        (2, '- Sean Strickland won against Dricus Du Plessis by split decision at UFC 297.')
+    ])
+    assert [cluster['support'] for cluster in clusters] == [1, 1]
+
+def test_different_dates_stay_apart(clusterer):
+    clusters = clusterer.cluster([
+        (1, '- The fight took place on January 20, 2024 in Toronto.'),
+        (2, '- The fight took place on January 20, 2023 in Toronto.'),
+        (3, '- The fight took place on January 20, 2024, in Toronto.')
+    ])
+    assert [(cluster['support'], cluster['source_ids']) for cluster in clusters] == [(2, [1, 3]), (1, [2])]
+
+def test_negated_claims_stay_apart(clusterer):
+    clusters = clusterer.cluster([
+        (1, '- Strickland was cleared to fight at UFC 312.'),
+        (2, "- Strickland wasn't cleared to fight at UFC 312.")
+    ])
+    assert len(clusters) == 2
+
+def test_same_source_claim_counts_once(clusterer):
+    clusters = clusterer.cluster([(1, '- Strickland lost by split decision.\n- Strickland lost by split decision.')])
+    assert clusters == [{'claim': 'Strickland lost by split decision.', 'support': 1, 'source_ids': [1]}]
@@ -0,0 +1,61 @@
+from agents.crawl_frontier import BloomFilter, CrawlFrontier
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f'https://example.com/{number}' for number in range(1000)]
+    # A new item can collide with bits already set, so only nearly all adds report it as new
+    assert sum(bloom.add(item) for item in items) > 980
+    assert all(item in bloom for item in items)
+    assert not any(bloom.add(item) for item in items)
+
+def test_bloom_filter_false_positive_rate_is_bounded():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for number in range(1000):
+        bloom.add(f'seen-{number}')
+    false_positives = sum(f'unseen-{number}' in bloom for number in range(10000))
+    assert false_positives < 300
+
+def make_frontier(**kwargs):
+    return CrawlFrontier({'strickland', 'fight', 'result', 'decision'}, **kwargs)
+
+def test_links_come_out_best_first():
+    frontier = make_frontier()
+    frontier.offer([('https://a.example/other', 'strickland'),
+                    ('https://b.example/page', 'strickland fight result'),
+                    ('https://c.example/none', 'cookie policy')], depth=0)
+    first, second = frontier.next(), frontier.next()
+    assert (first[0], first[1]) == ('https://b.example/page', 1)
+    assert first[2] > second[2]
+    assert frontier.next() is None
+
+def test_denied_file_and_seen_links_are_dropped():
+    frontier = make_frontier(deny=['twitter.com'])
+    frontier.add_seen(['https://news.example/strickland-fight'])
+    queued = frontier.offer([('https://twitter.com/strickland', 'strickland fight'),
+                             ('https://a.example/strickland-fight.pdf', 'strickland fight'),
+                             ('https://news.example/strickland-fight?utm_source=x', 'strickland fight'),
+                             ('https://b.example/result', 'strickland fight result')], depth=0)
+    assert queued == 1
+    assert frontier.offer([('https://b.example/result', 'strickland fight result')], depth=0) == 0
+
+def test_budgets_stop_expansion():
+    frontier = make_frontier(max_depth=1, max_pages=2, per_domain=1)
+    assert frontier.offer([('https://a.example/deep', 'strickland fight')], depth=1) == 0
+    frontier.offer([('https://a.example/1', 'strickland fight'), ('https://a.example/2', 'strickland fight'),
+                    ('https://b.example/1', 'strickland fight'), ('https://c.example/1', 'strickland fight')], depth=0)
+    taken = [frontier.next(), frontier.next(), frontier.next()]
+    assert [link[0] for link in taken[:2]] == ['https://a.example/1', 'https://b.example/1']
+    assert taken[2] is None
+    assert frontier.exhausted()
+
+def test_time_budget_stops_expansion():
+    frontier = make_frontier(time_budget=0)
+    frontier.offer([('https://a.example/1', 'strickland fight')], depth=0)
+    assert frontier.next() is None
+
+def test_links_are_fetched_as_found_and_variants_deduped():
+    frontier = make_frontier(per_domain=5)
+    link = 'https://m.news.example/strickland-fight/amp/?utm_source=feed'
+    assert frontier.offer([(link, 'strickland fight'),
+                           ('https://www.news.example/strickland-fight', 'strickland fight')], depth=0) == 1
+    assert frontier.next()[0] == link
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+import export_dataset
+from export_dataset import DatasetWriter, dataset_schemas, export_runs, load_manifest
+
+def make_run(path, query, run_at, urls=3):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE queries (query TEXT, content_strategy TEXT, stage TEXT, run_at TEXT)")
+    conn.execute("CREATE TABLE url_state (url TEXT, rank INTEGER, state TEXT, title TEXT, content TEXT, updated_at TEXT)")
+    conn.execute("INSERT INTO queries VALUES (?, 'facts', 'complete', ?)", (query, run_at))
+    conn.executemany("INSERT INTO url_state VALUES (?, ?, 'stored', NULL, 'text', ?)",
+                     [(f'https://example.com/{number}', number, run_at) for number in range(urls)])
+    conn.commit()
+    conn.close()
+    return str(path)
+
+def serp_rows(output_dir):
+    return pq.read_table(str(output_dir / 'serp_items')).num_rows
+
+def test_writer_holds_at_most_batch_size_rows_across_partitions(tmp_path):
+    writer = DatasetWriter(str(tmp_path), dataset_schemas(), batch_size=4)
+    for number in range(20):
+        writer.add('serp_items', f'2026-01-{number % 5 + 1:02d}', {'run_id': 'r', 'rank': number, 'url': 'u'})
+        assert writer.buffered < 4
+    writer.close()
+    assert writer.rows['serp_items'] == 20
+
+def test_repeated_export_only_appends_new_runs(tmp_path):
+    output = tmp_path / 'dataset'
+    first = make_run(tmp_path / 'a_data.db', 'first', '2026-01-01T10:00:00')
+    assert export_runs([first], str(output))['exported'] == 1
+    second = make_run(tmp_path / 'b_data.db', 'second', '2026-01-02T10:00:00', urls=2)
+    result = export_runs([first, second], str(output))
+    assert (result['exported'], result['skipped']) == (1, 1)
+    assert serp_rows(output) == 5
+
+def test_export_interrupted_before_publishing_is_completed_not_repeated(tmp_path, monkeypatch):
+    output = tmp_path / 'dataset'
+    run = make_run(tmp_path / 'a_data.db', 'first', '2026-01-01T10:00:00')
+
+    def crash(output_dir, manifest):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(export_dataset, 'publish_parts', crash)
+        with pytest.raises(KeyboardInterrupt):
+            export_runs([run], str(output))
+    assert load_manifest(str(output))['runs'] == {}
+
+    result = export_runs([run], str(output))
+    assert (result['exported'], result['skipped']) == (0, 1)
+    assert 'pending' not in load_manifest(str(output))
+    assert serp_rows(output) == 3
@@ -0,0 +1,9 @@
+from agents.intent_filter_agent import IntentFilterAgent
+from agents.model_router import ModelRouter
+
+def test_determine_domain_returns_error_string_when_every_model_fails():
+    agent = IntentFilterAgent('key', 'model', ModelRouter('model'))
+    # Nothing listens on the discard port, so every request fails to connect
+    agent.url = 'http://127.0.0.1:9/v1/chat/completions'
+    domain = agent.determine_domain('sean strickland last fight result')
+    assert domain.startswith('API Error:')
@@ -0,0 +1,60 @@
+import pytest
+
+from agents.model_router import ModelRouter
+
+def record(router, model, latency, count=5, ok=True):
+    for _ in range(count):
+        router.stats_for(model).record(latency, ok)
+
+def test_measured_models_are_ordered_by_p95():
+    router = ModelRouter('default', roles={'extract': {'models': ['slow', 'fast']}})
+    record(router, 'slow', 2.0)
+    record(router, 'fast', 0.1)
+    assert router.models_for('extract') == ['fast', 'slow']
+
+def test_unmeasured_models_keep_their_configured_slot():
+    router = ModelRouter('default', roles={'extract': {'models': ['measured', 'new']}})
+    record(router, 'measured', 2.0)
+    record(router, 'new', 0.1, count=2)
+    # Too few samples is not the same as being fast
+    assert router.models_for('extract') == ['measured', 'new']
+
+def test_unhealthy_models_go_last():
+    router = ModelRouter('default', roles={'extract': {'models': ['broken', 'ok']}})
+    record(router, 'broken', 0.1, ok=False)
+    assert router.models_for('extract') == ['ok', 'broken']
+
+def test_fails_over_to_next_model():
+    router = ModelRouter('default', roles={'extract': {'models': ['down', 'up']}})
+
+    def fn(model, cancel_event):
+        if model == 'down':
+            raise RuntimeError('HTTP 503')
+        return 'answer'
+
+    assert router.call('extract', fn) == 'answer'
+    assert router.summary()['down']['error_rate'] == 1.0
+
+def test_empty_response_counts_as_failure():
+    router = ModelRouter('default', roles={'extract': {'models': ['only']}})
+    with pytest.raises(ValueError):
+        router.call('extract', lambda model, cancel_event: '  ')
+
+def test_hedge_loser_is_demoted():
+    router = ModelRouter('default', roles={'extract': {'models': ['slow', 'fast'], 'hedge': True}},
+                         min_samples=3, hedge_default_delay=0.02, hedge_min_delay=0.01)
+
+    def fn(model, cancel_event):
+        if model == 'slow':
+            # Streams until the winner cancels it
+            cancel_event.wait(5)
+            raise RuntimeError('cancelled')
+        return 'answer'
+
+    for _ in range(3):
+        assert router.call('extract', fn) == 'answer'
+    summary = router.summary()
+    assert summary['slow']['calls'] == 0
+    assert router.stats_for('slow').samples() == 3
+    assert summary['slow']['p95'] >= 0.02
+    assert router.models_for('extract') == ['fast', 'slow']
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from agents.query_index import QuerySimilarityIndex
+
+def make_index(tmp_path, **kwargs):
+    return QuerySimilarityIndex(str(tmp_path / 'query_index.db'), **kwargs)
+
+def test_paraphrase_reuses_strategy(tmp_path):
+    index = make_index(tmp_path)
+    index.add("who won sean strickland's last ufc fight", 'strategy', 'Sports: MMA analyst')
+    hit = index.lookup('sean strickland last fight result')
+    assert hit is not None
+    assert hit['content_strategy'] == 'strategy'
+    assert hit['domain'] == 'Sports: MMA analyst'
+
+def test_unrelated_query_misses(tmp_path):
+    index = make_index(tmp_path)
+    index.add("who won sean strickland's last ufc fight", 'strategy', 'domain')
+    assert index.lookup('best python web framework 2024') is None
+
+def test_last_and_next_do_not_match(tmp_path):
+    index = make_index(tmp_path)
+    index.add("who won sean strickland's last ufc fight", 'strategy', 'domain')
+    assert index.lookup("who won sean strickland's next ufc fight") is None
+
+def test_different_years_do_not_match(tmp_path):
+    index = make_index(tmp_path)
+    index.add('best python web framework 2024', 'strategy', 'domain')
+    assert index.lookup('best python web framework 2025') is None
+    assert index.lookup('top python web frameworks 2024') is not None
+
+def test_expired_entries_are_ignored_and_purged(tmp_path):
+    index = make_index(tmp_path, ttl_seconds=60)
+    index.add('sean strickland last fight result', 'old', 'domain')
+    conn = sqlite3.connect(index.db_path)
+    conn.execute("UPDATE indexed_queries SET created_at = ?", (time.time() - 3600,))
+    conn.commit()
+    conn.close()
+    assert index.lookup('sean strickland last fight result') is None
+
+    index.add('best python web framework 2024', 'new', 'domain')
+    conn = sqlite3.connect(index.db_path)
+    queries = [row[0] for row in conn.execute("SELECT query FROM indexed_queries")]
+    buckets = conn.execute("SELECT COUNT(*) FROM lsh_buckets").fetchone()[0]
+    conn.close()
+    assert queries == ['best python web framework 2024']
+    assert buckets == index.bands
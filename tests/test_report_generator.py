@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+import report_generator
+from agents import deadline
+from report_generator import ProgressiveReport, generate_final_report
+
+class Agent:
+    api_key, model, router = 'key', 'model', None
+
+def test_progressive_report_updates_run_under_the_callers_deadline(tmp_path):
+    seen = []
+
+    class Report(ProgressiveReport):
+        def _update(self, new_sources):
+            seen.append(deadline.current())
+
+    with deadline.run_deadline(60) as run_deadline:
+        report = Report('query', '1. What happened?', Agent(), str(tmp_path / 'report.txt'), draft_after=1)
+        report.add_summary('https://example.com/a', '- a fact', '2026-01-01T00:00:00', 'web')
+        report.finish()
+    assert seen == [run_deadline]
+
+@pytest.mark.parametrize('echo', [True, False])
+def test_final_report_streams_only_when_asked(tmp_path, monkeypatch, echo):
+    db_path = str(tmp_path / 'run_data.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE queries (query TEXT, content_strategy TEXT, run_at TEXT)")
+    conn.execute("CREATE TABLE summaries (url TEXT, summary TEXT, collected_at TEXT, source TEXT)")
+    conn.execute("INSERT INTO queries VALUES ('query', '1. What happened?', '2026-01-01T00:00:00')")
+    conn.execute("INSERT INTO summaries VALUES ('https://example.com/a', '- a fact', '2026-01-01T00:00:00', 'web')")
+    conn.commit()
+    conn.close()
+    echoed = []
+
+    def generate_report(self, structured_data, query, strategy, current_time, claims=None):
+        echoed.append(self.echo)
+        return '# Report'
+
+    monkeypatch.setattr(report_generator.ReportGeneratorAgent, 'generate_report', generate_report)
+    assert generate_final_report(db_path, Agent(), echo=echo) == '# Report'
+    assert echoed == [echo]
@@ -0,0 +1,12 @@
+from agents.report_generator_agent import report_database
+
+def test_clustered_evidence_is_compact():
+    sources = [{'source_id': 1, 'url': 'https://a.example', 'collected_at': None, 'source': 'web'}]
+    claims = [{'claim': 'Strickland lost by split decision.', 'support': 1, 'source_ids': [1]}]
+    database = report_database(sources, claims)
+    assert '["Strickland lost by split decision.",[1]]' in database
+    assert '\n  ' not in database
+
+def test_without_claims_the_summaries_are_sent():
+    data = [{'source_id': 1, 'url': 'https://a.example', 'content': '- a fact', 'collected_at': None, 'source': 'web'}]
+    assert '"content": "- a fact"' in report_database(data)
@@ -0,0 +1,36 @@
+import cProfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents import tracing
+from agents.tracing import Profiler
+
+def run_in_threads():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        return sorted(executor.map(lambda number: sum(range(number * 1000)), range(8)))
+
+@pytest.mark.parametrize('per_thread', [True, False])
+def test_profiled_threads_run_and_the_profile_is_written(tmp_path, monkeypatch, per_thread):
+    monkeypatch.setattr(tracing, 'PER_THREAD_PROFILES', per_thread)
+    expected = run_in_threads()
+    with Profiler(str(tmp_path)):
+        assert run_in_threads() == expected
+    assert (tmp_path / 'profile.prof').exists()
+    assert 'function calls' in (tmp_path / 'profile.txt').read_text()
+
+def test_thread_profile_hook_never_raises(tmp_path, monkeypatch):
+    class Profile(cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            # As on 3.12+, where only one profiler can be active
+            if threading.current_thread() is not threading.main_thread():
+                raise ValueError("Another profiling tool is already active")
+            super().enable(*args, **kwargs)
+
+    monkeypatch.setattr(tracing, 'PER_THREAD_PROFILES', True)
+    monkeypatch.setattr(tracing.cProfile, 'Profile', Profile)
+    expected = run_in_threads()
+    with Profiler(str(tmp_path)) as profiler:
+        assert run_in_threads() == expected
+    assert len(profiler.profiles) == 1
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from agents import url_collector
+from agents.url_canonical import canonical_url, canonical_key
+from agents.url_collector import URLCollector
+
+def test_canonical_url_drops_tracking_and_variants():
+    assert canonical_url('https://M.Example.com:443/story/amp/?utm_source=x&id=2&fbclid=y&a=1#top') == \
+        'https://example.com/story?a=1&id=2'
+    assert canonical_url('https://example.com/story.amp.html') == 'https://example.com/story.html'
+    assert canonical_url('https://example.com/amp/story') == 'https://example.com/story'
+    assert canonical_url('https://example.com/') == 'https://example.com/'
+
+def test_canonical_url_keeps_short_hosts_and_real_parameters():
+    assert canonical_url('https://m.com/page') == 'https://m.com/page'
+    assert canonical_url('https://example.com/search?q=mma') != canonical_url('https://example.com/search?q=ufc')
+
+def test_canonical_key_collapses_scheme_and_www():
+    assert canonical_key('http://www.example.com/story/') == canonical_key('https://example.com/story?utm_medium=x')
+    assert canonical_key('https://example.com/story') == 'example.com/story'
+    assert canonical_key('https://example.com/story') != canonical_key('https://example.org/story')
+
+class Response:
+    def __init__(self, data=None, status_code=200, text=None):
+        self.data = data
+        self.status_code = status_code
+        self.text = text if text is not None else json.dumps(data)
+
+    def json(self):
+        if self.data is None:
+            raise ValueError("No JSON object could be decoded")
+        return self.data
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    config = {'dataforseo': {'api_login': 'login', 'api_password': 'password',
+                             'locales': [{'location_code': 1, 'language_code': 'en'},
+                                         {'location_code': 2, 'language_code': 'en'}]}}
+    (tmp_path / 'config.json').write_text(json.dumps(config))
+    monkeypatch.chdir(tmp_path)
+    return URLCollector()
+
+def serp_task(location_code, urls):
+    return {'data': {'location_code': location_code, 'language_code': 'en'},
+            'result': [{'items': [{'url': url} for url in urls]}]}
+
+def test_serp_variants_merge_but_fetch_the_first_listed_url(collector, monkeypatch):
+    tasks = [serp_task(1, ['https://m.example.com/story/amp/?utm_source=serp', 'https://other.example/a']),
+             serp_task(2, ['https://www.example.com/story', 'https://twitter.com/x/status/1'])]
+    monkeypatch.setattr(url_collector.requests, 'post', lambda *args, **kwargs: Response({'tasks': tasks}))
+    results = collector.get_serp_results('strickland fight')
+    assert [result['url'] for result in results] == ['https://m.example.com/story/amp/?utm_source=serp',
+                                                     'https://other.example/a']
+    assert results[0]['locales'] == ['1:en', '2:en']
+
+@pytest.mark.parametrize('response', [
+    Response(status_code=401, text='Unauthorized'),
+    Response(text='<html>gateway timeout</html>'),
+    Response({'status_code': 40100, 'status_message': 'Not authorized'}),
+    Response(['not', 'an', 'object']),
+])
+def test_bad_serp_responses_return_no_urls(collector, monkeypatch, response):
+    monkeypatch.setattr(url_collector.requests, 'post', lambda *args, **kwargs: response)
+    assert collector.get_serp_results('strickland fight') == []
+
+def test_failed_serp_task_is_skipped(collector, monkeypatch):
+    tasks = [{'data': {'location_code': 1}, 'status_message': 'No Search Results', 'result': None},
+             serp_task(2, ['https://example.com/a'])]
+    monkeypatch.setattr(url_collector.requests, 'post', lambda *args, **kwargs: Response({'tasks': tasks}))
+    assert [result['url'] for result in collector.get_serp_results('strickland fight')] == ['https://example.com/a']
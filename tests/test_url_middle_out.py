@@ -0,0 +1,239 @@
+from url_middle_out import (agent_failed, split_batch_response, extract_batch, read_queries, batch_file_tags,
+                            process_url_content, usable_content)
+
+def test_agent_failed_flags_error_strings():
+    assert agent_failed('')
+    assert agent_failed('  \n')
+    assert agent_failed('Error in API call: timed out')
+    assert agent_failed('API Error: rate limited')
+    assert not agent_failed('Sports: MMA analyst')
+    assert not agent_failed('1. What error did the referee make?')
+
+def test_split_batch_response_by_doc_header():
+    response = "### DOC 1\n- Strickland lost by split decision\n\n### DOC 2:\nNo relevant information found\n"
+    assert split_batch_response(response, [1, 2]) == {
+        1: '- Strickland lost by split decision',
+        2: 'No relevant information found'
+    }
+
+def test_split_batch_response_rejects_missing_doc():
+    assert split_batch_response("### DOC 1\n- a fact\n", [1, 2]) is None
+
+def test_split_batch_response_rejects_repeated_or_empty_sections():
+    assert split_batch_response("### DOC 1\n- a\n### DOC 1\n- b\n### DOC 2\n- c", [1, 2]) is None
+    assert split_batch_response("### DOC 1\n\n### DOC 2\n- c", [1, 2]) is None
+
+def test_split_batch_response_rejects_unheaded_text():
+    assert split_batch_response("- a fact with no header", [1]) is None
+
+def test_extract_batch_falls_back_to_single_requests_when_unattributable():
+    class Agent:
+        def __init__(self):
+            self.calls = []
+
+        def extract(self, prompt):
+            self.calls.append('batch')
+            return 'merged answer without headers'
+
+        def summarize(self, prompt):
+            self.calls.append('single')
+            return '- point'
+
+    agent = Agent()
+    batch = [('https://a.example/1', 'first page'), ('https://b.example/2', 'second page')]
+    assert extract_batch(batch, agent, 'strategy') == [('https://a.example/1', '- point'),
+                                                       ('https://b.example/2', '- point')]
+    assert agent.calls == ['batch', 'single', 'single']
+
+def test_read_queries_drops_case_and_punctuation_variants(tmp_path):
+    path = tmp_path / 'queries.txt'
+    path.write_text("# comment\nfoo bar?\n\nFoo bar!\nbaz\n  baz  \n")
+    assert read_queries(str(path)) == ['foo bar?', 'baz']
+
+def test_batch_file_tags_are_distinct():
+    prefix = 'a' * 50
+    tags = batch_file_tags([prefix + ' one', prefix + ' two', 'short query'])
+    assert tags == {prefix + ' one': prefix, prefix + ' two': prefix + '_2', 'short query': 'short_query'}
+
+def test_failed_extraction_is_not_a_summary():
+    class Agent:
+        def summarize(self, prompt):
+            raise RuntimeError('API Error: HTTP 500')
+
+    assert process_url_content('https://a.example/1', 'page text', Agent(), 'strategy') == ('https://a.example/1', None)
+
+def test_braces_in_content_and_strategy_reach_the_prompt_unchanged():
+    class Agent:
+        def summarize(self, prompt):
+            self.prompt = prompt
+            return '- f returns 1'
+
+    agent = Agent()
+    content = 'function f() { return 1; } and a {placeholder}'
+    strategy = '1. What does {f} return?'
+    assert process_url_content('u', content, agent, strategy) == ('u', '- f returns 1')
+    assert content in agent.prompt and strategy in agent.prompt
+
+def test_extraction_prompt_keeps_the_first_5000_characters():
+    class Agent:
+        def summarize(self, prompt):
+            self.prompt = prompt
+            return '- a point'
+
+    agent = Agent()
+    process_url_content('u', 'a' * 5000 + 'b' * 100, agent, 'strategy')
+    section = agent.prompt.split('Content to analyze:\n')[1].split('\n\nRules:')[0]
+    assert section == 'a' * 5000
+
+def test_usable_content_rejects_failed_and_stub_pages():
+    assert usable_content(None) is None
+    assert usable_content({'title': 'Error', 'content': 'x' * 1000}) is None
+    assert usable_content({'title': 'Page', 'content': 'No main content found'}) is None
+    assert usable_content({'title': 'Page', 'content': 'Subscribe to read'}) is None
+    assert usable_content({'title': 'Page', 'content': 'x' * 1000}) == 'x' * 1000
+
+def test_failed_extractions_are_backfilled_until_the_target_is_stored(tmp_path, monkeypatch):
+    import json
+    import sqlite3
+    import url_middle_out
+    from stand_ins import StandIns
+
+    stand_ins = StandIns(serp_results=10, page_words=400, page_latency=0.0, seed=1)
+    monkeypatch.chdir(tmp_path)
+    for name, value in stand_ins.api_env().items():
+        monkeypatch.setenv(name, value)
+    (tmp_path / 'config.json').write_text(json.dumps({'dataforseo': {'api_login': 'a', 'api_password': 'b'}}))
+    failed = []
+
+    def extract(batch, agent, strategy):
+        # The two best-ranked pages the pipeline extracts fail, the rest succeed
+        results = []
+        for url, _ in batch:
+            if len(failed) < 2 and url not in failed:
+                failed.append(url)
+                results.append((url, None))
+            else:
+                results.append((url, '- market growth was 5 percent'))
+        return results
+
+    monkeypatch.setattr(url_middle_out, 'process_url_batch', extract)
+    resources = url_middle_out.SharedResources(fetch_workers=2, llm_workers=2, parse_workers=0)
+    try:
+        stats = url_middle_out.process_query('market growth', None, str(tmp_path / 'run_data.db'),
+                                             '1. How fast did the market grow?', resources=resources,
+                                             show_progress=False, target=3)
+    finally:
+        resources.close()
+        stand_ins.close()
+    conn = sqlite3.connect(stats['db_path'])
+    states = dict(conn.execute("SELECT state, COUNT(*) FROM url_state GROUP BY state").fetchall())
+    conn.close()
+    assert stats['extract_failures'] == 2
+    assert states['stored'] >= 3
+    assert states['fetched'] == 2
+
+def test_prepare_calls_join_the_run_ledger_and_totals(tmp_path, monkeypatch):
+    import json
+    import sqlite3
+    import url_middle_out
+    from agents.openrouter_agent import OpenRouterAgent
+    from agents.query_index import QuerySimilarityIndex
+    from stand_ins import StandIns
+
+    stand_ins = StandIns(serp_results=3, page_words=300, page_latency=0.0, llm_latency=0.0,
+                         tokens_per_sec=100000, seed=2)
+    monkeypatch.chdir(tmp_path)
+    for name, value in stand_ins.api_env().items():
+        monkeypatch.setenv(name, value)
+    (tmp_path / 'config.json').write_text(json.dumps({'dataforseo': {'api_login': 'a', 'api_password': 'b'}}))
+    agent = OpenRouterAgent('key', 'stand-in/model')
+    resources = url_middle_out.SharedResources(fetch_workers=2, llm_workers=2, parse_workers=0)
+    usage = []
+    try:
+        strategy, _ = url_middle_out.prepare_query('market growth', agent,
+                                                   QuerySimilarityIndex(str(tmp_path / 'index.db')),
+                                                   echo=False, usage=usage)
+        stats = url_middle_out.process_query('market growth', agent, str(tmp_path / 'run_data.db'), strategy,
+                                             resources=resources, show_progress=False, target=2,
+                                             prepare_usage=usage)
+    finally:
+        resources.close()
+        stand_ins.close()
+    conn = sqlite3.connect(stats['db_path'])
+    rows = conn.execute("SELECT stage, run_id, SUM(prompt_tokens + completion_tokens) FROM usage GROUP BY stage")
+    ledger = {stage: (run_id, tokens) for stage, run_id, tokens in rows.fetchall()}
+    conn.close()
+    assert {'intent', 'strategy', 'extract'} <= set(ledger)
+    assert len({run_id for run_id, _ in ledger.values()}) == 1 and None not in ledger['intent']
+    assert stats['tokens'] == sum(tokens for _, tokens in ledger.values())
+
+def test_worker_tasks_past_their_deadline_make_no_calls(tmp_path):
+    import sqlite3
+    import time
+    from url_middle_out import create_db, run_task
+
+    class Unreachable:
+        def summarize(self, prompt):
+            raise AssertionError('LLM called past the deadline')
+
+        def scrape_url_content(self, url):
+            raise AssertionError('page fetched past the deadline')
+
+    run_db = str(tmp_path / 'run_data.db')
+    create_db(run_db)
+    conn = sqlite3.connect(run_db)
+    conn.execute("INSERT INTO queries (query, content_strategy) VALUES ('q', '1. How fast did the market grow?')")
+    conn.execute("INSERT INTO url_state (url, rank, state) VALUES ('https://a.example/1', 0, 'queued')")
+    conn.execute("INSERT INTO url_state (url, rank, state, content) VALUES ('https://a.example/2', 1, 'fetched', ?)",
+                 ('The market grew by 5 percent last year according to the survey. ' * 5,))
+    conn.commit()
+    conn.close()
+    payload = {'deadline': time.time() - 1}
+    fetch = {'run_db': run_db, 'kind': 'fetch', 'url': 'https://a.example/1', 'payload': payload, 'attempts': 1}
+    extract = {'run_db': run_db, 'kind': 'extract', 'url': 'https://a.example/2', 'payload': payload, 'attempts': 1}
+
+    assert run_task(fetch, Unreachable(), Unreachable()) == []
+    follow_up, = run_task(extract, Unreachable(), Unreachable())
+    assert follow_up['kind'] == 'store' and follow_up['payload'] == payload
+    conn = sqlite3.connect(run_db)
+    states = dict(conn.execute("SELECT url, state FROM url_state").fetchall())
+    summary = conn.execute("SELECT summary FROM url_state WHERE url = 'https://a.example/2'").fetchone()[0]
+    conn.close()
+    assert states == {'https://a.example/1': 'queued', 'https://a.example/2': 'extracted'}
+    assert 'market grew by 5 percent' in summary
+
+def test_leftover_fetches_do_not_hold_the_run_once_the_target_is_met(tmp_path, monkeypatch):
+    import json
+    import time
+    import url_middle_out
+    from stand_ins import StandIns
+
+    stand_ins = StandIns(serp_results=6, page_words=400, page_latency=0.0, seed=3)
+    monkeypatch.chdir(tmp_path)
+    for name, value in stand_ins.api_env().items():
+        monkeypatch.setenv(name, value)
+    (tmp_path / 'config.json').write_text(json.dumps({'dataforseo': {'api_login': 'a', 'api_password': 'b'}}))
+    monkeypatch.setattr(url_middle_out, 'process_url_batch', lambda batch, agent, strategy: [
+        (url, '- market growth was 5 percent') for url, _ in batch])
+    resources = url_middle_out.SharedResources(fetch_workers=4, llm_workers=2, parse_workers=0)
+    scrape = resources.scrape
+    fast = set()
+
+    def slow_leftovers(url):
+        # The first two pages asked for arrive at once, the over-fetched ones take seconds
+        if len(fast) < 2 or url in fast:
+            fast.add(url)
+            return scrape(url)
+        time.sleep(2)
+        return scrape(url)
+
+    resources.scrape = slow_leftovers
+    try:
+        stats = url_middle_out.process_query('market growth', None, str(tmp_path / 'run_data.db'),
+                                             '1. How fast did the market grow?', resources=resources,
+                                             show_progress=False, target=2)
+    finally:
+        resources.close()
+        stand_ins.close()
+    assert stats['summarized'] == 2
+    assert stats['elapsed'] < 1.5
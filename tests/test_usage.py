@@ -0,0 +1,49 @@
+from agents.usage import BudgetScheduler, TokenBudget, usage_from_response, usage_statements
+
+def test_without_budgets_everything_is_full():
+    scheduler = BudgetScheduler([None, None])
+    assert scheduler.plan(0, 10000) == ('full', 0)
+
+def test_pages_degrade_as_the_budget_runs_out():
+    scheduler = BudgetScheduler([TokenBudget(3000)], max_chars=5000, lite_chars=1500, completion_tokens=400)
+    full = scheduler.estimate(5000)
+    lite = scheduler.estimate(5000, 'lite')
+    assert full > lite > 0
+    assert scheduler.plan(0, 5000) == ('full', full)
+    assert scheduler.plan(1, 5000) == ('lite', lite)
+    assert scheduler.plan(2, 5000) == ('local', 0)
+
+def test_better_ranked_claims_are_protected():
+    budget = TokenBudget(2000)
+    scheduler = BudgetScheduler([budget])
+    scheduler.expect(0, 5000)
+    # Rank 0 has not been fetched yet, but its claim keeps rank 1 from spending the budget first
+    assert scheduler.plan(1, 5000)[0] != 'full'
+    scheduler.drop(0)
+    assert scheduler.plan(2, 5000)[0] == 'full'
+
+def test_settle_replaces_the_reservation_with_actual_usage():
+    budget = TokenBudget(10000)
+    scheduler = BudgetScheduler([budget])
+    mode, reserved = scheduler.plan(0, 5000)
+    assert budget.available() == 10000 - reserved
+    scheduler.settle(reserved, 500)
+    assert budget.available() == 9500
+
+def test_shared_budget_is_the_tighter_limit():
+    run_budget, batch_budget = TokenBudget(100000), TokenBudget(100)
+    assert BudgetScheduler([run_budget, batch_budget]).plan(0, 5000)[0] == 'local'
+
+def test_usage_is_priced_from_config_without_api_cost():
+    record = usage_from_response({'prompt_tokens': 1000, 'completion_tokens': 500}, 'm',
+                                 {'m': {'prompt': 1.0, 'completion': 2.0}})
+    assert record['cost'] == 0.002
+    assert record['cached_tokens'] == 0
+
+def test_packed_usage_is_split_across_urls():
+    record = {'run_id': 'r', 'stage': 'extract', 'url': None, 'urls': ['a', 'b'], 'model': 'm',
+              'prompt_tokens': 100, 'completion_tokens': 50, 'cached_tokens': 0, 'cost': 0.02}
+    rows = [params for _, params in usage_statements(record, 'now')]
+    assert [row[2] for row in rows] == ['a', 'b']
+    assert [row[4] for row in rows] == [50, 50]
+    assert sum(row[7] for row in rows) == 0.02
@@ -0,0 +1,73 @@
+import time
+
+from agents.work_queue import WorkQueue
+
+def make_queue(tmp_path, **kwargs):
+    return WorkQueue(str(tmp_path / 'queue.db'), **kwargs)
+
+def test_claim_takes_lowest_priority_first_and_only_once(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.enqueue_many([{'run_db': 'run', 'kind': 'fetch', 'url': 'b', 'priority': 2},
+                        {'run_db': 'run', 'kind': 'fetch', 'url': 'a', 'priority': 1}])
+    first = queue.claim('worker-1')
+    second = queue.claim('worker-2')
+    assert (first['url'], second['url']) == ('a', 'b')
+    assert queue.claim('worker-3') is None
+
+def test_duplicate_tasks_are_ignored(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.enqueue('run', 'fetch', 'a')
+    queue.enqueue('run', 'fetch', 'a')
+    assert queue.counts('run') == {'pending': 1}
+
+def test_expired_lease_is_claimable_again(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.05)
+    queue.enqueue('run', 'fetch', 'a')
+    task = queue.claim('crashed')
+    time.sleep(0.1)
+    retry = queue.claim('worker')
+    assert retry['id'] == task['id']
+    assert retry['attempts'] == 2
+    # The crashed worker no longer owns the task
+    assert not queue.heartbeat(task['id'], 'crashed')
+    assert not queue.complete(task['id'], 'crashed')
+    assert queue.complete(retry['id'], 'worker', [{'run_db': 'run', 'kind': 'extract', 'url': 'a'}])
+    assert queue.counts('run') == {'done': 1, 'pending': 1}
+
+def test_lease_expiring_too_often_fails_the_task(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.01, max_attempts=2)
+    queue.enqueue('run', 'fetch', 'a')
+    for _ in range(2):
+        assert queue.claim('crashed')
+        time.sleep(0.05)
+    assert queue.claim('worker') is None
+    assert queue.counts('run') == {'failed': 1}
+    assert queue.finished_urls('run', 'fetch') == ['a']
+
+def test_fail_retries_until_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=2)
+    queue.enqueue('run', 'extract', 'a')
+    task = queue.claim('worker')
+    queue.fail(task['id'], 'worker', 'HTTP 500', task['attempts'])
+    assert queue.counts('run') == {'pending': 1}
+    task = queue.claim('worker')
+    queue.fail(task['id'], 'worker', 'HTTP 500', task['attempts'])
+    assert queue.counts('run') == {'failed': 1}
+
+def test_clear_run_keeps_live_leases(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.enqueue_many([{'run_db': 'run', 'kind': 'fetch', 'url': url} for url in ('a', 'b')])
+    queue.enqueue('other', 'fetch', 'a')
+    leased = queue.claim('remote-worker')
+    queue.clear_run('run')
+    assert queue.counts('run') == {'leased': 1}
+    assert queue.counts('other') == {'pending': 1}
+    assert queue.complete(leased['id'], 'remote-worker')
+
+def test_cancel_pending_leaves_leased_tasks(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.enqueue_many([{'run_db': 'run', 'kind': 'fetch', 'url': url, 'priority': rank}
+                        for rank, url in enumerate('abc')])
+    queue.claim('worker')
+    assert queue.cancel_pending('run', 'fetch') == 2
+    assert queue.counts('run') == {'leased': 1}
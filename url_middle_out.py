@@ -8,12 +8,52 @@ from agents.openrouter_agent import OpenRouterAgent
 from agents.intent_filter_agent import IntentFilterAgent
 from agents.report_generator_agent import ReportGeneratorAgent
 from agents.content_strategy_agent import ContentStrategyAgent
+from agents.query_index import QuerySimilarityIndex, DEFAULT_THRESHOLD
+from agents.model_router import ModelRouter
 import json
 import re
 import concurrent.futures
 from typing import List, Dict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import datetime
+import argparse
+import sys
+import threading
+from collections import OrderedDict, deque
+from agents.db_writer import DBWriter
+from agents.work_queue import WorkQueue, LeaseHeartbeat
+from agents.tracing import tracer, submit, write_trace, Profiler, TIMINGS_TABLE, timing_statement
+import multiprocessing
+import socket
+import uuid
+from agents.crawl_frontier import CrawlFrontier
+from agents import deadline
+from agents.usage import USAGE_TABLE, usage_statements, ledger_totals, throughput, TokenBudget, BudgetScheduler
+from report_generator import ProgressiveReport, generate_final_report, content_terms
+
+# Pages at or below this length are packed together into one extraction request
+SHORT_DOC_CHARS = 1500
+BATCH_MAX_DOCS = 4
+BATCH_MAX_CHARS = 5000
+
+URL_STATES = ('queued', 'fetched', 'extracted', 'stored')
+
+# Expansion pages fetched at once, so links from later pages can still outrank earlier ones
+CRAWL_CONCURRENCY = 4
+
+# Usable pages wanted per run, and extra SERP candidates fetched alongside to absorb failures
+TARGET_PAGES = 10
+OVERFETCH = 2
+
+# Pages shorter than this are paywall stubs, consent walls or error pages rather than evidence
+MIN_PAGE_CHARS = 200
+
+# Share of a run's deadline held back for writing the report from whatever evidence is in
+REPORT_SHARE = 0.25
+
+# Tasks each worker process runs at once; they wait on the network, not the CPU
+WORKER_THREADS = 8
 
 def create_db(db_path: str):
     conn = sqlite3.connect(db_path)
@@ -22,12 +62,16 @@ def create_db(db_path: str):
     # Drop existing tables if they exist
     c.execute("DROP TABLE IF EXISTS queries")
     c.execute("DROP TABLE IF EXISTS summaries")
+    c.execute("DROP TABLE IF EXISTS url_state")
+    c.execute("DROP TABLE IF EXISTS usage")
+    c.execute("DROP TABLE IF EXISTS timings")
     
     # Create fresh tables with content_strategy in queries table
     c.execute('''CREATE TABLE queries
                  (id INTEGER PRIMARY KEY,
                   query TEXT,
                   content_strategy TEXT,
+                  stage TEXT DEFAULT 'created',
                   run_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
     c.execute('''CREATE TABLE summaries
                  (id INTEGER PRIMARY KEY,
@@ -35,6 +79,17 @@ def create_db(db_path: str):
                   summary TEXT,
                   collected_at DATETIME,
                   source TEXT)''')
+    # Per-URL checkpoint: queued -> fetched -> extracted -> stored
+    c.execute('''CREATE TABLE url_state
+                 (url TEXT PRIMARY KEY,
+                  rank INTEGER,
+                  state TEXT,
+                  title TEXT,
+                  content TEXT,
+                  summary TEXT,
+                  updated_at DATETIME)''')
+    c.execute(USAGE_TABLE)
+    c.execute(TIMINGS_TABLE)
     conn.commit()
     conn.close()
 
@@ -56,7 +111,7 @@ def middle_out_summary(agent: OpenRouterAgent, content: str, strategy: str) -> s
 {strategy}
 
 Content to analyze:
-{content}
+{content[:5000]}
 
 Rules:
 1. Only extract information that answers the verification questions
@@ -64,10 +119,8 @@ Rules:
 3. Focus on factual information only
 4. Format as bullet points"""
     
-    try:
-        return agent.summarize(prompt.format(content=content[:5000]))
-    except Exception as e:
-        return f"AI processing error: {str(e)}"
+    # Failures raise rather than come back as text, so they are never stored as a summary
+    return agent.summarize(prompt)
 
 def verify_ai_connection(agent: OpenRouterAgent):
     print("\n[AI] Verifying OpenRouter connection...")
@@ -110,151 +163,1310 @@ def print_progress(current: int, total: int):
     print(f"\rProcessing content with AI: [{'=' * progress}{' ' * (50 - progress)}] {current}/{total}", end="")
 
 def process_url_content(url, content, agent, strategy):
+    """Return (url, key_points); key_points is None when extraction failed and the page should be retried"""
     if not content:
         return url, "No content available"
     try:
         key_points = middle_out_summary(agent, content, strategy)
-        return url, key_points if key_points else "No relevant information found"
     except Exception as e:
-        return url, f"Error processing content: {str(e)}"
+        print(f"\nError processing {url}: {str(e)}")
+        return url, None
+    return url, key_points if key_points else "No relevant information found"
+
+def usable_content(page: Dict) -> str:
+    """The page's text if it is worth extracting, None for failed, empty or stub pages"""
+    if not page or page.get('title') == 'Error':
+        return None
+    content = page.get('content') or ''
+    if content == 'No main content found' or len(content) < MIN_PAGE_CHARS:
+        return None
+    return content
+
+def local_key_points(content: str, strategy: str, max_points: int = 5) -> str:
+    """Token-free extraction: the sentences sharing the most terms with the verification questions"""
+    question_terms = content_terms(strategy)
+    sentences = [sentence.strip() for sentence in re.split(r'(?<=[.!?])\s+|\n+', content) if len(sentence.strip()) > 30]
+    scored = [(len(content_terms(sentence) & question_terms), idx) for idx, sentence in enumerate(sentences)]
+    best = sorted(idx for score, idx in sorted(scored, reverse=True)[:max_points] if score > 0)
+    if not best:
+        return "No relevant information found"
+    return "\n".join(f"- {sentences[idx]}" for idx in best)
+
+def print_pipeline_progress(scraping_count: int, total_urls: int, processed_count: int, queued_count: int):
+    print(f"\rScraping: [{('=' * scraping_count) + (' ' * (total_urls - scraping_count))}] {scraping_count}/{total_urls} "
+          f"| Processing: [{('=' * processed_count) + (' ' * (queued_count - processed_count))}] {processed_count}/{queued_count}", 
+          end='', flush=True)
 
-def process_query(user_query: str, agent: OpenRouterAgent, db_path: str):
-    # Get data directory from db_path
-    data_dir = os.path.dirname(db_path)
+def middle_out_batch_summary(agent: OpenRouterAgent, documents: List[Dict], strategy: str) -> str:
+    blocks = "\n\n".join(
+        f"<<<DOC {doc['id']}>>>\n{doc['content']}\n<<<END DOC {doc['id']}>>>" for doc in documents
+    )
     
-    # Create content strategy first and store it
-    print("\nCreating content strategy...")
-    content_agent = ContentStrategyAgent(agent.api_key, agent.model)
-    strategy = content_agent.create_content_strategy(user_query)
+    prompt = f"""Extract key points from each of these documents that answer these verification questions:
+
+{strategy}
+
+Documents to analyze:
+{blocks}
+
+Rules:
+1. Only extract information that answers the verification questions
+2. Keep each point concise (1 sentence max)
+3. Focus on factual information only
+4. Format as bullet points
+5. Treat every document separately and never mix facts between documents
+6. Start each document's answer with its own header line "### DOC <id>", covering every document in order
+7. If a document has nothing relevant, write "No relevant information found" under its header"""
     
-    # Continue with URL collection
-    print(f"\nFinding URLs for: {user_query}")
-    collector = URLCollector()
-    urls = [item['url'] for item in collector.get_serp_results(user_query)]
+    return agent.extract(prompt)
+
+def split_batch_response(response: str, doc_ids: List[int]) -> Dict[int, str]:
+    """Split a packed extraction response into per-document sections, or None if it is malformed"""
+    parts = re.split(r'^\s*#{1,6}\s*DOC\s+(\d+)\s*:?\s*$', response, flags=re.MULTILINE | re.IGNORECASE)
+    sections = {}
+    for doc_id, body in zip(parts[1::2], parts[2::2]):
+        doc_id = int(doc_id)
+        if doc_id in sections or not body.strip():
+            return None
+        sections[doc_id] = body.strip()
+    if set(sections) != set(doc_ids):
+        return None
+    return sections
+
+def process_url_batch(batch: List, agent: OpenRouterAgent, strategy: str) -> List:
+    attributes = {'url': batch[0][0]} if len(batch) == 1 else {'urls': [url for url, _ in batch]}
+    with tracer.span('extract', docs=len(batch), chars=sum(len(text) for _, text in batch), **attributes):
+        return extract_batch(batch, agent, strategy)
+
+def extract_batch(batch: List, agent: OpenRouterAgent, strategy: str) -> List:
+    if len(batch) == 1:
+        url, content = batch[0]
+        return [process_url_content(url, content, agent, strategy)]
     
-    # Generate sanitized filename component
-    file_tag = sanitize_filename(user_query)
-    report_path = os.path.join(data_dir, f'{file_tag}_final_summary.txt')
+    documents = [{'id': idx + 1, 'url': url, 'content': content} for idx, (url, content) in enumerate(batch)]
+    try:
+        response = middle_out_batch_summary(agent, documents, strategy)
+        sections = split_batch_response(response, [doc['id'] for doc in documents])
+    except Exception:
+        sections = None
     
-    # Define database path
-    db_path = os.path.join(data_dir, f'{file_tag}_data.db')
-    create_db(db_path)
+    if sections is None:
+        # Packed response could not be attributed, fall back to one request per document
+        tracer.metrics.inc('batch_fallbacks_total')
+        return [process_url_content(url, content, agent, strategy) for url, content in batch]
+    return [(doc['url'], sections[doc['id']]) for doc in documents]
 
-    print("\nScraping and processing URLs...")
-    scraper = URLScraper()
-    total_urls = len(urls)
-    successful_urls = []
-    processed_count = 0
-    scraping_count = 0
+class SharedResources:
+    """Connection pools, caches and the DB writer shared by every query run in this process"""
+
+    def __init__(self, fetch_workers: int = 5, llm_workers: int = 5, page_cache_size: int = 1000,
+                 parse_workers: int = None):
+        self.collector = URLCollector()
+        # Fetch threads only do network I/O, HTML parsing goes to one process per core (0 parses in-thread)
+        if parse_workers is None:
+            parse_workers = os.cpu_count() or 1
+        self.parse_executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+        self.scraper = URLScraper(self.parse_executor)
+        self.scrape_executor = ThreadPoolExecutor(max_workers=fetch_workers)
+        self.process_executor = ThreadPoolExecutor(max_workers=llm_workers)
+        self.db_writer = DBWriter()
+        self.page_cache = OrderedDict()
+        self.page_cache_size = page_cache_size
+        self.cache_lock = threading.Lock()
+
+    def scrape(self, url: str) -> dict:
+        with self.cache_lock:
+            if url in self.page_cache:
+                self.page_cache.move_to_end(url)
+                tracer.metrics.inc('page_cache_total', result='hit')
+                return self.page_cache[url]
+        tracer.metrics.inc('page_cache_total', result='miss')
+        
+        with tracer.span('scrape', url=url):
+            content = self.scraper.scrape_url_content(url)
+        
+        # Only successful pages are cached, failures get retried by later queries
+        if content and content['title'] != 'Error':
+            with self.cache_lock:
+                self.page_cache[url] = content
+                if len(self.page_cache) > self.page_cache_size:
+                    self.page_cache.popitem(last=False)
+        return content
+
+    def close(self, wait: bool = True):
+        """wait=False leaves fetches still running (abandoned leftovers) to finish in the background"""
+        self.scrape_executor.shutdown(wait=wait)
+        self.process_executor.shutdown()
+        if self.parse_executor:
+            self.parse_executor.shutdown()
+        self.db_writer.close()
+
+def build_query_index(config: Dict) -> QuerySimilarityIndex:
+    index_config = config.get('query_index', {})
+    return QuerySimilarityIndex(
+        index_config.get('db_path', 'cache/query_index.db'),
+        threshold=index_config.get('threshold', DEFAULT_THRESHOLD),
+        ttl_seconds=int(index_config.get('ttl_hours', 24) * 3600)
+    )
+
+def build_crawl_settings(config: Dict, args) -> Dict:
+    """CrawlFrontier settings from the CLI budgets and config.json's domain policy, or None when not expanding"""
+    if not args.expand:
+        return None
+    crawl_config = config.get('crawl', {})
+    return {
+        'max_depth': args.crawl_depth,
+        'max_pages': args.crawl_pages,
+        'time_budget': args.crawl_seconds,
+        'per_domain': crawl_config.get('per_domain', 3),
+        'deny': crawl_config.get('deny', []),
+        'boost': crawl_config.get('boost', {})
+    }
+
+def agent_failed(text: str) -> bool:
+    """True for empty replies and the "Error ..." / "API Error: ..." strings agents return instead of raising"""
+    return not (text and text.strip()) or re.match(r'\s*(API )?Error\b', text, re.IGNORECASE) is not None
 
-    # Create connection for DB writes
+def prepare_query(user_query: str, agent: OpenRouterAgent, query_index: QuerySimilarityIndex, echo: bool = True,
+                  usage: List[Dict] = None):
+    """Return (strategy, domain_expert), reusing them from a recent near-duplicate query when possible.
+
+    echo=False keeps the streamed answers off stdout, for callers running several queries at once.
+    usage collects the calls' usage records; the run database does not exist yet, so the caller hands
+    them to process_query for the run's ledger."""
+    cached = query_index.lookup(user_query)
+    tracer.metrics.inc('query_index_total', result='hit' if cached else 'miss')
+    if cached:
+        print(f"\nReusing strategy from similar query: \"{cached['query']}\" (similarity {cached['similarity']:.2f})")
+        return cached['content_strategy'], cached['domain']
+    
+    prepare_id = uuid.uuid4().hex[:12]
+    unsubscribe = tracer.subscribe(lambda event, data: usage.append(data) if (
+        usage is not None and event == 'usage' and data['run_id'] == prepare_id) else None)
+    try:
+        # Determine domain expert without extra printing
+        intent_filter = IntentFilterAgent(agent.api_key, agent.model, agent.router)
+        intent_filter.echo = echo
+        with tracer.span('intent', run_id=prepare_id):
+            domain_expert = intent_filter.determine_domain(user_query)
+
+        print("\nCreating content strategy...")
+        content_agent = ContentStrategyAgent(agent.api_key, agent.model, agent.router)
+        content_agent.echo = echo
+        with tracer.span('strategy', run_id=prepare_id):
+            strategy = content_agent.create_content_strategy(user_query)
+    finally:
+        unsubscribe()
+    
+    # Only index usable results so failed API calls are not reused
+    if not agent_failed(domain_expert) and not agent_failed(strategy):
+        query_index.add(user_query, strategy, domain_expert)
+    return strategy, domain_expert
+
+def load_run_state(db_path: str) -> Dict:
+    """Read what a previous run of this database already finished"""
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    
-    # Insert query AND strategy BEFORE processing
-    c.execute('''INSERT INTO queries (query, content_strategy, run_at) 
-        VALUES (?, ?, ?)''', (user_query, strategy, datetime.datetime.now().isoformat()))
+    c.execute("SELECT query, content_strategy, stage FROM queries ORDER BY run_at DESC LIMIT 1")
+    query, strategy, stage = c.fetchone()
+    c.execute("SELECT url, state, content, summary FROM url_state ORDER BY rank")
+    # Older runs checkpointed failed fetches as 'fetched' without content, they are retried like queued ones
+    urls = [{'url': url, 'state': 'queued' if state == 'fetched' and content is None else state,
+             'content': content, 'summary': summary} for url, state, content, summary in c.fetchall()]
+    c.execute("SELECT url, summary, collected_at, source FROM summaries")
+    summaries = c.fetchall()
+    # Runs checkpointed before usage tracking have no ledger (or timings) yet
+    c.execute(USAGE_TABLE)
+    c.execute(TIMINGS_TABLE)
+    c.execute("SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage")
+    tokens = c.fetchone()[0]
     conn.commit()
+    conn.close()
+    return {'query': query, 'strategy': strategy, 'stage': stage, 'urls': urls, 'summaries': summaries,
+            'tokens': tokens}
 
-    # Create two thread pools - one for scraping and one for processing
-    with ThreadPoolExecutor(max_workers=5) as scrape_executor, \
-         ThreadPoolExecutor(max_workers=5) as process_executor:
-        
+def start_run(user_query: str, agent: OpenRouterAgent, db_path: str, strategy: str, collector: URLCollector,
+              resume: bool = False) -> Dict:
+    """Create (or reopen, when resuming) the run database and checkpoint its SERP results"""
+    # Pick up the previous run's checkpoints instead of starting over
+    previous = load_run_state(db_path) if resume else None
+    if previous:
+        strategy = previous['strategy']
+
+    # Create content strategy first and store it, unless reused from a similar query
+    if not strategy:
+        print("\nCreating content strategy...")
+        content_agent = ContentStrategyAgent(agent.api_key, agent.model, agent.router)
+        strategy = content_agent.create_content_strategy(user_query)
+
+    if not previous:
+        create_db(db_path)
+
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+
+    if not previous:
+        # Insert query AND strategy BEFORE processing
+        c.execute('''INSERT INTO queries (query, content_strategy, run_at)
+            VALUES (?, ?, ?)''', (user_query, strategy, datetime.datetime.now().isoformat()))
+        conn.commit()
+
+    if previous and previous['stage'] != 'created':
+        url_states = previous['urls']
+        print(f"\nResuming {user_query}: " + ", ".join(
+            f"{sum(1 for u in url_states if u['state'] == state)} {state}" for state in URL_STATES))
+    else:
+        # Continue with URL collection
+        print(f"\nFinding URLs for: {user_query}")
+        with tracer.span('serp', query=user_query) as span:
+            urls = [item['url'] for item in collector.get_serp_results(user_query)]
+            span.set(results=len(urls))
+        url_states = [{'url': url, 'state': 'queued', 'content': None, 'summary': None} for url in urls]
+        # Checkpoint the SERP so a resumed run never pays for it again
+        c.executemany('''INSERT OR IGNORE INTO url_state (url, rank, state, updated_at) VALUES (?, ?, 'queued', ?)''',
+                      [(url, rank, datetime.datetime.now().isoformat()) for rank, url in enumerate(urls)])
+        c.execute("UPDATE queries SET stage = 'collected'")
+        conn.commit()
+    conn.close()
+
+    return {
+        'db_path': db_path,
+        'strategy': strategy,
+        'url_states': url_states,
+        'previous': previous
+    }
+
+def process_query(user_query: str, agent: OpenRouterAgent, db_path: str, strategy: str = None,
+                  progressive: ProgressiveReport = None, resources: SharedResources = None,
+                  show_progress: bool = True, on_progress=None, resume: bool = False,
+                  token_budget: int = None, budget: TokenBudget = None, crawl: Dict = None,
+                  report_share: float = REPORT_SHARE, target: int = TARGET_PAGES,
+                  prepare_usage: List[Dict] = None) -> Dict:
+    """Scrape and extract one query's SERP until target pages are extracted, backfilling pages whose
+    fetch or extraction failed from lower-ranked results. token_budget caps this run's extraction tokens and
+    budget is a TokenBudget shared with other runs (e.g. a whole batch). crawl holds CrawlFrontier
+    settings to also follow relevant outbound links. prepare_usage holds prepare_query's usage
+    records, written to the run's ledger and counted in its totals.
+
+    Under a deadline (see agents.deadline.run_deadline) the pipeline stops at report_share of
+    the remaining time before it, cancelling stragglers, so the report still fits."""
+    # Every span opened by this run (and by the pool threads working for it) carries its run_id
+    with deadline.reserve(report_share), tracer.span('run', run_id=uuid.uuid4().hex[:12], query=user_query):
+        return run_pipeline(user_query, agent, db_path, strategy, progressive, resources, show_progress,
+                            on_progress, resume, token_budget, budget, crawl, target, prepare_usage)
+
+def run_pipeline(user_query: str, agent: OpenRouterAgent, db_path: str, strategy: str,
+                 progressive: ProgressiveReport, resources: SharedResources, show_progress: bool,
+                 on_progress, resume: bool, token_budget: int, budget: TokenBudget, crawl: Dict,
+                 target: int, prepare_usage: List[Dict]) -> Dict:
+    start_time = time.time()
+    run_id = tracer.current().attributes['run_id']
+
+    # Standalone runs get their own pools, batch runs share them across queries
+    owns_resources = resources is None
+    if owns_resources:
+        resources = SharedResources()
+
+    try:
+        run = start_run(user_query, agent, db_path, strategy, resources.collector, resume)
+    except Exception:
+        if owns_resources:
+            resources.close()
+        raise
+    db_path = run['db_path']
+    strategy = run['strategy']
+    url_states = run['url_states']
+    previous = run['previous']
+
+    # All writes go through the shared writer thread
+    writer = resources.db_writer
+
+    # Pages are extracted in full only while the budgets cover them, best SERP ranks first
+    run_budget = None
+    if token_budget:
+        run_budget = TokenBudget(token_budget, used=previous['tokens'] if previous else 0)
+    scheduler = BudgetScheduler([run_budget, budget], strategy_chars=len(strategy), lite_chars=SHORT_DOC_CHARS)
+    rank_of = {entry['url']: rank for rank, entry in enumerate(url_states)}
+    for rank, entry in enumerate(url_states):
+        # Queued candidates only claim budget once they are actually scheduled
+        if entry['state'] == 'fetched' and entry['content']:
+            scheduler.expect(rank, len(entry['content']))
+    reservations = {}
+    modes = {mode: 0 for mode in BudgetScheduler.MODES}
+    usage_lock = threading.Lock()
+    url_tokens = {}
+    usage_totals = {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0, 'cost': 0.0}
+
+    # Optional expansion through outbound links; ranks continue after the SERP's
+    frontier = None
+    if crawl:
+        settings = dict(crawl)
+        settings['deny'] = list(settings.get('deny', [])) + resources.collector.social_media_domains
+        frontier = CrawlFrontier(content_terms(strategy), **settings)
+        frontier.add_seen(entry['url'] for entry in url_states)
+    url_depth = {}
+    next_rank = len(url_states)
+    expansion_futures = set()
+
+    if progressive and previous:
+        for row in previous['summaries']:
+            progressive.add_summary(*row)
+
+    print("\nScraping and processing URLs...")
+    successful_urls = [u['url'] for u in url_states if u['state'] != 'queued']
+    # URLs scheduled for fetching; the rest of the SERP is held back for backfill
+    total_urls = len(successful_urls)
+    processed_count = sum(1 for u in url_states if u['state'] == 'stored')
+    summarized_count = processed_count
+    scraping_count = len(successful_urls)
+    # Tasks cancelled when the deadline hit
+    cut_short = 0
+    # Pages whose LLM extraction failed; they stay 'fetched' for a resumed run to extract
+    extract_failures = 0
+    
+    # SERP candidates in rank order, fetched until target pages are extracted
+    candidates = deque(entry['url'] for entry in url_states if entry['state'] == 'queued')
+    # A candidate counts toward the target once extracted; until then a fetched page is still in flight,
+    # since its extraction can fail and leave a slot for the next rank
+    successes = sum(1 for entry in url_states if entry['state'] in ('extracted', 'stored'))
+    extracting = {entry['url'] for entry in url_states if entry['state'] == 'fetched' and entry['content']}
+    candidate_futures = set()
+    fetch_failures = 0
+
+    def set_state(url: str, state: str, **fields):
+        columns = ''.join(f", {name} = ?" for name in fields)
+        return (f"UPDATE url_state SET state = ?, updated_at = ?{columns} WHERE url = ?",
+                (state, datetime.datetime.now().isoformat(), *fields.values(), url))
+
+    def on_event(event: str, data: Dict):
+        # Progress display, the usage ledger and stage timings are consumers of this run's trace events
+        if event == 'span':
+            if data['span'].attributes.get('run_id') == run_id:
+                writer.execute(db_path, *timing_statement(data['span']))
+            return
+        if data.get('run_id') != run_id:
+            return
+        if event == 'usage':
+            writer.execute_all(db_path, usage_statements(data, datetime.datetime.now().isoformat()))
+            urls = data['urls'] or [data['url']]
+            with usage_lock:
+                for key in usage_totals:
+                    usage_totals[key] += data[key]
+                for url in urls:
+                    url_tokens[url] = url_tokens.get(url, 0) + (
+                        data['prompt_tokens'] + data['completion_tokens']) / len(urls)
+            return
+        if event != 'progress':
+            return
+        if show_progress:
+            print_pipeline_progress(data['scraped'], data['total_urls'], data['processed'], data['queued'])
+        if on_progress:
+            on_progress({key: value for key, value in data.items() if key != 'run_id'})
+    
+    unsubscribe = tracer.subscribe(on_event)
+    # The intent and strategy calls ran before this run existed, they join its ledger now
+    for record in prepare_usage or []:
+        on_event('usage', {**record, 'run_id': run_id})
+
+    def store_summary(url: str, key_points: str):
+        nonlocal summarized_count, successes
+        collected_at = datetime.datetime.now().isoformat()
+        # The summary row and its 'stored' checkpoint are committed together
+        writer.execute_all(db_path, [
+            ('''INSERT INTO summaries
+                (url, summary, collected_at, source)
+                VALUES (?, ?, ?, ?)''', (url, key_points, collected_at, 'web')),
+            set_state(url, 'stored')
+        ])
+        summarized_count += 1
+        if url in extracting:
+            extracting.discard(url)
+            successes += 1
+        if progressive:
+            progressive.add_summary(url, key_points, collected_at, 'web')
+
+    try:
         # Track all futures
         scraping_futures = {}
         processing_futures = {}
-        
-        # Submit all URLs for scraping
-        for url in urls:
-            future = scrape_executor.submit(scraper.scrape_url_content, url)
-            scraping_futures[future] = url
-        
-        print("\nScraping and Processing URLs...")
-        print("Progress:")
-        
-        # Process scraping results as they complete
-        for future in as_completed(scraping_futures):
-            try:
-                url = scraping_futures[future]
-                content = future.result()
-                scraping_count += 1
-                
-                if content and content['content']:
-                    successful_urls.append(url)
-                    # Immediately submit for AI processing
-                    process_future = process_executor.submit(
-                        process_url_content, 
-                        url, 
-                        content['content'], 
-                        agent, 
-                        strategy
-                    )
-                    processing_futures[process_future] = url
-                
-                # Update both progress bars on same line
-                print(f"\rScraping: [{('=' * scraping_count) + (' ' * (total_urls - scraping_count))}] {scraping_count}/{total_urls} "
-                      f"| Processing: [{('=' * processed_count) + (' ' * (len(successful_urls) - processed_count))}] {processed_count}/{len(successful_urls)}", 
-                      end='', flush=True)
-                
-            except Exception as e:
-                print(f"\nError scraping {url}: {str(e)}")
-                continue
+        batch_texts = {}
+    
+        # Short pages wait here until enough of them fill one extraction request
+        pending_batch = []
+    
+        def show():
+            tracer.emit('progress', run_id=run_id, scraped=scraping_count, total_urls=total_urls,
+                        processed=processed_count, queued=len(successful_urls))
+    
+        def submit_batch(batch):
+            process_future = submit(resources.process_executor, process_url_batch, batch, agent, strategy)
+            processing_futures[process_future] = [url for url, _ in batch]
+            batch_texts[process_future] = batch
+    
+        def settle(url: str):
+            reserved = reservations.pop(url, 0)
+            with usage_lock:
+                actual = url_tokens.get(url)
+            # Without a usage block from the API the estimate stands in for the real count
+            scheduler.settle(reserved, round(actual) if actual is not None else reserved)
+    
+        def summarize_locally(url: str, text: str):
+            nonlocal processed_count
+            key_points = local_key_points(text, strategy)
+            writer.execute(db_path, *set_state(url, 'extracted', summary=key_points))
+            store_summary(url, key_points)
+            processed_count += 1
 
-            # Check for completed processing tasks
-            for process_future in list(processing_futures.keys()):
-                if process_future.done():
-                    try:
-                        url = processing_futures[process_future]
-                        url, key_points = process_future.result()
-                        
+        def queue_for_processing(url: str, text: str):
+            nonlocal pending_batch
+            if deadline.expired():
+                # Out of time for LLM calls, a token-free summary still adds the page's evidence
+                scheduler.drop(rank_of[url])
+                mode, reservations[url] = 'local', 0
+            else:
+                mode, reservations[url] = scheduler.plan(rank_of[url], len(text))
+            modes[mode] += 1
+            if mode == 'local':
+                # Budget exhausted: keep going with a token-free summary instead of failing
+                summarize_locally(url, text)
+                settle(url)
+                return
+            if mode == 'lite':
+                text = text[:scheduler.lite_chars]
+            if len(text) <= SHORT_DOC_CHARS:
+                pending_batch.append((url, text))
+                if (len(pending_batch) >= BATCH_MAX_DOCS or
+                        sum(len(t) for _, t in pending_batch) >= BATCH_MAX_CHARS):
+                    submit_batch(pending_batch)
+                    pending_batch = []
+            else:
+                # Immediately submit for AI processing
+                submit_batch([(url, text)])
+    
+        def collect_processed(futures):
+            nonlocal processed_count, extract_failures
+            for process_future in futures:
+                texts = dict(batch_texts[process_future])
+                try:
+                    for url, key_points in process_future.result():
+                        if not key_points and deadline.expired():
+                            # Queued LLM calls that start past the deadline fail, the page itself did not
+                            summarize_locally(url, texts[url])
+                            modes['local'] += 1
+                            continue
                         if key_points:
-                            c.execute('''INSERT INTO summaries
-                                (url, summary, collected_at, source)
-                                VALUES (?, ?, ?, ?)''',
-                                (url, key_points, datetime.datetime.now().isoformat(), 'web')
-                            )
-                            conn.commit()
-                        
+                            writer.execute(db_path, *set_state(url, 'extracted', summary=key_points))
+                            store_summary(url, key_points)
+                        else:
+                            extract_failures += 1
                         processed_count += 1
-                        del processing_futures[process_future]
-                        
-                        # Update both progress bars
-                        print(f"\rScraping: [{('=' * scraping_count) + (' ' * (total_urls - scraping_count))}] {scraping_count}/{total_urls} "
-                              f"| Processing: [{('=' * processed_count) + (' ' * (len(successful_urls) - processed_count))}] {processed_count}/{len(successful_urls)}", 
-                              end='', flush=True)
-                        
-                    except Exception as e:
-                        print(f"\nError processing {url}: {str(e)}")
-                        continue
-
-        # Wait for any remaining processing tasks
-        for future in as_completed(processing_futures):
+                except Exception as e:
+                    print(f"\nError processing {', '.join(processing_futures[process_future])}: {str(e)}")
+                for url in processing_futures[process_future]:
+                    # Stored pages already left; a failed one frees its slot for a backfill candidate
+                    extracting.discard(url)
+                    settle(url)
+                del processing_futures[process_future]
+                del batch_texts[process_future]
+                show()
+    
+        def cancel_stragglers(scrapes):
+            """At the deadline: drop unfinished fetches, summarize pages still waiting on the LLM locally"""
+            nonlocal cut_short
+            cut_short = len(scrapes) + len(processing_futures)
+            for future in scrapes:
+                future.cancel()
+                scheduler.drop(rank_of[scraping_futures[future]])
+            tracer.metrics.inc('deadline_cancelled_total', len(scrapes), stage='fetch')
+            tracer.metrics.inc('deadline_cancelled_total', len(processing_futures), stage='extract')
+            for process_future, batch in list(batch_texts.items()):
+                # Running calls end on their own timeouts, their late results are ignored
+                process_future.cancel()
+                for url, text in batch:
+                    summarize_locally(url, text)
+                    modes['local'] += 1
+                    settle(url)
+                del processing_futures[process_future]
+                del batch_texts[process_future]
+            show()
+    
+        def finish_extractions():
+            """Send whatever short pages are left (or summarize them locally when out of time) and wait for
+            every extraction still running"""
+            nonlocal pending_batch, cut_short
+            if pending_batch and deadline.expired():
+                cut_short += len(pending_batch)
+                tracer.metrics.inc('deadline_cancelled_total', len(pending_batch), stage='extract')
+                for url, text in pending_batch:
+                    summarize_locally(url, text)
+                    modes['local'] += 1
+                    settle(url)
+                pending_batch = []
+                show()
+            if pending_batch:
+                submit_batch(pending_batch)
+                pending_batch = []
             try:
-                url = processing_futures[future]
-                url, key_points = future.result()
+                collect_processed(as_completed(list(processing_futures), timeout=deadline.remaining()))
+            except FutureTimeoutError:
+                cancel_stragglers([])
+
+        # Finish checkpointed work first: stored URLs are skipped entirely
+        for entry in url_states:
+            if entry['state'] == 'extracted':
+                store_summary(entry['url'], entry['summary'])
+                processed_count += 1
+            elif entry['state'] == 'fetched' and entry['content']:
+                queue_for_processing(entry['url'], entry['content'])
+    
+        def submit_candidates() -> set:
+            """Fetch SERP candidates best rank first, keeping just enough in flight to reach the target"""
+            nonlocal total_urls
+            started = set()
+            while (candidates and successes + len(extracting) < target
+                   and successes + len(extracting) + len(candidate_futures) < target + OVERFETCH
+                   and not deadline.expired()):
+                url = candidates.popleft()
+                scheduler.expect(rank_of[url])
+                total_urls += 1
+                future = submit(resources.scrape_executor, resources.scrape, url)
+                scraping_futures[future] = url
+                candidate_futures.add(future)
+                started.add(future)
+            return started
+    
+        if show_progress:
+            print("\nScraping and Processing URLs...")
+            print("Progress:")
+    
+        def submit_expansions() -> set:
+            """Start fetching the best frontier links, a few at a time so later pages' links still compete"""
+            nonlocal total_urls, next_rank
+            started = set()
+            while frontier and len(expansion_futures) < CRAWL_CONCURRENCY and not deadline.expired():
+                candidate = frontier.next()
+                if not candidate:
+                    break
+                url, depth, score = candidate
+                rank_of[url], url_depth[url] = next_rank, depth
+                scheduler.expect(next_rank)
+                writer.execute(db_path, '''INSERT OR IGNORE INTO url_state (url, rank, state, updated_at)
+                                           VALUES (?, ?, 'queued', ?)''',
+                               (url, next_rank, datetime.datetime.now().isoformat()))
+                next_rank += 1
+                total_urls += 1
+                tracer.metrics.inc('crawl_expansions_total')
+                future = submit(resources.scrape_executor, resources.scrape, url)
+                scraping_futures[future] = url
+                expansion_futures.add(future)
+                started.add(future)
+            return started
+    
+        def backfill() -> set:
+            """Once nothing is left to fetch, wait for the running extractions and replace the ones that failed"""
+            if not candidates or successes >= target or deadline.expired():
+                return set()
+            finish_extractions()
+            return submit_candidates() | submit_expansions()
+
+        # Process scraping results as they complete; failed pages are backfilled from lower ranks and
+        # crawl expansion adds pages while its budgets last
+        pending_scrapes = submit_candidates() | submit_expansions() or backfill()
+        while pending_scrapes:
+            done, pending_scrapes = wait(pending_scrapes, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                # Deadline reached with fetches still out
+                cancel_stragglers(pending_scrapes)
+                break
+            for future in done:
+                expansion_futures.discard(future)
+                is_candidate = future in candidate_futures
+                candidate_futures.discard(future)
+                try:
+                    url = scraping_futures[future]
+                    content = future.result()
+                    scraping_count += 1
+                    text = usable_content(content)
+                    # Failed fetches stay 'queued' so a resumed run tries them again
+                    writer.execute(db_path, *set_state(url, 'fetched' if text else 'queued',
+                                                       title=content['title'] if content else None, content=text))
                 
-                if key_points:
-                    c.execute('''INSERT INTO summaries
-                        (url, summary, collected_at, source)
-                        VALUES (?, ?, ?, ?)''',
-                        (url, key_points, datetime.datetime.now().isoformat(), 'web')
-                    )
-                    conn.commit()
+                    if text:
+                        successful_urls.append(url)
+                        if is_candidate:
+                            extracting.add(url)
+                        queue_for_processing(url, text)
+                    else:
+                        fetch_failures += 1
+                        scheduler.drop(rank_of[url])
+                    if frontier and content:
+                        frontier.offer(content.get('links'), url_depth.get(url, 0))
                 
-                processed_count += 1
-                # Final progress update
-                print(f"\rScraping: [{('=' * total_urls)}] {total_urls}/{total_urls} "
-                      f"| Processing: [{('=' * processed_count) + (' ' * (len(successful_urls) - processed_count))}] {processed_count}/{len(successful_urls)}", 
-                      end='', flush=True)
+                    # Update both progress bars on same line
+                    show()
                 
-            except Exception as e:
-                print(f"\nError processing {url}: {str(e)}")
-                continue
+                except Exception as e:
+                    print(f"\nError scraping {url}: {str(e)}")
+                    fetch_failures += 1
+                    scheduler.drop(rank_of[url])
+                    continue
+
+                # Check for completed processing tasks
+                collect_processed([f for f in list(processing_futures) if f.done()])
+            if successes + len(extracting) >= target and candidate_futures:
+                # Enough pages fetched, the over-fetched leftovers are not needed unless an extraction fails;
+                # they go back to the front of the candidates for that. Running ones are not waited for,
+                # their pages stay 'queued' and a backfill is served from the page cache once they land
+                for future in candidate_futures:
+                    future.cancel()
+                    scheduler.drop(rank_of[scraping_futures[future]])
+                tracer.metrics.inc('fetch_leftovers_cancelled_total', len(candidate_futures))
+                pending_scrapes -= candidate_futures
+                candidates.extendleft(sorted((scraping_futures[future] for future in candidate_futures),
+                                             key=rank_of.get, reverse=True))
+                total_urls -= len(candidate_futures)
+                candidate_futures.clear()
+            pending_scrapes |= submit_candidates() | submit_expansions()
+            if not pending_scrapes:
+                pending_scrapes = backfill()
+
+        finish_extractions()
+        # Pages whose extraction failed keep the run open for --resume
+        writer.execute(db_path, '''UPDATE queries SET stage = 'complete' WHERE NOT EXISTS
+                                   (SELECT 1 FROM url_state WHERE state IN ('fetched', 'extracted'))''')
+    finally:
+        unsubscribe()
+        # Commit everything for this run before anyone reads the database
+        writer.close_db(db_path)
+        if owns_resources:
+            # Leftover fetches abandoned once the target was met do not hold up the run
+            resources.close(wait=False)
+    tokens = usage_totals['prompt_tokens'] + usage_totals['completion_tokens']
+    rates = throughput(summarized_count, tokens, usage_totals['cost'])
+    if show_progress:
+        print("\nProcessing complete")
+        if cut_short:
+            print(f"Deadline reached: {cut_short} unfinished tasks cancelled, pending pages summarized locally")
+        print_usage(tokens, usage_totals, rates, modes)
+    
+    return {
+        'query': user_query,
+        'db_path': db_path,
+        'urls': total_urls,
+        'scraped': len(successful_urls),
+        'summarized': summarized_count,
+        'expanded': frontier.taken if frontier else 0,
+        'candidates': len(url_states),
+        'fetch_failures': fetch_failures,
+        'extract_failures': extract_failures,
+        'cut_short': cut_short,
+        'elapsed': time.time() - start_time,
+        **usage_totals,
+        'tokens': tokens,
+        'extraction_modes': modes,
+        **rates
+    }
+
+def print_usage(tokens: int, usage: Dict, rates: Dict, modes: Dict = None):
+    print(f"Tokens: {usage['prompt_tokens']} prompt ({usage['cached_tokens']} cached) + "
+          f"{usage['completion_tokens']} completion = {tokens}, cost ${usage['cost']:.4f}")
+    per_1k = f"{rates['pages_per_1k_tokens']:.2f}" if rates['pages_per_1k_tokens'] is not None else 'n/a'
+    per_dollar = f"{rates['pages_per_dollar']:.1f}" if rates['pages_per_dollar'] is not None else 'n/a'
+    print(f"Throughput: {per_1k} pages per 1k tokens, {per_dollar} pages per $")
+    if modes and (modes['lite'] or modes['local']):
+        print(f"Budget: {modes['full']} full, {modes['lite']} lite, {modes['local']} local extractions")
+
+def count_report_usage(stats: Dict):
+    """Fold the report's tokens, which generate_final_report adds to the run's ledger, into the run's stats"""
+    usage = ledger_totals(stats['db_path'])
+    tokens = usage['prompt_tokens'] + usage['completion_tokens']
+    stats.update(usage, tokens=tokens, **throughput(stats['summarized'], tokens, usage['cost']))
+
+def run_task(task: Dict, agent: OpenRouterAgent, scraper: URLScraper) -> List[Dict]:
+    """Run one queued stage for one URL and return its follow-up tasks.
+
+    Every stage first checks the URL's checkpoint, so a task re-run after an
+    expired lease never redoes work that was already committed. A run's deadline
+    travels in the task payload as an absolute time and bounds the stage's calls."""
+    run_db, url = task['run_db'], task['url']
+    end = task['payload'].get('deadline')
+    spans = []
+
+    def collect(event: str, data: Dict):
+        # Other threads of this worker publish their spans too, keep this task's own
+        if event == 'span' and data['span'].attributes.get('run_id') == run_db and \
+                data['span'].attributes.get('url') == url:
+            spans.append(data['span'])
+
+    unsubscribe = tracer.subscribe(collect)
+    try:
+        with deadline.run_deadline(end - time.time() if end else None), \
+                tracer.span(task['kind'], run_id=run_db, url=url, attempt=task['attempts']):
+            return run_task_stage(task, agent, scraper)
+    finally:
+        unsubscribe()
+        record_timings(run_db, spans)
+
+def record_timings(run_db: str, spans: List):
+    conn = sqlite3.connect(run_db, timeout=30)
+    try:
+        c = conn.cursor()
+        c.execute(TIMINGS_TABLE)
+        for span in spans:
+            c.execute(*timing_statement(span))
+        conn.commit()
+    finally:
+        conn.close()
+
+def run_task_stage(task: Dict, agent: OpenRouterAgent, scraper: URLScraper) -> List[Dict]:
+    run_db, url = task['run_db'], task['url']
+    conn = sqlite3.connect(run_db, timeout=30)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT state, rank, content, summary FROM url_state WHERE url = ?", (url,))
+        state, rank, content, summary = c.fetchone()
+        done = URL_STATES.index(state)
+        now = datetime.datetime.now().isoformat()
+        
+        if task['kind'] == 'fetch':
+            if done < URL_STATES.index('fetched'):
+                if deadline.expired():
+                    # Claimed after the run's cutoff, the page stays 'queued' for a resumed run
+                    return []
+                page = scraper.scrape_url_content(url)
+                content = usable_content(page)
+                # Failed fetches stay 'queued' for a resumed run, as in process_query
+                c.execute("UPDATE url_state SET state = ?, title = ?, content = ?, updated_at = ? WHERE url = ?",
+                          ('fetched' if content else 'queued', page['title'] if page else None, content, now, url))
+                conn.commit()
+            return [{'run_db': run_db, 'kind': 'extract', 'url': url, 'priority': rank - 1000,
+                     'payload': task['payload']}] if content else []
+        
+        if task['kind'] == 'extract':
+            if done < URL_STATES.index('extracted'):
+                c.execute("SELECT content_strategy FROM queries ORDER BY run_at DESC LIMIT 1")
+                strategy = c.fetchone()[0]
+                # Usage events carry the run and URL of the span they were made under
+                usage = []
+                unsubscribe = tracer.subscribe(lambda event, data: usage.append(data) if (
+                    event == 'usage' and data['run_id'] == run_db and data['url'] == url) else None)
+                try:
+                    if deadline.expired():
+                        # Out of time for LLM calls, a token-free summary still adds the page's evidence
+                        summary = local_key_points(content, strategy)
+                    else:
+                        with tracer.span('extract', docs=1):
+                            _, summary = process_url_content(url, content, agent, strategy)
+                        if summary is None and deadline.expired():
+                            # Calls cut off by the deadline fail, the page itself did not
+                            summary = local_key_points(content, strategy)
+                finally:
+                    unsubscribe()
+                for record in usage:
+                    for statement, params in usage_statements(record, now):
+                        c.execute(statement, params)
+                if summary is None:
+                    # Tokens spent are still recorded; the page stays 'fetched' and the queue retries the task
+                    conn.commit()
+                    raise RuntimeError(f"Extraction failed for {url}")
+                c.execute("UPDATE url_state SET state = 'extracted', summary = ?, updated_at = ? WHERE url = ?",
+                          (summary, now, url))
+                conn.commit()
+            return [{'run_db': run_db, 'kind': 'store', 'url': url, 'priority': rank - 2000,
+                     'payload': task['payload']}]
+        
+        if task['kind'] == 'store' and done < URL_STATES.index('stored'):
+            # Summary row and checkpoint commit together
+            c.execute('''INSERT INTO summaries (url, summary, collected_at, source) VALUES (?, ?, ?, ?)''',
+                      (url, summary, now, 'web'))
+            c.execute("UPDATE url_state SET state = 'stored', updated_at = ? WHERE url = ?", (now, url))
+            conn.commit()
+        return []
+    finally:
+        conn.close()
+
+def run_worker(queue_path: str, stop_event=None, idle_exit: float = None, trace_dir: str = None,
+               threads: int = WORKER_THREADS):
+    """Claim and run tasks from the shared work queue until stopped"""
+    try:
+        serve_queue(queue_path, stop_event, idle_exit, threads)
+    finally:
+        # Each worker process has its own tracer, so it writes its own trace files
+        if trace_dir:
+            write_trace(trace_dir, f'worker-{os.getpid()}_trace')
 
+def serve_queue(queue_path: str, stop_event=None, idle_exit: float = None, threads: int = WORKER_THREADS):
+    """Run threads task loops in this process, sharing one agent, scraper and connection pool"""
+    with open('config.json') as config_file:
+        config = json.load(config_file)
+    agent = OpenRouterAgent(
+        config['openrouter']['api_key'],
+        config['openrouter']['model'],
+        ModelRouter.from_config(config)
+    )
+    scraper = URLScraper()
+    queue = WorkQueue(queue_path)
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+    loops = [threading.Thread(target=serve_tasks, daemon=True,
+                              args=(queue, agent, scraper, f"{owner}-{number}", stop_event, idle_exit))
+             for number in range(max(1, threads))]
+    for loop in loops:
+        loop.start()
+    for loop in loops:
+        loop.join()
+
+def serve_tasks(queue: WorkQueue, agent: OpenRouterAgent, scraper: URLScraper, owner: str, stop_event=None,
+                idle_exit: float = None):
+    idle_since = time.time()
+    
+    while not (stop_event and stop_event.is_set()):
+        task = queue.claim(owner)
+        if not task:
+            if idle_exit is not None and time.time() - idle_since > idle_exit:
+                return
+            time.sleep(0.5)
+            continue
+        idle_since = time.time()
+        try:
+            with LeaseHeartbeat(queue, task['id'], owner) as heartbeat:
+                next_tasks = run_task(task, agent, scraper)
+            # A lost lease means another worker took over, its run will enqueue the follow-ups
+            if not heartbeat.lost:
+                queue.complete(task['id'], owner, next_tasks)
+        except Exception as e:
+            print(f"\n[{owner}] {task['kind']} failed for {task['url']}: {str(e)}")
+            tracer.metrics.inc('task_failures_total', kind=task['kind'])
+            queue.fail(task['id'], owner, str(e), task['attempts'])
+
+def process_query_workers(user_query: str, agent: OpenRouterAgent, db_path: str, strategy: str = None,
+                          workers: int = 4, queue_path: str = 'cache/work_queue.db', resume: bool = False,
+                          progressive: ProgressiveReport = None, trace_dir: str = None,
+                          target: int = TARGET_PAGES, threads: int = WORKER_THREADS,
+                          prepare_usage: List[Dict] = None, report_share: float = REPORT_SHARE) -> Dict:
+    """Run the fetch/extract/store stages for one query across worker processes, threads tasks at a time each.
+
+    Under a deadline the coordinator stops at report_share of the remaining time before it, as
+    process_query does: fetches no worker has claimed are cancelled, and since every task carries
+    the cutoff, workers end their calls there and summarize the pages still waiting locally."""
+    with deadline.reserve(report_share):
+        return run_workers(user_query, agent, db_path, strategy, workers, queue_path, resume, progressive,
+                           trace_dir, target, threads, prepare_usage)
+
+def run_workers(user_query: str, agent: OpenRouterAgent, db_path: str, strategy: str, workers: int,
+                queue_path: str, resume: bool, progressive: ProgressiveReport, trace_dir: str, target: int,
+                threads: int, prepare_usage: List[Dict]) -> Dict:
+    start_time = time.time()
+    cutoff = deadline.current()
+    # Workers run in other processes, the cutoff reaches them as an absolute time in each task
+    payload = {'deadline': cutoff.end} if cutoff else {}
+    run = start_run(user_query, agent, db_path, strategy, URLCollector(), resume)
+    run_db = run['db_path']
+    
+    # Worker processes write to the run database concurrently
+    conn = sqlite3.connect(run_db)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Workers key their usage by the run database, the intent and strategy calls join the same ledger
+    now = datetime.datetime.now().isoformat()
+    for record in prepare_usage or []:
+        for statement, params in usage_statements({**record, 'run_id': run_db}, now):
+            conn.execute(statement, params)
+    conn.commit()
+    conn.close()
+    
+    # The URL checkpoints are the source of truth, rebuild this run's tasks from them (tasks other
+    # workers still hold leases on are left to finish)
+    queue = WorkQueue(queue_path)
+    queue.clear_run(run_db)
+    next_kind = {'fetched': 'extract', 'extracted': 'store'}
+    queue.enqueue_many([
+        {'run_db': run_db, 'kind': next_kind[entry['state']], 'url': entry['url'], 'priority': rank,
+         'payload': payload}
+        for rank, entry in enumerate(run['url_states'])
+        if entry['state'] in next_kind and (entry['state'] != 'fetched' or entry['content'])
+    ])
+    
+    # SERP candidates are fetched best rank first, only as many as the target still needs
+    ranks = {entry['url']: rank for rank, entry in enumerate(run['url_states'])}
+    candidates = deque(entry['url'] for entry in run['url_states'] if entry['state'] == 'queued')
+    fetching = set()
+    
+    def schedule_fetches():
+        conn = sqlite3.connect(run_db, timeout=30)
+        states = dict(conn.execute("SELECT url, state FROM url_state WHERE state != 'queued' AND "
+                                   "(state != 'fetched' OR content IS NOT NULL)").fetchall())
+        finished = {url for (url,) in conn.execute("SELECT url FROM url_state WHERE state != 'queued'")}
+        conn.close()
+        # Extracted pages count toward the target; fetched ones are in flight until their extract task
+        # succeeds or runs out of attempts
+        given_up = set(queue.finished_urls(run_db, 'extract'))
+        successes = sum(1 for state in states.values() if state != 'fetched')
+        extracting = sum(1 for url, state in states.items() if state == 'fetched' and url not in given_up)
+        fetching.difference_update(finished)
+        # Failed fetches never leave 'queued', stop counting them as in flight once their task is over
+        fetching.difference_update(queue.finished_urls(run_db, 'fetch'))
+        if successes + extracting >= target:
+            cancelled = queue.cancel_pending(run_db, 'fetch')
+            if cancelled:
+                tracer.metrics.inc('fetch_leftovers_cancelled_total', cancelled)
+                # Back to the front of the candidates in case an extraction fails; leased ones that
+                # finish anyway are skipped below
+                candidates.extendleft(sorted(fetching, key=ranks.get, reverse=True))
+            fetching.clear()
+            return
+        tasks = []
+        while candidates and successes + extracting + len(fetching) < target + OVERFETCH:
+            url = candidates.popleft()
+            if url in finished:
+                continue
+            fetching.add(url)
+            tasks.append({'run_db': run_db, 'kind': 'fetch', 'url': url, 'priority': ranks[url], 'payload': payload})
+        if tasks:
+            queue.enqueue_many(tasks)
+    
+    schedule_fetches()
+    
+    stop_event = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=run_worker, args=(queue_path, stop_event, None, trace_dir, threads),
+                                         daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    print(f"\nStarted {workers} worker processes ({threads} tasks each) on {queue_path}")
+    
+    last_summary_id = 0
+    # Fetch tasks cancelled when the deadline hit
+    cut_short = 0
+    
+    def feed_progressive():
+        # Workers write summaries straight to the run database, pick up new rows for the report
+        nonlocal last_summary_id
+        conn = sqlite3.connect(run_db, timeout=30)
+        rows = conn.execute("SELECT id, url, summary, collected_at, source FROM summaries WHERE id > ? ORDER BY id",
+                            (last_summary_id,)).fetchall()
+        conn.close()
+        for row in rows:
+            progressive.add_summary(*row[1:])
+            last_summary_id = row[0]
+    
+    try:
+        while True:
+            if progressive:
+                feed_progressive()
+            if cutoff and cutoff.expired():
+                # No new fetches past the cutoff; leased ones end with their deadline-bound calls
+                cancelled = queue.cancel_pending(run_db, 'fetch')
+                if cancelled:
+                    cut_short += cancelled
+                    tracer.metrics.inc('deadline_cancelled_total', cancelled, stage='fetch')
+            else:
+                schedule_fetches()
+            counts = queue.counts(run_db)
+            remaining = counts.get('pending', 0) + counts.get('leased', 0)
+            print(f"\rTasks: {counts.get('done', 0)} done | {counts.get('leased', 0)} running | "
+                  f"{counts.get('pending', 0)} pending | {counts.get('failed', 0)} failed", end='', flush=True)
+            if remaining == 0:
+                break
+            if not any(process.is_alive() for process in processes):
+                print("\nError: all worker processes exited")
+                break
+            time.sleep(0.5)
+    finally:
+        stop_event.set()
+        for process in processes:
+            process.join()
+        if progressive:
+            feed_progressive()
+    
+    conn = sqlite3.connect(run_db)
+    c = conn.cursor()
+    # Complete once every usable page is stored; failed pages and unneeded candidates do not hold it up
+    c.execute('''UPDATE queries SET stage = 'complete' WHERE NOT EXISTS
+                 (SELECT 1 FROM url_state WHERE state = 'extracted' OR (state = 'fetched' AND content IS NOT NULL))''')
+    conn.commit()
+    c.execute("SELECT COUNT(*) FROM url_state WHERE state != 'queued'")
+    scraped = c.fetchone()[0]
+    c.execute("SELECT COUNT(*) FROM summaries")
+    summarized = c.fetchone()[0]
     conn.close()
     print("\nProcessing complete")
+    if cut_short:
+        print(f"Deadline reached: {cut_short} unclaimed fetches cancelled, pending pages summarized locally")
+    
+    return {
+        'query': user_query,
+        'db_path': run_db,
+        'urls': scraped,
+        'candidates': len(run['url_states']),
+        'scraped': scraped,
+        'summarized': summarized,
+        'cut_short': cut_short,
+        'elapsed': time.time() - start_time
+    }
+
+def query_key(query: str) -> str:
+    return ' '.join(re.findall(r'[a-z0-9]+', query.lower()))
+
+def read_queries(source: str) -> List[str]:
+    """Read one query per line from a file, or stdin when source is '-'"""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source) as f:
+            lines = f.read().splitlines()
+    
+    queries = []
+    seen = set()
+    for line in lines:
+        query = line.strip()
+        # Queries differing only in case or punctuation are the same search (and the same file tag)
+        key = query_key(query) or query
+        if key and not query.startswith('#') and key not in seen:
+            seen.add(key)
+            queries.append(query)
+    return queries
+
+def batch_file_tags(queries: List[str]) -> Dict[str, str]:
+    """A distinct file tag per query; long queries sharing their first 50 characters get a numeric suffix"""
+    tags = {}
+    used = set()
+    for query in queries:
+        base = tag = sanitize_filename(query)
+        suffix = 2
+        # Compared case-insensitively, as the data directory may be on a case-insensitive filesystem
+        while tag.lower() in used:
+            tag = f'{base}_{suffix}'
+            suffix += 1
+        used.add(tag.lower())
+        tags[query] = tag
+    return tags
+
+def run_batch(queries: List[str], config: Dict, args) -> Dict:
+    router = ModelRouter.from_config(config)
+    agent = OpenRouterAgent(config['openrouter']['api_key'], config['openrouter']['model'], router)
+    query_index = build_query_index(config)
+    resources = SharedResources(args.fetch_workers, args.llm_workers, parse_workers=args.parse_workers)
+    batch_budget = TokenBudget(args.batch_token_budget) if args.batch_token_budget else None
+    crawl = build_crawl_settings(config, args)
+    data_dir = 'data'
+    os.makedirs(data_dir, exist_ok=True)
+    # Queries run side by side, so each needs its own database and report file
+    file_tags = batch_file_tags(queries)
+    
+    def run_one(user_query: str) -> Dict:
+        # Each query gets its own deadline, counted from when it starts rather than when the batch did
+        with deadline.run_deadline(args.deadline):
+            # Streamed strategy text from parallel queries would interleave, only the status lines are printed
+            usage = []
+            strategy, _ = prepare_query(user_query, agent, query_index, echo=False, usage=usage)
+            db_path = os.path.join(data_dir, f'{file_tags[user_query]}_data.db')
+            stats = process_query(user_query, agent, db_path, strategy, resources=resources, show_progress=False,
+                                  token_budget=args.token_budget, budget=batch_budget, crawl=crawl,
+                                  report_share=REPORT_SHARE if args.report else 0, target=args.pages,
+                                  prepare_usage=usage)
+            if args.report:
+                report = generate_final_report(stats['db_path'], agent, echo=False)
+                with open(os.path.join(data_dir, f'{file_tags[user_query]}_final_summary.txt'), 'w') as f:
+                    f.write(report)
+                count_report_usage(stats)
+        return stats
+    
+    print(f"\nRunning {len(queries)} queries ({args.parallel_queries} at a time, "
+          f"{args.fetch_workers} fetch / {args.llm_workers} LLM / {args.parse_workers or 'in-thread'} parse "
+          f"workers shared)")
+    start_time = time.time()
+    completed = []
+    failed = 0
+    
+    try:
+        with ThreadPoolExecutor(max_workers=args.parallel_queries) as query_executor:
+            futures = {query_executor.submit(run_one, query): query for query in queries}
+            for future in as_completed(futures):
+                query = futures[future]
+                try:
+                    stats = future.result()
+                    completed.append(stats)
+                    print(f"[OK] {query}: {stats['summarized']}/{stats['urls']} URLs summarized "
+                          f"in {stats['elapsed']:.1f}s, {stats['tokens']} tokens "
+                          f"({len(completed) + failed}/{len(queries)})")
+                except Exception as e:
+                    failed += 1
+                    print(f"[FAILED] {query}: {str(e)} ({len(completed) + failed}/{len(queries)})")
+    finally:
+        resources.close()
+    
+    elapsed = max(time.time() - start_time, 1e-9)
+    totals = {
+        'queries': len(queries),
+        'succeeded': len(completed),
+        'failed': failed,
+        'urls': sum(stats['urls'] for stats in completed),
+        'summarized': sum(stats['summarized'] for stats in completed),
+        'elapsed': elapsed,
+        'queries_per_min': len(completed) / elapsed * 60,
+        'urls_per_sec': sum(stats['urls'] for stats in completed) / elapsed
+    }
+    usage = {key: sum(stats[key] for stats in completed)
+             for key in ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'cost')}
+    modes = {mode: sum(stats['extraction_modes'][mode] for stats in completed) for mode in BudgetScheduler.MODES}
+    tokens = usage['prompt_tokens'] + usage['completion_tokens']
+    rates = throughput(totals['summarized'], tokens, usage['cost'])
+    totals.update(usage, tokens=tokens, extraction_modes=modes, **rates)
+    print(f"\nBatch complete: {totals['succeeded']}/{totals['queries']} queries succeeded, {totals['failed']} failed")
+    print(f"URLs: {totals['urls']} fetched, {totals['summarized']} summarized in {elapsed:.1f}s")
+    print(f"Throughput: {totals['queries_per_min']:.1f} queries/min, {totals['urls_per_sec']:.2f} URLs/sec")
+    print_usage(tokens, usage, rates, modes)
+    return totals
+
+def resume_run(args):
+    db_path = args.resume
+    if not os.path.exists(db_path):
+        db_path = os.path.join('data', f'{sanitize_filename(args.resume)}_data.db')
+    if not os.path.exists(db_path):
+        print(f"Error: No run found for {args.resume}")
+        return
+    
+    try:
+        previous = load_run_state(db_path)
+    except (sqlite3.OperationalError, TypeError):
+        print("Error: Database has no checkpoints to resume from")
+        return
+    user_query = previous['query']
+    print(f"Resuming Project OverWatch run: {user_query}")
+    
+    with open('config.json') as config_file:
+        config = json.load(config_file)
+    agent = OpenRouterAgent(
+        config['openrouter']['api_key'],
+        config['openrouter']['model'],
+        ModelRouter.from_config(config)
+    )
+    
+    # As for a new run, the deadline covers everything up to the finished report
+    with deadline.run_deadline(args.deadline):
+        progressive = None
+        if args.progressive:
+            report_path = os.path.join(os.path.dirname(db_path), f'{sanitize_filename(user_query)}_final_summary.txt')
+            progressive = ProgressiveReport(user_query, previous['strategy'], agent, report_path, args.draft_after)
+    
+        try:
+            if args.workers:
+                process_query_workers(user_query, agent, db_path, workers=args.workers, queue_path=args.queue,
+                                      resume=True, progressive=progressive, trace_dir=args.trace_dir,
+                                      target=args.pages, threads=args.worker_threads)
+            else:
+                process_query(user_query, agent, db_path, progressive=progressive, resume=True,
+                              token_budget=args.token_budget, crawl=build_crawl_settings(config, args),
+                              target=args.pages)
+        except KeyboardInterrupt:
+            print(f"\nInterrupted. Resume with: python url_middle_out.py --resume {args.resume}")
+            return
+        except deadline.DeadlineExceeded:
+            print("\nDeadline passed before any evidence was gathered")
+            return
+    
+        if progressive:
+            progressive.finish()
+            print(f"\nFinal report saved to: {progressive.report_path}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Project OverWatch middle-out processor")
+    parser.add_argument('--progressive', action='store_true',
+                        help="write a draft report while scraping and update it as summaries arrive")
+    parser.add_argument('--draft-after', type=int, default=3,
+                        help="number of summaries to collect before the first draft")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="run every query in FILE (one per line, '-' for stdin) with shared pools")
+    parser.add_argument('--parallel-queries', type=int, default=4,
+                        help="batch mode: queries in flight at once")
+    parser.add_argument('--fetch-workers', type=int, default=16,
+                        help="batch mode: fetch threads shared by all queries")
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1,
+                        help="batch mode: HTML parser processes shared by all queries (0 parses on the fetch threads)")
+    parser.add_argument('--llm-workers', type=int, default=8,
+                        help="batch mode: LLM extraction threads shared by all queries")
+    parser.add_argument('--token-budget', type=int,
+                        help="max extraction tokens per run; lower-ranked pages degrade to cheaper extraction")
+    parser.add_argument('--batch-token-budget', type=int,
+                        help="batch mode: max extraction tokens shared by all queries")
+    parser.add_argument('--pages', type=int, default=TARGET_PAGES,
+                        help="usable pages to gather per query; failed pages are replaced from lower SERP ranks")
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help="end-to-end time limit per query; stragglers are cancelled and the report uses what is in")
+    parser.add_argument('--expand', action='store_true',
+                        help="also follow relevant outbound links from fetched pages (domain policy: config 'crawl')")
+    parser.add_argument('--crawl-depth', type=int, default=1,
+                        help="with --expand: link hops to follow away from the SERP")
+    parser.add_argument('--crawl-pages', type=int, default=10,
+                        help="with --expand: max extra pages per run")
+    parser.add_argument('--crawl-seconds', type=float, default=60.0,
+                        help="with --expand: stop starting new expansion fetches after this long")
+    parser.add_argument('--report', action='store_true',
+                        help="batch mode: also generate the final report for each query")
+    parser.add_argument('--resume', metavar='RUN',
+                        help="resume an interrupted run (its query file tag or database path)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="run fetch/extract/store in N worker processes through the shared work queue")
+    parser.add_argument('--worker-threads', type=int, default=WORKER_THREADS,
+                        help="tasks each worker process runs at once")
+    parser.add_argument('--queue', default='cache/work_queue.db',
+                        help="work queue database shared by worker processes")
+    parser.add_argument('--worker', action='store_true',
+                        help="only run a worker that serves the work queue (e.g. on another machine)")
+    parser.add_argument('--trace', action='store_true',
+                        help="write per-stage spans (Chrome trace JSON) and Prometheus metrics to data/")
+    parser.add_argument('--profile', action='store_true',
+                        help="capture cProfile and tracemalloc data for the run into data/")
+    args = parser.parse_args()
+    args.trace_dir = 'data' if args.trace else None
+    
+    try:
+        if args.profile:
+            with Profiler('data'):
+                run(args)
+        else:
+            run(args)
+    finally:
+        if args.trace:
+            write_trace('data')
+            print_stage_summary()
+
+def print_stage_summary():
+    summary = tracer.stage_summary()
+    if not summary:
+        return
+    print("\nStage timings (trace: data/trace.json, metrics: data/trace.prom):")
+    for stage in summary:
+        print(f"  {stage['stage']:<10} {stage['count']:>5} spans | total {stage['total']:8.2f}s | "
+              f"p50 {stage['p50']:6.2f}s | p99 {stage['p99']:6.2f}s")
+
+def run(args):
+    if args.worker:
+        print(f"Worker serving {args.queue} (Ctrl-C to stop)")
+        try:
+            run_worker(args.queue, trace_dir=args.trace_dir, threads=args.worker_threads)
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    if args.workers and not args.batch:
+        ignored = [flag for flag, value in (('--token-budget', args.token_budget), ('--expand', args.expand)) if value]
+        if ignored:
+            # Worker processes extract every page in full and only fetch the SERP's results
+            print(f"Warning: {' and '.join(ignored)} not supported with --workers, ignoring")
+    
+    if args.resume:
+        resume_run(args)
+        return
+    
+    if args.batch:
+        with open('config.json') as config_file:
+            config = json.load(config_file)
+        queries = read_queries(args.batch)
+        if not queries:
+            print("Error: No queries found")
+            return
+        run_batch(queries, config, args)
+        return
+    
     print("Starting Project OverWatch")
     
     # Clear existing data
@@ -279,26 +1491,57 @@ def main():
         print("Error: No query entered")
         return
     
+    # The deadline covers everything from here to the finished report
+    with deadline.run_deadline(args.deadline):
+        run_single(user_query, args, data_dir)
+
+def run_single(user_query: str, args, data_dir: str):
     # Initialize agents
     with open('config.json') as config_file:
         config = json.load(config_file)
     
+    # Route each call role to its configured models
+    router = ModelRouter.from_config(config)
+    
     # Create OpenRouter agent for summarization
     openrouter_agent = OpenRouterAgent(
             config['openrouter']['api_key'],
-            config['openrouter']['model']
+            config['openrouter']['model'],
+            router
     )
     
-    # Determine domain expert without extra printing
-    intent_filter = IntentFilterAgent(
-        config['openrouter']['api_key'],
-        config['openrouter']['model']
-    )
-    domain_expert = intent_filter.determine_domain(user_query)
+    usage = []
+    strategy, domain_expert = prepare_query(user_query, openrouter_agent, build_query_index(config), usage=usage)
     print(f"\nDomain Expert: {domain_expert.strip()}")  # Strip any extra newlines
     
+    progressive = None
+    if args.progressive:
+        report_path = os.path.join(data_dir, f'{sanitize_filename(user_query)}_final_summary.txt')
+        progressive = ProgressiveReport(user_query, strategy, openrouter_agent, report_path, args.draft_after)
+        print(f"\nProgressive report: {report_path}")
+    
     # Process query with OpenRouter agent
-    process_query(user_query, openrouter_agent, os.path.join(data_dir, f'{sanitize_filename(user_query)}_data.db'))
+    try:
+        db_path = os.path.join(data_dir, f'{sanitize_filename(user_query)}_data.db')
+        if args.workers:
+            process_query_workers(user_query, openrouter_agent, db_path, strategy, args.workers, args.queue,
+                                  progressive=progressive, trace_dir=args.trace_dir, target=args.pages,
+                                  threads=args.worker_threads, prepare_usage=usage)
+        else:
+            process_query(user_query, openrouter_agent, db_path, strategy, progressive,
+                          token_budget=args.token_budget, crawl=build_crawl_settings(config, args),
+                          target=args.pages, prepare_usage=usage)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. Resume with: python url_middle_out.py --resume {sanitize_filename(user_query)}")
+        return
+    except deadline.DeadlineExceeded:
+        # Preparation used up the time: the SERP request is the one stage with nothing partial to settle for
+        print("\nDeadline passed before any evidence was gathered")
+        return
+    
+    if progressive:
+        progressive.finish()
+        print(f"\nFinal report saved to: {progressive.report_path}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()